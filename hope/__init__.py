@@ -14,7 +14,7 @@
 from __future__ import print_function, division, absolute_import, unicode_literals
 
 
-__all__ = ["jit", "config", "serialize", "unserialize"]
+__all__ = ["jit", "config", "serialize", "unserialize", "cache_info", "cache_clear", "warmup"]
 __author__ = "Lukas Gamper, Joel Akeret"
 __email__ = "hope@phys.ethz.ch"
 __version__ = "0.6.1"
@@ -23,9 +23,13 @@ __credits__ = "ETH Zurich, Institute for Astronomy"
 from hope import config
 from hope.jit import jit
 from hope.serialization import serialize, unserialize
+from hope.cache import cache_info, cache_clear
+from hope.aot import warmup
 from hope.options import enableUnsaveMath, disableUnsaveMath
 
 from hope.exp import exp
+from hope.prange import prange
+from hope.stream import stream
 
 # save hope version in compiled files
 config.version = __version__
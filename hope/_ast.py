@@ -45,9 +45,15 @@ class NewVariable(Token):
 
 
 class Variable(Token):
+    # strided arrays are passed without copy and indexed by the element strides t<name>
+    strided = False
+
     def __init__(self, name, shape, dtype = None, scope = "block", allocated = False):
         self.name, self.shape, self.dtype, self.scope, self.allocated = name, shape, dtype, scope, allocated
 
+    def getId(self):
+        return "{0}{1}".format(super(Variable, self).getId(), "s" if self.strided else "")
+
     def __eq__(self, other):
         return isinstance(other, Variable) and self.name == other.name and self.dtype == other.dtype and self.shape == other.shape and self.scope == other.scope
 
@@ -226,8 +232,8 @@ class If(Token):
 
 
 class For(Token):
-    def __init__(self, iter, lower, upper, body):
-        self.iter, self.dtype, self.shape, self.lower, self.upper, self.body = iter, None, [], lower, upper, body
+    def __init__(self, iter, lower, upper, body, parallel=False):
+        self.iter, self.dtype, self.shape, self.lower, self.upper, self.body, self.parallel = iter, None, [], lower, upper, body, parallel
 
     def __eq__(self, other):
         return isinstance(other, For) and self.iter == other.iter and self.lower == other.lower and self.upper == other.upper and self.body == other.body
@@ -378,7 +384,7 @@ class FunctionDef(Token):
 
 class Module(Token):
     def __init__(self, main):
-        self.main, self.functions = main, {}
+        self.main, self.functions, self.nogil, self.openmp = main, {}, False, False
 
 
 class NodeVisitor(object):
@@ -1,3 +1,44 @@
 # Copyright (c) 2014 ETH Zurich, Institute of Astronomy, Lukas Gamper <lukas.gamper@usystems.ch>
 
 # cache for compiled functions
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import json
+import binascii
+import weakref
+
+# the python callbacks of the jitted functions by the name they are pickled with, see _reference
+_callbacks = weakref.WeakValueDictionary()
+
+def _reference(fkt, nogil, callback):
+    """
+    Registers the python callback of a jitted function under the name it is pickled with. The name refers to the
+    module, the qualified name and the ``nogil`` argument of the python function, so another process can resolve
+    it, see :py:func:`_resolve`.
+
+    :param fkt: the python function
+    :param nogil: the ``nogil`` argument passed to :py:func:`hope.jit`
+    :param callback: the python callback returned by :py:func:`hope.jit`
+
+    :return name: the name of the callback in this module
+    """
+    reference = json.dumps([fkt.__module__, getattr(fkt, "__qualname__", fkt.__name__), nogil]).encode("utf-8")
+    name = "jitted_{0}_{1}".format(binascii.hexlify(reference).decode("ascii"), id(callback))
+    _callbacks[name] = callback
+    return name
+
+def _resolve(name):
+    """
+    Resolves the name of a pickled python callback. If the callback does not exist in this process, the jitted
+    function is looked up by the reference to the python function, see :py:func:`hope.jit._load`.
+
+    :param name: the name of the callback, see :py:func:`_reference`
+
+    :return fkt: the jitted function
+    """
+    if name in _callbacks:
+        return _callbacks[name]
+    from hope.jit import _load
+    modulename, qualname, nogil = json.loads(binascii.unhexlify(name.split("_")[1].encode("ascii")).decode("utf-8"))
+    return _load(modulename, qualname, nogil)
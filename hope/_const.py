@@ -124,6 +124,9 @@ BINARY_OPERATORS["RShift"] = (">>", lambda a, b: type(a(1) >> b(1)) )
 BINARY_OPERATORS["BitOr"] = ("|", lambda a, b: type(a(1) | b(1)) )
 BINARY_OPERATORS["BitXor"] = ("^", lambda a, b: type(a(1) ^ b(1)) )
 BINARY_OPERATORS["BitAnd"] = ("&", lambda a, b: type(a(1) & b(1)) )
+# the builtin functions min and max of two scalars
+BINARY_OPERATORS["Min"] = ("min", lambda a, b: type(a(1) + b(1)) )
+BINARY_OPERATORS["Max"] = ("max", lambda a, b: type(a(1) + b(1)) )
 
 BOOL_OPERATORS = {}
 BOOL_OPERATORS["And"] = "&&"
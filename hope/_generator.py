@@ -4,9 +4,9 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 
 
 import sys
-import pickle
 
 from hope import config
+from hope.exceptions import UnsupportedFeatureException
 from hope._ast import *
 from hope._const import *
 from hope._library import *
@@ -20,6 +20,23 @@ class CPPGenerator(NodeVisitor):
 
     def __init__(self):
         self.next_loopid, self.merged, self.slicemap, self.library, self.dumper  = 0, None, {}, {}, Dumper()
+        self.nogil, self.openmp, self.module = False, False, None
+
+    def with_gil(self, code, expr=False):
+        """
+        Wraps code calling into the python c api, so the GIL is reacquired if the module runs without the GIL.
+
+        :param code: the c code to wrap
+        :param expr: if set, code is an expression and the wrapped code returns its value
+
+        :return code: the wrapped code
+        """
+        if not self.nogil:
+            return code
+        elif expr:
+            return "native_gil([&]() {{ return {0}; }})".format(code)
+        else:
+            return "native_gil([&]() {{ {0} }});".format(code)
 
     def getVariableExtent(self, node):
         extent = ""
@@ -29,11 +46,93 @@ class CPPGenerator(NodeVisitor):
                 raise Exception("Variable slices needs to start with None: {0}".format(node.name))
             if not segmentstr in self.merged:
                 raise Exception("Unknown slice {0} in variable {1}".format(segmentstr, node.name))
-            if ind > 0:
-                extent = "({0})*{1}".format(extent, self.visit(segment[1]))
-            extent += "{0}{1}".format(" + " if len(extent) > 0 else "", self.slicemap[self.get_slicemap_key(ind, *segment)])
+            if isinstance(node, Variable) and node.strided:
+                extent += "{0}{1}*t{2}[{3}]".format(" + " if len(extent) > 0 else "", self.slicemap[self.get_slicemap_key(ind, *segment)], node.name, ind)
+            else:
+                if ind > 0:
+                    extent = "({0})*{1}".format(extent, self.visit(segment[1]))
+                extent += "{0}{1}".format(" + " if len(extent) > 0 else "", self.slicemap[self.get_slicemap_key(ind, *segment)])
         return extent
 
+    def omp_parallel_for(self, shape=None, reductions=[]):
+        """
+        Returns the OpenMP pragma to parallelize the following loop. Loops over the shape of an array are only
+        parallelized if ``hope.config.parallel`` is set and only run in parallel if the number of elements exceeds
+        ``hope.config.parallelthreshold``, which is read from the runtime module when the loop is run. Since exceptions must not leave a parallel region, no pragma is emitted
+        if ``hope.config.rangecheck`` is set.
+
+        :param shape: the shape the nested loops iterate over, None for a ``hope.prange`` loop
+        :param reductions: list of (operator, variable) tuples to reduce over all threads
+
+        :return pragma: the pragma line or an empty string
+        """
+        if config.rangecheck or (not shape is None and not config.parallel):
+            return ""
+        self.openmp = True
+        pragma = "#pragma omp parallel for"
+        for op, variable in reductions:
+            pragma += " reduction({0}:{1})".format(op, variable)
+        if not shape is None:
+            size = " * ".join(["({0} - {1})".format(self.visit(upper), 0 if lower is None else self.visit(lower)) for lower, upper in shape])
+            pragma += " if({0} > native_runtime->parallelthreshold)".format(size)
+        return pragma + "\n"
+
+    def get_reductions(self, node):
+        """
+        Collects the scalars declared outside a ``hope.prange`` loop and updated inside it. Only updates
+        which can be reduced over all threads are supported: ``+=``, ``*=``, ``x = min(x, ...)`` and
+        ``x = max(x, ...)``. Needs to be called before the body of the loop is visited. Since the threads of
+        the loop do not hold the GIL, the loop and the functions it calls must not allocate arrays or reference
+        array attributes.
+
+        :param node: the parallel :py:class:`hope._ast.For` token
+
+        :return reductions: list of (operator, variable) tuples
+        """
+        reductions, private = [], []
+
+        def collect(token):
+            if isinstance(token, Body):
+                for block in token.blocks:
+                    collect(block)
+            elif isinstance(token, Block):
+                for expr in token.body:
+                    collect(expr)
+            elif isinstance(token, If):
+                collect(token.body)
+                if not token.orelse is None:
+                    collect(token.orelse)
+            elif isinstance(token, (For, While)):
+                collect(token.body)
+            elif isinstance(token, Return):
+                raise UnsupportedFeatureException("Returning from a hope.prange loop is not supported")
+            elif isinstance(token, Allocate):
+                private.append(token.variable.name)
+            elif isinstance(token, (Assign, AugAssign, NumpyContraction)):
+                target = token.variable if isinstance(token, NumpyContraction) else token.target
+                if isinstance(target, ObjectAttr) and len(target.shape) == 0:
+                    raise UnsupportedFeatureException("The member {0} cannot be updated in a hope.prange loop".format(self.dumper.visit(target)))
+                elif not isinstance(target, Variable) or len(target.shape) > 0 or not target.allocated or target.name in private:
+                    return
+                elif isinstance(token, AugAssign) and token.op in ["+=", "*="]:
+                    op = token.op[0]
+                elif isinstance(token, Assign) and isinstance(token.value, BinOp) and token.value.op in ["min", "max"] \
+                        and target in [token.value.left, token.value.right]:
+                    op = token.value.op
+                else:
+                    raise UnsupportedFeatureException("The variable {0} declared outside a hope.prange loop can only be updated by a reduction".format(target.name))
+                if target.name in [variable.name for other, variable in reductions if other != op]:
+                    raise UnsupportedFeatureException("The variable {0} is reduced by different operators in a hope.prange loop".format(target.name))
+                if not (op, target) in reductions:
+                    reductions.append((op, target))
+
+        collect(node.body)
+        for token in [node.body] + [called.body for called in _get_called(self.module, node)[1:]]:
+            name = _find_python_api(token)
+            if not name is None:
+                raise UnsupportedFeatureException("The array {0} cannot be allocated or referenced in a hope.prange loop, move it before the loop".format(name))
+        return [(op, self.visit(variable)) for op, variable in reductions]
+
     def visit_Number(self, node):
         if node.dtype is bool:
             return "true" if node.value else "false"
@@ -74,8 +173,9 @@ class CPPGenerator(NodeVisitor):
     def visit_View(self, node):
         subscript = ""
         extent_ind = 0
+        strided = isinstance(node.variable, Variable) and node.variable.strided
         for ind, (extent, segment) in enumerate(zip(node.extents, node.variable.shape)):
-            if ind > 0:
+            if ind > 0 and not strided:
                 subscript = "(int)({0})*{1}".format(subscript, self.visit(segment[1]))
             subscript += " + " if len(subscript) > 0 else ""
             if isinstance(extent, tuple):
@@ -95,10 +195,11 @@ class CPPGenerator(NodeVisitor):
                     seg = "{0}+{1}".format(self.visit_Dimension(segment[1]), seg)
                 segstr = self.dumper.visit(extent)
             if config.rangecheck:
-                subscript += "native_rangecheck({0}".format(seg)
-                subscript += ", {0}, {1}".format(self.visit(segment[0]) if not segment[0] is None else "0", self.visit(segment[1]))
-                subscript += ", std::string(\"{0}\"), std::string(\"{1}\"))".format(segstr, node.variable.name)
+                seg = "native_rangecheck({0}, {1}, {2}, std::string(\"{3}\"), std::string(\"{4}\"))".format(seg \
+                    , self.visit(segment[0]) if not segment[0] is None else "0", self.visit(segment[1]), segstr, node.variable.name)
                 self.library["native_rangecheck"] = LIBRARY_NATIVE_RANGECHECK
+            if strided:
+                subscript += "({0})*t{1}[{2}]".format(seg, node.variable.name, ind)
             else:
                 subscript += seg
         shape = node.variable.shape
@@ -116,6 +217,8 @@ class CPPGenerator(NodeVisitor):
             raise Exception("Only the numpy.sum contraction is implemented!")
         if len(node.value.shape):
             ret = "{0} = ({1})0;\n".format(self.visit(node.variable), PY_C_TYPE[node.dtype])
+            if isinstance(node.variable, Variable):
+                ret += self.omp_parallel_for(node.value.shape, [("+", self.visit(node.variable))])
             keys = []
             for ind, segment in enumerate(node.value.shape):
                 ret += "{0}for (npy_intp i{1} = 0; i{1} < {2} - {3}; ++i{1}) {{\n".format( \
@@ -154,7 +257,7 @@ class CPPGenerator(NodeVisitor):
         if len(target.shape) == 0: # [int] x = self.y
             return "{0} c{1} = c{2};".format(PY_C_TYPE[target.dtype], target.name, ".c".join(trace))
         else: # [array] x = self.y
-            return "PyObject * p{0} = (PyObject *)PyArray_GETCONTIGUOUS((PyArrayObject *)c{1});\n".format(target.name, ".p".join(trace)) \
+            return "PyObject * p{0} = {1};\n".format(target.name, self.with_gil("(PyObject *)PyArray_GETCONTIGUOUS((PyArrayObject *)c{0})".format(".p".join(trace)), True)) \
                 +  "npy_intp * s{0} = c{1};\n".format(target.name, ".s".join(trace)) \
                 +  "{0} * c{1} = c{2};".format(PY_C_TYPE[target.dtype], target.name, ".c".join(trace))
 
@@ -186,6 +289,8 @@ class CPPGenerator(NodeVisitor):
             return "{0}std::floor({1} / {2})".format(cast, self.visit(node.left), self.visit(node.right))
         elif node.op == "//":
             return "{0}({1} / {2})".format(cast, self.visit(node.left), self.visit(node.right))
+        elif node.op in ["min", "max"]:
+            return "std::{0}<{1}>({2}, {3})".format(node.op, PY_C_TYPE[node.dtype], self.visit(node.left), self.visit(node.right))
         else:
             left = self.visit(node.left) if node.dtype == node.left else "{0}{1}".format(cast, self.visit(node.left))
             right = self.visit(node.right) if node.dtype == node.right else "{0}{1}".format(cast, self.visit(node.right))
@@ -210,7 +315,8 @@ class CPPGenerator(NodeVisitor):
         return ret
 
     def visit_For(self, node):
-        ret = "for (npy_intp {0} = {1}; {0} < {2}; ++{0}) {{\n\t".format(self.visit(node.iter), self.visit(node.lower), self.visit(node.upper))
+        ret = self.omp_parallel_for(reductions=self.get_reductions(node)) if node.parallel else ""
+        ret += "for (npy_intp {0} = {1}; {0} < {2}; ++{0}) {{\n\t".format(self.visit(node.iter), self.visit(node.lower), self.visit(node.upper))
         ret += "\n\t".join(self.visit(node.body).split("\n"))
         ret += "\n}"
         return ret
@@ -231,7 +337,7 @@ class CPPGenerator(NodeVisitor):
                 elif isinstance(arg, Object):
                     args.append("c{0}".format(arg.name))
                 elif len(arg.shape) > 0:
-                    args.append("p{0}, s{0}, c{0}".format(arg.name))
+                    args.append("p{0}, s{0}, c{0}{1}".format(arg.name, ", t{0}".format(arg.name) if arg.strided else ""))
                 else:
                     args.append(self.visit(arg))
             return "{0}_{1}({2})".format( \
@@ -247,7 +353,7 @@ class CPPGenerator(NodeVisitor):
         elif isinstance(node.name, NumpyAttr) and node.name.name == "interp":
             self.library["numpy_interp"] = LIBRARY_NUMPY_INTERP
 
-            args = [[] for _ in range(3)]
+            args, strides = [[] for _ in range(3)], [[] for _ in range(3)]
             for i in range(1, 3):
                 if isinstance(node.args[i], ObjectAttr):
                     parent, trace = node.args[i].parent, [node.args[i].name]
@@ -257,15 +363,16 @@ class CPPGenerator(NodeVisitor):
                     args[i] = ".c".join(trace)
                 else:
                     args[i] = node.args[i].name
+                strides[i] = "t{0}[0]".format(node.args[i].name) if isinstance(node.args[i], Variable) and node.args[i].strided else "1"
                     
             # TODO: make sure node.args[1].shape == node.args[2].shape using an assert
             
             ((lower, upper),) = node.args[1].shape
             left_val = "c{0}[0]".format(node.args[1].name) if lower is None else self.visit(lower)
             size = self.visit(upper) + ("" if lower is None else "-{0}".format(self.visit(lower)))
-            right_val = "c{0}[{1}]".format(node.args[1].name, size + "-1")
+            right_val = "c{0}[({1})*{2}]".format(node.args[1].name, size + "-1", strides[1])
 
-            ret = "numpy_interp({0}, c{1}, c{2}, {3})".format(self.visit(node.args[0]), args[1], args[2], size)
+            ret = "numpy_interp({0}, c{1}, {2}, c{3}, {4}, {5})".format(self.visit(node.args[0]), args[1], strides[1], args[2], strides[2], size)
             
             if "left" in node.keywords:
                 left_ret = self.visit(node.keywords["left"])
@@ -277,7 +384,7 @@ class CPPGenerator(NodeVisitor):
             if "right" in node.keywords:
                 right_ret = self.visit(node.keywords["right"])
             else:
-                right_ret = "c{0}[{1}]".format(args[2], size + "-1")
+                right_ret = "c{0}[({1})*{2}]".format(args[2], size + "-1", strides[2])
                 
             ret = "{0} > {1} ? {2} : ({3})".format(self.visit(node.args[0]), right_val, right_ret, ret)
                 
@@ -302,7 +409,7 @@ class CPPGenerator(NodeVisitor):
             return "{0} c{1} = {0}();".format(PY_C_TYPE[variable.dtype], variable.name)
         else:
             return "npy_intp d{0}[] = {{(npy_intp){1}}};\n".format(variable.name, ", (npy_intp)".join(shape)) \
-                +  "PyObject * p{0} = PyArray_EMPTY({1}, d{0}, {2}, 0);\n".format(variable.name, len(shape), NPY_TYPEENUM[variable.dtype]) \
+                +  "PyObject * p{0} = {1};\n".format(variable.name, self.with_gil("PyArray_EMPTY({0}, d{1}, {2}, 0)".format(len(shape), variable.name, NPY_TYPEENUM[variable.dtype]), True)) \
                 +  "npy_intp * s{0} = PyArray_SHAPE((PyArrayObject *)p{0});\n".format(variable.name) \
                 +  "{0} * c{1} = ({0} *)PyArray_DATA((PyArrayObject *)p{1});".format(PY_C_TYPE[variable.dtype], variable.name)
 
@@ -317,7 +424,7 @@ class CPPGenerator(NodeVisitor):
 
     def visit_Block(self, node):
         if len(node.shape):
-            ret = "";
+            ret = self.omp_parallel_for(node.shape)
             keys = []
             for ind, segment in enumerate(node.shape):
                 ret += "{0}for (npy_intp i{1} = 0; i{1} < {2} - {3}; ++i{1}) {{\n".format(
@@ -368,16 +475,20 @@ class CPPGenerator(NodeVisitor):
                     # TODO: this fails if variable is defined in loop, maybe it makes sense to visit lower and upper und check if we can check ...
                     elif config.rangecheck:
                         code += "\n\tif ({0} - {1} != 0) {{".format(firstSegment, shape)
-                        code += "\n\t\tPyErr_SetString(PyExc_ValueError, \"Shapes {0} and {1} do not match!\");".format(firstSegment, shape)
+                        code += "\n\t\t" + self.with_gil("PyErr_SetString(PyExc_ValueError, \"Shapes {0} and {1} do not match!\");".format(firstSegment, shape))
                         code += "\n\t\tthrow std::exception();"
                         code += "\n\t}"
         code += "\n\t" + "\n\t".join(self.visit(node.body).split("\n"))
         if not node.dtype is None:
-            code += "\n\tPyErr_SetString(PyExc_ValueError, \"No return type passed!\");"
+            code += "\n\t" + self.with_gil("PyErr_SetString(PyExc_ValueError, \"No return type passed!\");")
             code += "\n\tthrow std::exception();"
         return code
 
     def visit_Module(self, node):
+        self.module = node
+        if node.nogil:
+            self.nogil = True
+            self.library["native_gil"] = LIBRARY_NATIVE_GIL
         for fktname, fktlist in list(node.functions.items()):
             for fkt in fktlist:
                 fkt.decl, sig = "inline ", []
@@ -392,7 +503,8 @@ class CPPGenerator(NodeVisitor):
                     if isinstance(arg, Object):
                         sig.append("{0} & c{1}\n".format(arg.getId("t"), arg.name))
                     elif len(arg.shape) > 0:
-                        sig.append("PyObject * p{1}, npy_intp const * __restrict__ s{1}, {0} * __restrict__ c{1}\n".format(PY_C_TYPE[arg.dtype], arg.name))
+                        sig.append("PyObject * p{1}, npy_intp const * __restrict__ s{1}, {0} * __restrict__ c{1}{2}\n".format(PY_C_TYPE[arg.dtype], arg.name \
+                            , ", npy_intp const * __restrict__ t{0}".format(arg.name) if arg.strided else ""))
                     else:
                         sig.append("{0} c{1}\n".format(PY_C_TYPE[arg.dtype], arg.name))
                 fkt.decl += "\t, ".join(sig) + ")"
@@ -413,16 +525,28 @@ class CPPGenerator(NodeVisitor):
         segmentstr = self.get_segmentstr(lower, upper)
         return "i{0}>{1}".format(ind, self.merged[segmentstr])
 
-def generate(modtoken, localfilename):
+def generate(modtoken, localfilename, runtime, fkt=None):
     """
-    Generates the C code from the given :py:class:`hope._ast.Module` token
+    Generates the C code of the module of a specialization of the main function of the given
+    :py:class:`hope._ast.Module` token. Only the functions called by the specialization are included.
     
     :param modtoken: Module to use
     :param localfilename: name of the function incl. signature
+    :param runtime: name of the runtime module the module imports its helpers from
+    :param fkt: (optional) the specialization of the main function, defaults to the last one
     
     :return code: the generated C code
     """
 
+    if fkt is None:
+        fkt = modtoken.functions[modtoken.main][-1]
+    fkts = _get_called(modtoken, fkt)
+    spectoken = Module(modtoken.main)
+    spectoken.nogil = modtoken.nogil
+    for name, fktlist in list(modtoken.functions.items()):
+        if any([called in fktlist for called in fkts]):
+            spectoken.functions[name] = [called for called in fktlist if called in fkts]
+
     objects = []
     def findObjects(obj):
         if obj.getId() not in [arg.getId() for arg in objects]:
@@ -431,45 +555,130 @@ def generate(modtoken, localfilename):
             if isinstance(variable, Object):
                 findObjects(variable)
 
-    for fktlist in list(modtoken.functions.values()):
-        for fkt in fktlist:
-            for arg in fkt.signature:
+    for fktlist in list(spectoken.functions.values()):
+        for called in fktlist:
+            for arg in called.signature:
                 if isinstance(arg, Object):
                     findObjects(arg)
 
-    code  = LIBRARY_IMPORTS
-    code += LIBRARY_PYOBJ_DEF
+    code  = generate_preamble()
     
     code += _obj_init_code(objects)
     
     generator = CPPGenerator()
-    code += generator.visit(copy.deepcopy(modtoken))
-
-    code += LIBRARY_SIGHANDLER
+    code += generator.visit(copy.deepcopy(spectoken))
+    modtoken.openmp = generator.openmp
 
     code += "\n"
     code += "extern \"C\" {\n"
     
-    code += LIBRARY_CREATE_SIGNATURE
-
-    code += _run_fkt_code(modtoken)
+    code += _specialization_code(modtoken, fkt)
     
     code += "\t}\n"
     #end of extern block
 
     if sys.version_info[0] == 2:
-        code += LIBRARY_METHODS_DECL_PY2.format(fktname=modtoken.main)
-        code += LIBRARY_INIT_DECL_PY2.format(filename=localfilename, fktname=modtoken.main)
-        
+        code += LIBRARY_SPECIALIZATION_METHODS_DECL_PY2.format(fktname=modtoken.main)
+        code += LIBRARY_SPECIALIZATION_INIT_DECL_PY2.format(filename=localfilename, fktname=modtoken.main, runtime=runtime)
+
     else:
-        code += LIBRARY_METHODS_DECL_PY3.format(fktname=modtoken.main)
-        code += LIBRARY_MODULE_DECL_PY3.format(fktname=modtoken.main)
-        code += LIBRARY_INIT_DECL_PY3.format(filename=localfilename, fktname=modtoken.main)
+        code += LIBRARY_SPECIALIZATION_MODULE_DECL_PY3.format(fktname=modtoken.main)
+        code += LIBRARY_SPECIALIZATION_INIT_DECL_PY3.format(filename=localfilename, fktname=modtoken.main, runtime=runtime)
 
     code += "}\n"
 
     return code
 
+def generate_runtime(localfilename):
+    """
+    Generates the C code of the runtime module. The runtime contains the helpers shared by all modules and
+    dispatches the calls of jitted functions to the modules of their specializations. The code does not depend
+    on the jitted functions, so the module is shared by all of them.
+
+    :param localfilename: name of the module
+
+    :return code: the generated C code
+    """
+    code  = generate_preamble()
+    code += LIBRARY_SIGHANDLER
+    code += LIBRARY_HOPE_EXP_DATA
+    code += LIBRARY_DISPATCH
+
+    if sys.version_info[0] == 2:
+        code += LIBRARY_RUNTIME_INIT_DECL_PY2.format(filename=localfilename)
+    else:
+        code += LIBRARY_RUNTIME_MODULE_DECL_PY3.format(filename=localfilename)
+        code += LIBRARY_RUNTIME_INIT_DECL_PY3.format(filename=localfilename)
+
+    code += "}\n"
+
+    return code
+
+def generate_preamble():
+    """
+    Generates the C code all generated modules start with. The code does not depend on the module, so it
+    can be replaced by a precompiled header.
+
+    :return code: the generated C code
+    """
+    return LIBRARY_IMPORTS + LIBRARY_RUNTIME_API + LIBRARY_PYOBJ_DEF + LIBRARY_NATIVE_SIGNATURE_KEY
+
+def _get_called(modtoken, fkt):
+    """
+    Collects the functions of the module called by the given function, directly or indirectly.
+
+    :param modtoken: the :py:class:`hope._ast.Module` token
+    :param fkt: the :py:class:`hope._ast.FunctionDef` token
+
+    :return fkts: list of the called functions incl. the given function
+    """
+    fkts, stack, visited = [fkt], [fkt], set()
+    while len(stack):
+        token = stack.pop()
+        if id(token) in visited:
+            continue
+        visited.add(id(token))
+        if isinstance(token, Call) and isinstance(token.name, GlobalFunction):
+            argid = "".join([arg.getId() for arg in token.args])
+            for called in modtoken.functions.get(token.name.name, []):
+                if called.getId() == argid and not any([called is other for other in fkts]):
+                    fkts.append(called)
+                    stack.append(called)
+        if isinstance(token, (list, tuple)):
+            stack.extend(token)
+        elif isinstance(token, dict):
+            stack.extend(list(token.values()))
+        elif isinstance(token, Token):
+            stack.extend(list(vars(token).values()))
+    return fkts
+
+def _find_python_api(token):
+    """
+    Searches the token for code calling into the python c api, i.e. the allocation of an array or the reference
+    to an array attribute of an object.
+
+    :param token: the :py:class:`hope._ast.Token` to search
+
+    :return name: the name of the array or None
+    """
+    stack, visited = [token], set()
+    while len(stack):
+        token = stack.pop()
+        if id(token) in visited:
+            continue
+        visited.add(id(token))
+        if isinstance(token, Allocate) and len(token.variable.shape) > 0:
+            return token.variable.name
+        elif isinstance(token, Reference) and not isinstance(token.target, ObjectAttr) and len(token.target.shape) > 0:
+            return token.target.name
+        if isinstance(token, (list, tuple)):
+            stack.extend(token)
+        elif isinstance(token, dict):
+            stack.extend(list(token.values()))
+        elif isinstance(token, Token):
+            stack.extend(list(vars(token).values()))
+    return None
+
 def _obj_init_code(objects):
     code = ""
     for obj in objects:
@@ -489,7 +698,7 @@ def _obj_init_code(objects):
                 if isinstance(variable, Object):
                     code += "and c{0}.initialize(p{0})".format(name)
                 elif len(variable.shape) > 0:
-                    code += "and PyArray_CheckExact(p{0})".format(name)
+                    code += "and PyArray_Check(p{0})".format(name)
                     code += "\n\t\t\tand PyArray_TYPE((PyArrayObject *)p{0}) == {1} and PyArray_NDIM((PyArrayObject *)p{0}) == {2}".format(name, NPY_TYPEENUM[variable.dtype], len(variable.shape))
                 elif variable.dtype is int:
                     if sys.version_info[0] == 2:
@@ -538,144 +747,144 @@ def _obj_init_code(objects):
 
     return code
 
-def _run_fkt_code(modtoken):
-    code = ""
-    code += "\tPyObject * run(PyObject * self, PyObject * args) {\n"
+def _type_key(arg):
+    """
+    Computes the type key of an argument of a signature. Needs to be in sync with ``native_type_key``
+    in :py:data:`hope._library.LIBRARY_NATIVE_SIGNATURE_KEY`
+    """
+    if isinstance(arg, Object):
+        return 0
+    elif len(arg.shape) > 0:
+        return ((np.dtype(arg.dtype).num << 8 | len(arg.shape)) << 1 | int(arg.strided)) << 3 | 1
+    elif arg.dtype is int:
+        return 3
+    elif arg.dtype is float:
+        return 4
+    else:
+        return np.dtype(arg.dtype).num << 3 | 2
 
-    for fkt in modtoken.functions[modtoken.main]:
-        code += "\t\t{"
-        for arg in fkt.signature:
+def _signature_key(signature):
+    """
+    Computes the key used to dispatch a call to the specialization of a signature. Needs to be in sync
+    with ``native_signature_key`` in :py:data:`hope._library.LIBRARY_NATIVE_SIGNATURE_KEY`
+    """
+    key = len(signature)
+    for arg in signature:
+        key = (key * 1000003 ^ _type_key(arg)) & 0xFFFFFFFFFFFFFFFF
+    return key
+
+def _specialization_code(modtoken, fkt):
+    code  = "\tPyObject * specialization(PyObject * const * argv, Py_ssize_t nargs) {\n"
+    code += "\t\t{"
+    for arg in fkt.signature:
+        if isinstance(arg, Object):
+            code += "\n\t\t\tPyObject * p{0};".format(arg.name)
+            code += "\n\t\t\t{0} c{1};".format(arg.getId("t"), arg.name)
+        elif len(arg.shape) > 0:
+            code += "\n\t\t\tPyObj p{0};".format(arg.name)
+        else:
+            code += "\n\t\t\tPyObject * p{0};".format(arg.name)
+            code += " {0} c{1};".format(PY_C_TYPE[arg.dtype], arg.name)
+    if len(fkt.signature) > 0:
+        code += "\n\t\t\tif ("
+        code += "\n\t\t\t\tnargs == {0}".format(len(fkt.signature))
+        for idx, arg in enumerate(fkt.signature):
+            code += "\n\t\t\t\tand (p{0} = argv[{1}]) ".format(arg.name, idx)
             if isinstance(arg, Object):
-                code += "\n\t\t\tPyObject * p{0};".format(arg.name)
-                code += "\n\t\t\t{0} c{1};".format(arg.getId("t"), arg.name)
+                code += "and c{0}.initialize(p{0})".format(arg.name)
             elif len(arg.shape) > 0:
-                code += "\n\t\t\tPyObj p{0};".format(arg.name)
-            else:
-                code += "\n\t\t\tPyObject * p{0};".format(arg.name)
-                code += " {0} c{1};".format(PY_C_TYPE[arg.dtype], arg.name)
-        if len(fkt.signature) > 0:
-            code += "\n\t\t\tif ("
-            code += "\n\t\t\t\tPyTuple_CheckExact(args) and PyTuple_GET_SIZE(args) == {0}".format(len(fkt.signature))
-            for idx, arg in enumerate(fkt.signature):
-                code += "\n\t\t\t\tand (p{0} = PyTuple_GET_ITEM(args, {1})) ".format(arg.name, idx)
-                if isinstance(arg, Object):
-                    code += "and c{0}.initialize(p{0})".format(arg.name)
-                elif len(arg.shape) > 0:
-                    code += "and PyArray_CheckExact(p{0})".format(arg.name)
-                    code += "\n\t\t\t\tand PyArray_TYPE((PyArrayObject *)p{0}) == {1} and PyArray_NDIM((PyArrayObject *)p{0}) == {2}".format(arg.name, NPY_TYPEENUM[arg.dtype], len(arg.shape))
-                elif arg.dtype is int:
-                    if sys.version_info[0] == 2:
-                        code += "and PyInt_CheckExact(p{0})".format(arg.name)
-                    else:
-                        code += "and PyLong_CheckExact(p{0})".format(arg.name)
-                elif arg.dtype is float:
-                    code += "and PyFloat_CheckExact(p{0})".format(arg.name)
-                elif arg.dtype in NPY_SCALAR_TAG:
-                    code += "and PyArray_IsScalar(p{0}, {1})".format(arg.name, NPY_SCALAR_TAG[arg.dtype])
+                code += "and PyArray_Check(p{0})".format(arg.name)
+                code += "\n\t\t\t\tand PyArray_TYPE((PyArrayObject *)p{0}) == {1} and PyArray_NDIM((PyArrayObject *)p{0}) == {2}".format(arg.name, NPY_TYPEENUM[arg.dtype], len(arg.shape))
+                code += "\n\t\t\t\tand {0}native_strided((PyArrayObject *)p{1})".format("" if arg.strided else "!", arg.name)
+            elif arg.dtype is int:
+                if sys.version_info[0] == 2:
+                    code += "and PyInt_CheckExact(p{0})".format(arg.name)
                 else:
-                    raise Exception("Unknown type: {0!s}".format(arg.dtype))
-
-            code += "\n\t\t\t) {\n"
-            for arg in fkt.signature:
-                if isinstance(arg, Object): pass
-                elif len(arg.shape) > 0:
-                    code += "\t\t\t\tif (!(p{0}.incref((PyObject *)PyArray_GETCONTIGUOUS((PyArrayObject *)p{0})))) {{\n".format(arg.name)
-                    code += "\t\t\t\t\tPyErr_SetString(PyExc_ValueError, \"Invalid Argument type on {0}!\");\n".format(arg.name)
-                    code += "\t\t\t\t\treturn NULL;\n"
-                    code += "\t\t\t\t}\n"
-                elif arg.dtype is int:
-                    if sys.version_info[0] == 2:
-                        code += "\t\t\t\tc{0} = PyInt_AS_LONG(p{0});\n".format(arg.name)
-                    else:
-                        code += "\t\t\t\tc{0} = PyLong_AS_LONG(p{0});\n".format(arg.name)
-                elif arg.dtype is float:
-                    code += "\t\t\t\tc{0} = PyFloat_AS_DOUBLE(p{0});\n".format(arg.name)
-                elif arg.dtype in NPY_SCALAR_TAG:
-                    code += "\t\t\t\tc{0} = PyArrayScalar_VAL(p{0}, {1});\n".format(arg.name, NPY_SCALAR_TAG[arg.dtype])
+                    code += "and PyLong_CheckExact(p{0})".format(arg.name)
+            elif arg.dtype is float:
+                code += "and PyFloat_CheckExact(p{0})".format(arg.name)
+            elif arg.dtype in NPY_SCALAR_TAG:
+                code += "and PyArray_IsScalar(p{0}, {1})".format(arg.name, NPY_SCALAR_TAG[arg.dtype])
+            else:
+                raise Exception("Unknown type: {0!s}".format(arg.dtype))
 
-            args = []
-            for arg in fkt.signature:
-                if not isinstance(arg, Object) and len(arg.shape) > 0:
-                    args.append("p{1}, PyArray_SHAPE((PyArrayObject *)p{1}), ({0} *)PyArray_DATA((PyArrayObject *)p{1})".format(PY_C_TYPE[arg.dtype], arg.name))
+        code += "\n\t\t\t) {\n"
+        for arg in fkt.signature:
+            if isinstance(arg, Object): pass
+            elif len(arg.shape) > 0 and arg.strided:
+                # strided arrays are passed without a copy, the strides are converted to elements
+                code += "\t\t\t\tnpy_intp t{0}[{1}];\n".format(arg.name, len(arg.shape))
+                code += "\t\t\t\tfor (int dim = 0; dim < {1}; ++dim)\n\t\t\t\t\tt{0}[dim] = PyArray_STRIDES((PyArrayObject *)p{0})[dim] / PyArray_ITEMSIZE((PyArrayObject *)p{0});\n".format(arg.name, len(arg.shape))
+            elif len(arg.shape) > 0:
+                code += "\t\t\t\tif (!(p{0}.incref((PyObject *)PyArray_GETCONTIGUOUS((PyArrayObject *)p{0})))) {{\n".format(arg.name)
+                code += "\t\t\t\t\tPyErr_SetString(PyExc_ValueError, \"Invalid Argument type on {0}!\");\n".format(arg.name)
+                code += "\t\t\t\t\treturn NULL;\n"
+                code += "\t\t\t\t}\n"
+            elif arg.dtype is int:
+                if sys.version_info[0] == 2:
+                    code += "\t\t\t\tc{0} = PyInt_AS_LONG(p{0});\n".format(arg.name)
                 else:
-                    args.append("c{0}".format(arg.name))
+                    code += "\t\t\t\tc{0} = PyLong_AS_LONG(p{0});\n".format(arg.name)
+            elif arg.dtype is float:
+                code += "\t\t\t\tc{0} = PyFloat_AS_DOUBLE(p{0});\n".format(arg.name)
+            elif arg.dtype in NPY_SCALAR_TAG:
+                code += "\t\t\t\tc{0} = PyArrayScalar_VAL(p{0}, {1});\n".format(arg.name, NPY_SCALAR_TAG[arg.dtype])
 
-            call  = "{0}_{1}(".format(modtoken.main, fkt.getId())
-            call += "\n\t\t\t\t\t\t  {0}".format("\n\t\t\t\t\t\t, ".join(args))
-            call += "\n\t\t\t\t\t)"
-        else:
-            call  = "{0}_{1}()".format(modtoken.main, fkt.getId())
-
-        code += "\t\t\t\ttry {\n"
-        if fkt.dtype is None:
-            code += "\t\t\t\t\t{0};\n".format(call)
-            code += "\t\t\t\t\tPy_INCREF(Py_None);\n"
-            code += "\t\t\t\t\treturn Py_None;\n"
-        elif len(fkt.shape) == 0 and fkt.dtype is bool:
-            code += "\t\t\t\t\tPyObject* res = {0} ? Py_True : Py_False;\n".format(call)
-            code += "\t\t\t\t\tPy_INCREF(res);\n"
-            code += "\t\t\t\t\treturn res;\n"
-        elif len(fkt.shape) == 0 and fkt.dtype is int:
-            code += "\t\t\t\t\treturn Py_BuildValue(\"{0}\", {1});\n".format(PY_TYPE_CHAR[np.int_], call)
-        elif len(fkt.shape) == 0 and fkt.dtype is float:
-            code += "\t\t\t\t\treturn Py_BuildValue(\"{0}\", {1});\n".format(PY_TYPE_CHAR[np.float_], call)
-        elif len(fkt.shape) == 0 and fkt.dtype in NPY_SCALAR_TAG:
-            code += "\t\t\t\t\tPyObject* res = PyArrayScalar_New({0});\n".format(NPY_SCALAR_TAG[fkt.dtype])
-            code += "\t\t\t\t\tPyArrayScalar_ASSIGN(res, {0}, {1});\n".format(NPY_SCALAR_TAG[fkt.dtype], call)
-            code += "\t\t\t\t\treturn res;\n"
-        else:
-            code += "\t\t\t\t\tPyObject * res = std::get<0>({0});\n".format(call)
-            if fkt.return_allocated:
-                # to avoid mem leak or segfault
-                code += "\n\t\t\t\t\tPy_INCREF(res);\n"
-                
-            code += "\t\t\t\t\treturn res;\n"
-        code += "\t\t\t\t} catch (...) {\n"
-        code += "\t\t\t\t\treturn NULL;\n"
-        code += "\t\t\t\t}\n"
-
-        if len(fkt.signature) > 0:
-            code += "\t\t\t} else\n"
-            code += "\t\t\t\tPyErr_Clear();\n"
-
-        code += "\t\t}\n"
-        
-    def stripArg(arg):
-        if isinstance(arg, Object):
-            delattr(arg, "parent")
-            if hasattr(arg, "instance"):
-                delattr(arg, "instance")
-            for name, value in list(arg.attrs.items()):
-                arg.attrs[name] = stripArg(value)
-        else:
-            if not arg.dtype in [bool, int, float]:
-                arg.dtype = NPY_TYPE[arg.dtype]
-            arg.dims = len(arg.shape)
-            delattr(arg, "shape")
-            if not isinstance(arg, ObjectAttr):
-                delattr(arg, "scope")
-                delattr(arg, "allocated")
+        args = []
+        for arg in fkt.signature:
+            if not isinstance(arg, Object) and len(arg.shape) > 0:
+                args.append("p{1}, PyArray_SHAPE((PyArrayObject *)p{1}), ({0} *)PyArray_DATA((PyArrayObject *)p{1}){2}".format(PY_C_TYPE[arg.dtype], arg.name \
+                    , ", t{0}".format(arg.name) if arg.strided else ""))
             else:
-                delattr(arg, "parent")
-        return arg
-
-    signatures = []
-    for fkt in modtoken.functions[modtoken.main]:
-        signatures.append([stripArg(copy.deepcopy(arg)) for arg in fkt.signature])
+                args.append("c{0}".format(arg.name))
 
-    if sys.version_info[0] == 2:
-        pickled = pickle.dumps(signatures).replace("\n", "\\n")
+        call  = "{0}_{1}(".format(modtoken.main, fkt.getId())
+        call += "\n\t\t\t\t\t\t  {0}".format("\n\t\t\t\t\t\t, ".join(args))
+        call += "\n\t\t\t\t\t)"
     else:
-        import base64
-        pickled = base64.encodebytes(pickle.dumps(signatures)).decode('ascii').replace("\n", "\\n")
-
-    code += "\t\tPyObject * signatures = Py_BuildValue(\"(sO)\", \"{0}\", args);\n".format(pickled)
-    code += "\t\tif (!signatures) {\n"
-
-    # TODO: make all exceptions reasonamble: http://docs.python.org/2/c-api/exceptions.html
-    code += "\t\t\tPyErr_SetString(PyExc_ValueError, \"Error building signature string for {0}\");\n".format(modtoken.main)
-    code += "\t\t\treturn NULL;\n"
+        call  = "{0}_{1}()".format(modtoken.main, fkt.getId())
+
+    if modtoken.nogil:
+        call = "native_nogil([&]() {{ return {0}; }})".format(call)
+
+    code += "\t\t\t\ttry {\n"
+    if fkt.dtype is None:
+        code += "\t\t\t\t\t{0};\n".format(call)
+        code += "\t\t\t\t\tPy_INCREF(Py_None);\n"
+        code += "\t\t\t\t\treturn Py_None;\n"
+    elif len(fkt.shape) == 0 and fkt.dtype is bool:
+        code += "\t\t\t\t\tPyObject* res = {0} ? Py_True : Py_False;\n".format(call)
+        code += "\t\t\t\t\tPy_INCREF(res);\n"
+        code += "\t\t\t\t\treturn res;\n"
+    elif len(fkt.shape) == 0 and fkt.dtype is int:
+        if sys.version_info[0] == 2:
+            code += "\t\t\t\t\treturn PyInt_FromLong({0});\n".format(call)
+        else:
+            code += "\t\t\t\t\treturn PyLong_FromLong({0});\n".format(call)
+    elif len(fkt.shape) == 0 and fkt.dtype is float:
+        code += "\t\t\t\t\treturn PyFloat_FromDouble({0});\n".format(call)
+    elif len(fkt.shape) == 0 and fkt.dtype in NPY_SCALAR_TAG:
+        code += "\t\t\t\t\tPyObject* res = PyArrayScalar_New({0});\n".format(NPY_SCALAR_TAG[fkt.dtype])
+        code += "\t\t\t\t\tPyArrayScalar_ASSIGN(res, {0}, {1});\n".format(NPY_SCALAR_TAG[fkt.dtype], call)
+        code += "\t\t\t\t\treturn res;\n"
+    else:
+        code += "\t\t\t\t\tPyObject * res = std::get<0>({0});\n".format(call)
+        if fkt.return_allocated:
+            # to avoid mem leak or segfault
+            code += "\n\t\t\t\t\tPy_INCREF(res);\n"
+            
+        code += "\t\t\t\t\treturn res;\n"
+    code += "\t\t\t\t} catch (...) {\n"
+    code += "\t\t\t\t\treturn NULL;\n"
+    code += "\t\t\t\t}\n"
+
+    if len(fkt.signature) > 0:
+        code += "\t\t\t} else\n"
+        code += "\t\t\t\tPyErr_Clear();\n"
     code += "\t\t}\n"
-    code += "\t\treturn PyObject_Call(create_signature, signatures, NULL);\n"
+
+    # the dispatcher tries the next specialization with the same key
+    code += "\t\tPy_INCREF(Py_NotImplemented);\n"
+    code += "\t\treturn Py_NotImplemented;\n"
 
     return code
@@ -2,10 +2,7 @@
 
 from __future__ import print_function, division, absolute_import, unicode_literals
 
-LIBRARY_HOPE_EXP = """
-#ifndef M_LN2
-    #define M_LN2 0.693147180559945309417
-#endif
+LIBRARY_HOPE_EXP_DATA = """
 static const double hope_exp_data[] = {1.04097186427,1.04089394448,1.04081609252,1.04073830834,1.04066059189,1.04058294314,1.04050536203,1.04042784852,1.04035040257,1.04027302414,1.04019571317,1.04011846963,1.04004129347,1.03996418465,1.03988714312,1.03981016883,
     1.03973326176,1.03965642184,1.03957964904,1.03950294331,1.03942630461,1.03934973289,1.03927322812,1.03919679024,1.03912041922,1.039044115,1.03896787756,1.03889170684,1.03881560279,1.03873956538,1.03866359457,1.0385876903,
     1.03851185254,1.03843608125,1.03836037637,1.03828473787,1.0382091657,1.03813365982,1.03805822019,1.03798284676,1.0379075395,1.03783229835,1.03775712328,1.03768201424,1.03760697118,1.03753199408,1.03745708288,1.03738223754,
@@ -263,6 +260,12 @@ static const double hope_exp_data[] = {1.04097186427,1.04089394448,1.04081609252
     1.03947314975,1.03952168533,1.03957023879,1.03961881013,1.03966739933,1.0397160064,1.03976463133,1.03981327414,1.0398619348,1.03991061333,1.03995930972,1.04000802397,1.04005675608,1.04010550604,1.04015427386,1.04020305953,
     1.04025186305,1.04030068442,1.04034952365,1.04039838071,1.04044725563,1.04049614839,1.04054505899,1.04059398743,1.04064293372,1.04069189784,1.04074087979,1.04078987959,1.04083889721,1.04088793267,1.04093698596,1.04098605708,
 };
+"""
+
+LIBRARY_HOPE_EXP = """
+#ifndef M_LN2
+    #define M_LN2 0.693147180559945309417
+#endif
 static const double hope_exp_a = (double)(1 << 20) / M_LN2;
 static const double hope_exp_b = 1023 * (1 << 20) - 60801;
 enum { hope_exp_mask = (1 << 12) - 1  };
@@ -277,7 +280,7 @@ inline double hope_exp(double x) {
         return hope_exp_bounds.d;
     int32_t tmp = hope_exp_a * x + hope_exp_b;
     hope_exp_union_t y(0, tmp);
-    y.d *= hope_exp_data[hope_exp_mask & (tmp >> (20 - 12))];
+    y.d *= native_runtime->exp_data[hope_exp_mask & (tmp >> (20 - 12))];
     return y.d;
 };
 """
@@ -304,23 +307,119 @@ LIBRARY_NATIVE_RANGECHECK = """
 #include <string>
 inline int native_rangecheck(int x, int u, int l, std::string idxname, std::string varname) {
     if (x < u || x >= l) {
+        // the check might run without the GIL
+        PyGILState_STATE state = PyGILState_Ensure();
         PyErr_Format(PyExc_ValueError, "%s (%d) not in range %d to %d of %s", idxname.c_str(), x, u, l, varname.c_str());
+        PyGILState_Release(state);
         throw std::exception();
     }
     return x;
 }
 """
 
+LIBRARY_NATIVE_GIL = """
+struct native_gil_release {
+    native_gil_release(): state(PyEval_SaveThread()) {}
+    ~native_gil_release() { PyEval_RestoreThread(state); }
+    PyThreadState * state;
+};
+struct native_gil_acquire {
+    native_gil_acquire(): state(PyGILState_Ensure()) {}
+    ~native_gil_acquire() { PyGILState_Release(state); }
+    PyGILState_STATE state;
+};
+template<typename F> inline auto native_nogil(F fkt) -> decltype(fkt()) {
+    native_gil_release release;
+    return fkt();
+}
+template<typename F> inline auto native_gil(F fkt) -> decltype(fkt()) {
+    native_gil_acquire acquire;
+    return fkt();
+}
+"""
+
 LIBRARY_NUMPY_INTERP = """
-template<typename X0, typename X, typename Y> inline Y numpy_interp(X0 x0, X * x, Y * y, npy_intp size) {
+template<typename X0, typename X, typename Y> inline Y numpy_interp(X0 x0, X * x, npy_intp xs, Y * y, npy_intp ys, npy_intp size) {
     npy_intp l, r, m;
     for (l = 0, r = size - 1, m = (l + r) / 2; 1 < r - l; m = (l + r) / 2)
-        if (x0 < x[m])
+        if (x0 < x[m * xs])
             r = m;
         else
             l = m;
-    auto b = (x0 - x[l]) / (x[r] - x[l]);
-    return (1 - b) * y[l] + b * y[r];
+    auto b = (x0 - x[l * xs]) / (x[r * xs] - x[l * xs]);
+    return (1 - b) * y[l * ys] + b * y[r * ys];
+}
+"""
+
+LIBRARY_NATIVE_SIGNATURE_KEY = """
+inline bool native_strided(PyArrayObject * obj) {
+    if (PyArray_IS_C_CONTIGUOUS(obj))
+        return false;
+    for (int dim = 0; dim < PyArray_NDIM(obj); ++dim)
+        if (PyArray_STRIDES(obj)[dim] % PyArray_ITEMSIZE(obj))
+            return false;
+    return true;
+}
+
+inline bool native_buffer(PyObject * obj) {
+    return !PyArray_Check(obj) && !PyArray_IsScalar(obj, Generic) && !PyBytes_Check(obj) && PyObject_CheckBuffer(obj);
+}
+
+// returns a tuple with the buffer objects in argv wrapped by arrays sharing their memory, NULL if there are none.
+// needs to be in sync with hope._transformer._is_buffer
+inline PyObject * native_asarrays(PyObject * const * argv, Py_ssize_t nargs) {
+    Py_ssize_t idx;
+    for (idx = 0; idx < nargs && !native_buffer(argv[idx]); ++idx);
+    if (idx == nargs)
+        return NULL;
+    PyObject * args = PyTuple_New(nargs);
+    if (!args) {
+        PyErr_Clear();
+        return NULL;
+    }
+    for (idx = 0; idx < nargs; ++idx) {
+        PyObject * arg = native_buffer(argv[idx]) ? PyArray_FromAny(argv[idx], NULL, 0, 0, 0, NULL) : NULL;
+        // read-only buffers like a memoryview of bytes are copied, so the function can not modify immutable objects
+        if (arg && !PyArray_ISWRITEABLE((PyArrayObject *)arg)) {
+            PyObject * copy = PyArray_NewCopy((PyArrayObject *)arg, NPY_CORDER);
+            Py_DECREF(arg);
+            arg = copy;
+        }
+        if (!arg) {
+            PyErr_Clear();
+            Py_INCREF(argv[idx]);
+            arg = argv[idx];
+        }
+        PyTuple_SET_ITEM(args, idx, arg);
+    }
+    return args;
+}
+
+inline npy_uint64 native_type_key(PyObject * obj) {
+    if (PyArray_Check(obj))
+        return (((npy_uint64)PyArray_TYPE((PyArrayObject *)obj) << 8 | (npy_uint64)PyArray_NDIM((PyArrayObject *)obj)) << 1
+            | (npy_uint64)native_strided((PyArrayObject *)obj)) << 3 | 1;
+    else if (PyArray_IsScalar(obj, Generic)) {
+        PyArray_Descr * descr = PyArray_DescrFromScalar(obj);
+        npy_uint64 key = (npy_uint64)descr->type_num << 3 | 2;
+        Py_DECREF(descr);
+        return key;
+#if PY_MAJOR_VERSION < 3
+    } else if (PyInt_CheckExact(obj))
+#else
+    } else if (PyLong_CheckExact(obj))
+#endif
+        return 3;
+    else if (PyFloat_CheckExact(obj))
+        return 4;
+    return 0;
+}
+
+inline npy_uint64 native_signature_key(PyObject * const * argv, Py_ssize_t nargs) {
+    npy_uint64 key = nargs;
+    for (Py_ssize_t idx = 0; idx < nargs; ++idx)
+        key = key * 1000003 ^ native_type_key(argv[idx]);
+    return key;
 }
 """
 
@@ -331,6 +430,7 @@ LIBRARY_IMPORTS = """
 #include <numpy/arrayobject.h>
 #include <numpy/arrayscalars.h>
 #include <cmath>
+#include <algorithm>
 #include <tuple>
 #include <numeric>
 #include <cstdint>
@@ -338,6 +438,20 @@ LIBRARY_IMPORTS = """
 #include <exception>
 #include <functional>
 #include <type_traits>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+"""
+
+LIBRARY_RUNTIME_API = """
+// helpers compiled once into the runtime module, each module imports them on initialization
+struct native_runtime_api {
+    double const * exp_data;
+    // minimal number of elements of a parallel loop, see hope.config.parallelthreshold
+    npy_intp parallelthreshold;
+};
+static native_runtime_api * native_runtime;
 
 """
 
@@ -359,50 +473,56 @@ struct PyObj {
 
 """
 
-LIBRARY_METHODS_DECL_PY2 ="""
+LIBRARY_SPECIALIZATION_METHODS_DECL_PY2 ="""
     PyMethodDef {fktname}Methods[] = {{
-        {{ \"set_create_signature\", (PyCFunction)set_create_signature, METH_VARARGS }},
-        {{ \"run\", (PyCFunction)run, METH_VARARGS }},
         {{ NULL, NULL }}
     }};
 
 """
 
-LIBRARY_INIT_DECL_PY2 = """
+LIBRARY_SPECIALIZATION_INIT_DECL_PY2 = """
     PyMODINIT_FUNC init{filename}(void) {{
         import_array();
         PyImport_ImportModule(\"numpy\");
-        (void)Py_InitModule(\"{filename}\", {fktname}Methods);
+        if (!(native_runtime = (native_runtime_api *)PyCapsule_Import(\"{runtime}.api\", 0)))
+            return;
+        PyObject * module = Py_InitModule(\"{filename}\", {fktname}Methods);
+        // the specialization is added to the dispatcher of the function, see LIBRARY_DISPATCH
+        PyObject * capsule = module ? PyCapsule_New((void *)specialization, \"hope.specialization\", NULL) : NULL;
+        if (capsule and PyModule_AddObject(module, \"specialization\", capsule))
+            Py_DECREF(capsule);
     }}
     
 """
 
-LIBRARY_METHODS_DECL_PY3 = """
-    PyMethodDef {fktname}Methods[] = {{
-        {{ \"set_create_signature\", set_create_signature, METH_VARARGS, \"signal handler\" }},
-        {{ \"run\", run, METH_VARARGS, \"module function\" }},
-        {{ NULL, NULL, 0, NULL }}
-    }};
-    
-"""
-
-
-LIBRARY_MODULE_DECL_PY3 = """
+LIBRARY_SPECIALIZATION_MODULE_DECL_PY3 = """
     static struct PyModuleDef {fktname}module = {{
         PyModuleDef_HEAD_INIT,
         \"{fktname}\",
         NULL,
         -1,
-        {fktname}Methods
+        NULL
     }};
     
 """
 
-LIBRARY_INIT_DECL_PY3 = """
+LIBRARY_SPECIALIZATION_INIT_DECL_PY3 = """
     PyMODINIT_FUNC PyInit_{filename}(void) {{
             import_array();
             PyImport_ImportModule(\"numpy\");
-            return PyModule_Create(&{fktname}module);
+            if (!(native_runtime = (native_runtime_api *)PyCapsule_Import(\"{runtime}.api\", 0)))
+                return NULL;
+            PyObject * module = PyModule_Create(&{fktname}module);
+            if (!module)
+                return NULL;
+            // the specialization is added to the dispatcher of the function, see LIBRARY_DISPATCH
+            PyObject * capsule = PyCapsule_New((void *)specialization, \"hope.specialization\", NULL);
+            if (!capsule or PyModule_AddObject(module, \"specialization\", capsule)) {{
+                Py_XDECREF(capsule);
+                Py_DECREF(module);
+                return NULL;
+            }}
+            return module;
     }}
     
 """
@@ -452,23 +572,258 @@ void sighandler(int sig) {
     
 """
 
-LIBRARY_CREATE_SIGNATURE = """
+LIBRARY_DISPATCH = """
+typedef PyObject * (*native_specialization)(PyObject * const * argv, Py_ssize_t nargs);
+
+// the specializations by the key of their signature with their capsule, specializations with the same key
+// are tried in the order they were added
+struct native_dispatcher {
     PyObject * create_signature;
-    
-    struct sigaction slot;
-    
-    PyObject * set_create_signature(PyObject * self, PyObject * args) {
-        if (!PyArg_ParseTuple(args, "O", &create_signature)) {
-            PyErr_SetString(PyExc_ValueError, "Invalid Argument to set_create_signature!");
+    std::unordered_map<npy_uint64, std::vector<std::pair<native_specialization, PyObject *> > > specializations;
+    // run bound to the dispatcher, named like the python function, so bound methods are pickled by their name
+    std::string name;
+    PyMethodDef def;
+};
+
+// the object the dispatching functions are bound to, its type is exposed to python, so hope can pickle its
+// dispatching functions by reference, see hope._wrapper._reduce_dispatcher
+struct native_dispatcher_object {
+    PyObject_HEAD
+    native_dispatcher * dispatcher;
+};
+
+void native_dispatcher_dealloc(PyObject * self) {
+    native_dispatcher * dispatcher = ((native_dispatcher_object *)self)->dispatcher;
+    Py_DECREF(dispatcher->create_signature);
+    for (auto & entry : dispatcher->specializations)
+        for (auto & specialization : entry.second)
+            Py_DECREF(specialization.second);
+    delete dispatcher;
+    PyObject_Del(self);
+}
+
+static PyTypeObject native_dispatcher_type = { PyVarObject_HEAD_INIT(NULL, 0) };
+
+int native_dispatcher_ready() {
+    native_dispatcher_type.tp_name = "hope.dispatcher";
+    native_dispatcher_type.tp_basicsize = sizeof(native_dispatcher_object);
+    native_dispatcher_type.tp_dealloc = native_dispatcher_dealloc;
+    native_dispatcher_type.tp_flags = Py_TPFLAGS_DEFAULT;
+    native_dispatcher_type.tp_doc = "the dispatcher a dispatching function is bound to";
+    return PyType_Ready(&native_dispatcher_type);
+}
+
+native_dispatcher * native_get_dispatcher(PyObject * run) {
+    if (!PyCFunction_Check(run) or !PyCFunction_GET_SELF(run) or Py_TYPE(PyCFunction_GET_SELF(run)) != &native_dispatcher_type) {
+        PyErr_SetString(PyExc_TypeError, "Argument is not a dispatching function");
+        return NULL;
+    }
+    return ((native_dispatcher_object *)PyCFunction_GET_SELF(run))->dispatcher;
+}
+
+// the helpers passed to the modules, see native_runtime_api
+static native_runtime_api runtime_api = { hope_exp_data, 100000 };
+
+extern "C" {
+
+#if PY_VERSION_HEX >= 0x03070000
+    PyObject * run(PyObject * self, PyObject * const * argv, Py_ssize_t nargs) {
+#else
+    PyObject * run(PyObject * self, PyObject * args) {
+        PyObject * const * argv = &PyTuple_GET_ITEM(args, 0);
+        Py_ssize_t nargs = PyTuple_GET_SIZE(args);
+#endif
+        native_dispatcher * dispatcher = ((native_dispatcher_object *)self)->dispatcher;
+        // buffer objects like memoryview or array.array are dispatched as arrays sharing their memory
+        PyObj buffers;
+        PyObject * const * arrays = buffers.incref(native_asarrays(argv, nargs)) ? &PyTuple_GET_ITEM((PyObject *)buffers, 0) : argv;
+        auto entry = dispatcher->specializations.find(native_signature_key(arrays, nargs));
+        if (entry != dispatcher->specializations.end()) {
+            // specializations running without the GIL allow other threads to add specializations, which keeps
+            // the references to the elements of the map valid, but not the iterators, so copy the entry
+            std::vector<std::pair<native_specialization, PyObject *> > & specializations = entry->second;
+            for (std::size_t idx = 0; idx < specializations.size(); ++idx) {
+                native_specialization specialization = specializations[idx].first;
+                PyObject * res = specialization(arrays, nargs);
+                if (res != Py_NotImplemented)
+                    return res;
+                Py_DECREF(res);
+            }
+        }
+#if PY_VERSION_HEX >= 0x03070000
+        PyObject * args = PyTuple_New(nargs);
+        if (!args)
             return NULL;
+        for (Py_ssize_t idx = 0; idx < nargs; ++idx) {
+            Py_INCREF(argv[idx]);
+            PyTuple_SET_ITEM(args, idx, argv[idx]);
         }
+        PyObject * res = PyObject_CallFunctionObjArgs(dispatcher->create_signature, args, NULL);
+        Py_DECREF(args);
+        return res;
+#else
+        return PyObject_CallFunctionObjArgs(dispatcher->create_signature, args, NULL);
+#endif
+    }
+
+    PyMethodDef run_def = {
+#if PY_VERSION_HEX >= 0x03070000
+        "run", (PyCFunction)(void(*)(void))run, METH_FASTCALL, "dispatches the call to the specialization of the signature"
+#else
+        "run", (PyCFunction)run, METH_VARARGS, "dispatches the call to the specialization of the signature"
+#endif
+    };
+
+    struct sigaction slot;
+
+    PyObject * dispatcher_new(PyObject * self, PyObject * args) {
+        PyObject * create_signature;
+        const char * name;
+        if (!PyArg_ParseTuple(args, "Os", &create_signature, &name))
+            return NULL;
+        native_dispatcher_object * object = PyObject_New(native_dispatcher_object, &native_dispatcher_type);
+        if (!object)
+            return NULL;
+        native_dispatcher * dispatcher = new native_dispatcher();
         Py_INCREF(create_signature);
+        dispatcher->create_signature = create_signature;
+        dispatcher->name = name;
+        dispatcher->def = run_def;
+        dispatcher->def.ml_name = dispatcher->name.c_str();
+        object->dispatcher = dispatcher;
         memset(&slot, 0, sizeof(slot));
         slot.sa_handler = &sighandler;
         sigaction(SIGSEGV, &slot, NULL);
         sigaction(SIGBUS, &slot, NULL);
+        // the function keeps the dispatcher and so its method definition alive
+        PyObject * run = PyCFunction_New(&dispatcher->def, (PyObject *)object);
+        Py_DECREF(object);
+        return run;
+    }
+
+    PyObject * dispatcher_add(PyObject * self, PyObject * args) {
+        PyObject * run, * capsule;
+        unsigned long long key;
+        if (!PyArg_ParseTuple(args, "OKO", &run, &key, &capsule))
+            return NULL;
+        native_dispatcher * dispatcher = native_get_dispatcher(run);
+        native_specialization specialization = (native_specialization)PyCapsule_GetPointer(capsule, "hope.specialization");
+        if (!dispatcher or !specialization)
+            return NULL;
+        Py_INCREF(capsule);
+        dispatcher->specializations[(npy_uint64)key].push_back(std::make_pair(specialization, capsule));
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    PyObject * dispatcher_replace(PyObject * self, PyObject * args) {
+        PyObject * run, * previous, * capsule;
+        if (!PyArg_ParseTuple(args, "OOO", &run, &previous, &capsule))
+            return NULL;
+        native_dispatcher * dispatcher = native_get_dispatcher(run);
+        native_specialization replaced = (native_specialization)PyCapsule_GetPointer(previous, "hope.specialization");
+        native_specialization specialization = (native_specialization)PyCapsule_GetPointer(capsule, "hope.specialization");
+        if (!dispatcher or !replaced or !specialization)
+            return NULL;
+        // calls running the replaced specialization keep on running, its module is not unloaded
+        for (auto & entry : dispatcher->specializations)
+            for (auto & candidate : entry.second)
+                if (candidate.first == replaced) {
+                    Py_INCREF(capsule);
+                    Py_DECREF(candidate.second);
+                    candidate.first = specialization;
+                    candidate.second = capsule;
+                    Py_INCREF(Py_True);
+                    return Py_True;
+                }
+        Py_INCREF(Py_False);
+        return Py_False;
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    // run wrapped as instance method to be used as method of a class without a python trampoline
+    PyObject * dispatcher_method(PyObject * self, PyObject * args) {
+        PyObject * run;
+        if (!PyArg_ParseTuple(args, "O", &run) or !native_get_dispatcher(run))
+            return NULL;
+        return PyInstanceMethod_New(run);
+    }
+#endif
+
+    PyObject * runtime_parallelthreshold(PyObject * self, PyObject * args) {
+        Py_ssize_t threshold;
+        if (!PyArg_ParseTuple(args, "n", &threshold))
+            return NULL;
+        runtime_api.parallelthreshold = threshold;
         Py_INCREF(Py_None);
         return Py_None;
     }
 
-"""
\ No newline at end of file
+    PyMethodDef runtimeMethods[] = {
+        { "new", dispatcher_new, METH_VARARGS, "creates a dispatching function" },
+        { "add", dispatcher_add, METH_VARARGS, "adds a specialization to a dispatching function" },
+        { "replace", dispatcher_replace, METH_VARARGS, "replaces a specialization of a dispatching function" },
+#if PY_MAJOR_VERSION >= 3
+        { "method", dispatcher_method, METH_VARARGS, "wraps a dispatching function as instance method" },
+#endif
+        { "parallelthreshold", runtime_parallelthreshold, METH_VARARGS, "sets the minimal number of elements of a parallel loop" },
+        { NULL, NULL, 0, NULL }
+    };
+
+"""
+
+LIBRARY_RUNTIME_INIT_DECL_PY2 = """
+    PyMODINIT_FUNC init{filename}(void) {{
+        import_array();
+        PyImport_ImportModule(\"numpy\");
+        if (native_dispatcher_ready() < 0)
+            return;
+        PyObject * module = Py_InitModule(\"{filename}\", runtimeMethods);
+        if (module) {{
+            Py_INCREF(&native_dispatcher_type);
+            if (PyModule_AddObject(module, \"dispatcher\", (PyObject *)&native_dispatcher_type))
+                Py_DECREF(&native_dispatcher_type);
+        }}
+        PyObject * capsule = module ? PyCapsule_New(&runtime_api, \"{filename}.api\", NULL) : NULL;
+        if (capsule and PyModule_AddObject(module, \"api\", capsule))
+            Py_DECREF(capsule);
+    }}
+    
+"""
+
+LIBRARY_RUNTIME_MODULE_DECL_PY3 = """
+    static struct PyModuleDef runtimemodule = {{
+        PyModuleDef_HEAD_INIT,
+        \"{filename}\",
+        NULL,
+        -1,
+        runtimeMethods
+    }};
+    
+"""
+
+LIBRARY_RUNTIME_INIT_DECL_PY3 = """
+    PyMODINIT_FUNC PyInit_{filename}(void) {{
+            import_array();
+            PyImport_ImportModule(\"numpy\");
+            if (native_dispatcher_ready() < 0)
+                return NULL;
+            PyObject * module = PyModule_Create(&runtimemodule);
+            if (!module)
+                return NULL;
+            Py_INCREF(&native_dispatcher_type);
+            if (PyModule_AddObject(module, \"dispatcher\", (PyObject *)&native_dispatcher_type)) {{
+                Py_DECREF(&native_dispatcher_type);
+                Py_DECREF(module);
+                return NULL;
+            }}
+            PyObject * capsule = PyCapsule_New(&runtime_api, \"{filename}.api\", NULL);
+            if (!capsule or PyModule_AddObject(module, \"api\", capsule)) {{
+                Py_XDECREF(capsule);
+                Py_DECREF(module);
+                return NULL;
+            }}
+            return module;
+    }}
+    
+"""
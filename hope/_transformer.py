@@ -9,6 +9,7 @@ import inspect
 
 from hope._dump import Dumper
 from hope._ast import *
+import hope
 import hope._cache as cache
 from hope.exceptions import UnsupportedFeatureException
 
@@ -192,7 +193,6 @@ class IterableFunctionVisitor(ast.NodeVisitor):
     def visit_While(self, node):
         return False
     def visit_Attribute(self, node):
-        import hope
         if isinstance(node.ctx, ast.Load) and isinstance(node.value, ast.Name) and isinstance(node.value.ctx, ast.Load) \
                 and node.value.id in self.namespace and self.namespace[node.value.id] is hope:
             return True
@@ -203,7 +203,9 @@ class IterableFunctionVisitor(ast.NodeVisitor):
             return False
 
     def visit_Call(self, node):
-        if (isinstance(node.func, ast.Name) and isinstance(node.func.ctx, ast.Load)):
+        if isinstance(node.func, ast.Name) and node.func.id in ["min", "max"] and not node.func.id in self.namespace:
+            return all([self.visit(arg) for arg in node.args])
+        elif (isinstance(node.func, ast.Name) and isinstance(node.func.ctx, ast.Load)):
             called_fkt = self.namespace[node.func.id]
             if (inspect.isbuiltin(called_fkt) or called_fkt.__name__ == "_hope_callback") and hasattr(cache, str(id(called_fkt))):
                 called_fkt = getattr(cache, str(id(called_fkt)))
@@ -427,7 +429,12 @@ class ASTTransformer(ast.NodeVisitor):
         if not isinstance(iter, NewVariable):
             raise Exception("The variable '{0}' does already exists, since the scopeing is different in c++ and python, this is not supported".format(iter.name))
         # TODO: implement this more generic
-        if isinstance(node.iter, ast.Call) and isinstance(node.iter.func, ast.Name) and node.iter.func.id in ["range", "xrange"] \
+        parallel = isinstance(node.iter, ast.Call) and (
+                   (isinstance(node.iter.func, ast.Name) and self.fkt.__globals__.get(node.iter.func.id) is hope.prange)
+                or (isinstance(node.iter.func, ast.Attribute) and isinstance(node.iter.func.value, ast.Name) and node.iter.func.attr == "prange" \
+                    and self.fkt.__globals__.get(node.iter.func.value.id) is hope)
+            )
+        if isinstance(node.iter, ast.Call) and (parallel or isinstance(node.iter.func, ast.Name) and node.iter.func.id in ["range", "xrange"]) \
                 and len(node.iter.keywords) == 0 and node.iter.starargs is None and node.iter.kwargs is None:
             if len(node.iter.args) == 1:
                 args = [Number(0), self.visit(node.iter.args[0])]
@@ -438,9 +445,9 @@ class ASTTransformer(ast.NodeVisitor):
             
             self.variables[iter.name] = Variable(iter.name, [], np.int_)
             iter = self.variables[iter.name]
-            return For(iter, args[0], args[1], self.body_visit(node.body))
+            return For(iter, args[0], args[1], self.body_visit(node.body), parallel)
         else:
-            raise UnsupportedFeatureException("only forloops with a call to [x]range are supported")
+            raise UnsupportedFeatureException("only forloops with a call to [x]range or hope.prange are supported")
 
     def visit_While(self, node):
         if len(node.orelse) > 0:
@@ -449,7 +456,6 @@ class ASTTransformer(ast.NodeVisitor):
         return While(self.visit(node.test), self.body_visit(node.body))
 
     def visit_Attribute(self, node):
-        import hope
         if isinstance(node.ctx, ast.Load) and isinstance(node.value, ast.Name) and isinstance(node.value.ctx, ast.Load) \
                 and node.value.id in self.fkt.__globals__ and self.fkt.__globals__[node.value.id] is hope:
             return HopeAttr(node.attr)
@@ -471,7 +477,15 @@ class ASTTransformer(ast.NodeVisitor):
     def visit_Call(self, node):
         #TODO: refactor
         # TODO: implement from bincount import bincount
-        if (
+        if isinstance(node.func, ast.Name) and node.func.id in ["min", "max"] and not node.func.id in self.fkt.__globals__:
+            if len(node.args) != 2 or len(node.keywords) > 0 or not node.starargs is None or not node.kwargs is None:
+                raise UnsupportedFeatureException("{0} requires two arguments".format(node.func.id))
+            left, right = self.visit(node.args[0]), self.visit(node.args[1])
+            if len(left.shape) > 0 or len(right.shape) > 0:
+                raise UnsupportedFeatureException("{0} is only supported for scalars".format(node.func.id))
+            return BinOp(node.func.id.capitalize(), left, right)
+
+        elif (
                 (isinstance(node.func, ast.Name) and isinstance(node.func.ctx, ast.Load))
             or (
                     isinstance(node.func, ast.Attribute) and node.func.value.id in self.variables and isinstance(self.variables[node.func.value.id], Object) \
@@ -516,7 +530,7 @@ class ASTTransformer(ast.NodeVisitor):
                 for arg, sig in zip(args, self.token.signature):
                     if isinstance(arg, Object) and arg.getId() != sig.getId():
                         valid = False
-                    elif arg.dtype != sig.dtype or len(arg.shape) != len(sig.shape):
+                    elif arg.dtype != sig.dtype or len(arg.shape) != len(sig.shape) or getattr(arg, "strided", False) != sig.strided:
                         valid = False
                         
                 if valid and self.token.shape is None:
@@ -533,7 +547,7 @@ class ASTTransformer(ast.NodeVisitor):
                         for arg, sig in zip(args, fkt.signature):
                             if isinstance(arg, Object) and arg.getId() != sig.getId():
                                 valid = False
-                            elif not isinstance(arg, Object) and (arg.dtype != sig.dtype or len(arg.shape) != len(sig.shape)):
+                            elif not isinstance(arg, Object) and (arg.dtype != sig.dtype or len(arg.shape) != len(sig.shape) or getattr(arg, "strided", False) != sig.strided):
                                 valid = False
                                 
                         if valid:
@@ -545,7 +559,7 @@ class ASTTransformer(ast.NodeVisitor):
                     for arg, sig in zip(args, fkt.signature):
                         if isinstance(arg, Object) and arg.getId() != sig.getId():
                             valid = False
-                        elif not isinstance(arg, Object) and (arg.dtype != sig.dtype or len(arg.shape) != len(sig.shape)):
+                        elif not isinstance(arg, Object) and (arg.dtype != sig.dtype or len(arg.shape) != len(sig.shape) or getattr(arg, "strided", False) != sig.strided):
                             valid = False
                     if valid:
                         dtype, shape = fkt.dtype, fkt.shape
@@ -721,6 +735,12 @@ class ASTTransformer(ast.NodeVisitor):
             else:
                 raise Exception("Invalid Structure")
             
+            if _is_buffer(arg):
+                arg = np.asarray(arg)
+                # read-only buffers are passed as a copy, see native_asarrays in hope._library
+                if not arg.flags.writeable:
+                    arg = arg.copy()
+
             if isinstance(arg, (Variable, Object)):
                 #TODO: maybe implement prototype pattern. 
                 #Overwrite attributes of passed arguments to avoid conflicts
@@ -734,6 +754,9 @@ class ASTTransformer(ast.NodeVisitor):
                 
                 self.variables[argname] = Variable(argname, None, arg.dtype.type, "signature", True)
                 self.variables[argname].shape = [(None, Dimension(self.variables[argname], dim)) for dim in range(len(arg.shape))]
+                # needs to be in sync with native_strided in hope._library.LIBRARY_NATIVE_SIGNATURE_KEY
+                if not arg.flags.c_contiguous and all([stride % arg.itemsize == 0 for stride in arg.strides]):
+                    self.variables[argname].strided = True
             elif hasattr(arg, "dtype"):
                 if hasattr(arg.dtype, "type"):
                     self.variables[argname] = Variable(argname, [], arg.dtype.type, "signature", True)
@@ -749,6 +772,24 @@ class ASTTransformer(ast.NodeVisitor):
             
         return signature
 
+def _is_buffer(obj):
+    """
+    Checks if the object is passed to a compiled function as an array sharing its memory, or as a copy if the
+    buffer is read-only. Needs to be in sync with ``native_buffer`` and ``native_asarrays`` in
+    :py:data:`hope._library.LIBRARY_NATIVE_SIGNATURE_KEY`
+
+    :param obj: an argument of a function call
+
+    :return result: True if the object supports the buffer protocol and is neither an array nor a numpy scalar
+    """
+    if isinstance(obj, (np.ndarray, np.generic, bytes, Token)):
+        return False
+    try:
+        memoryview(obj)
+        return True
+    except TypeError:
+        return False
+
 def get_fkt_ast(fkt):
     """
     Creates a AST form the given function by getting the source of the function 
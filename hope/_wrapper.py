@@ -5,76 +5,174 @@ from __future__ import print_function, division, absolute_import
 
 
 import os
-import io
 import sys
+import json
+import atexit
 import hashlib
-import setuptools
 import pickle
 import inspect
 import tempfile
 import shutil
 import warnings
+import threading
+import subprocess
+import weakref
+import types
 
-from numpy.distutils.misc_util import get_numpy_include_dirs
-from setuptools.command.build_ext import build_ext
-from distutils.dist import Distribution
-import distutils.sysconfig
+import numpy as np
 
+try:
+    import copyreg
+except ImportError:
+    import copy_reg as copyreg
 
 from hope._ast import *
-from hope._transformer import ASTTransformer
+from hope._transformer import ASTTransformer, _is_buffer
 from hope import config
+from hope.cache import account, append_state, find, lock, publish, touch
 import hope._cache as cache
 
 
-class Wrapper:
+class Callback(object):
+    """
+    The function returned by :py:func:`hope.jit` until the dispatcher of the function has been created. It
+    compiles the function with the signature of its arguments, later calls go through the dispatcher.
+    """
+
+    def __init__(self, wrapper):
+        # the transformer recognizes the callbacks by their name, see hope._transformer
+        self.__name__, self.wrapper = "_hope_callback", wrapper
+        # the name the callback is pickled with, see _reduce_callback
+        self.reference = cache._reference(wrapper.fkt, wrapper.nogil, self)
+
+    def __call__(self, *args):
+        return self.wrapper(*args) if self.wrapper.cache is None else self.wrapper.cache(*args)
+
+    def __get__(self, obj, objtype=None):
+        # bind the callback like a python function if it is used as a method
+        return self if obj is None else types.MethodType(self, obj)
 
-    _recompile = False
+
+class Wrapper:
 
     # the deepcopy of the ast does violates the deepcopy semantics, so do not allow deepcopy ...
     def __deepcopy__(self, memo):
         raise TypeError("The hope function wrapper can't be cloned")
 
-    def __init__(self, fkt, hash):
+    def __init__(self, fkt, hash, nogil=None):
         self.modtoken, self.fkt, self.filename, self.cache = Module(fkt.__name__), fkt, "{0}_{1}".format(fkt.__name__, hash), None
-
-        def recoverArg(arg):
-            if isinstance(arg, Object):
-                if not hasattr(arg, "parent"):
-                    arg.parent = None
-                for name, value in list(arg.attrs.items()):
-                    if isinstance(value, (Object, ObjectAttr)):
-                        value.parent = arg
-                    arg.attrs[name] = recoverArg(value)
-            else:
-                if isinstance(arg.dtype, str) and hasattr(np, arg.dtype):
-                    arg.dtype = getattr(np, arg.dtype)
-                arg.shape = [(None, Dimension(arg, dim)) for dim in range(arg.dims)]
-                delattr(arg, "dims")
-                if not isinstance(arg, ObjectAttr):
-                    arg.scope, arg.allocated = "signature", True
-            return arg
-
-        def create_signature(pickled, args):
-            if sys.version_info[0] == 2:
-                unpickled = pickle.loads(pickled)
-            else:
-                import base64
-                unpickled = pickle.loads(base64.decodebytes(pickled.encode('ascii')))
-            for striped in unpickled:
-                signature = [recoverArg(arg) for arg in striped]
-                ASTTransformer(self.modtoken).module_visit(self.fkt, signature, "".join([arg.getId() for arg in signature]))
+        self.method, self.nogil = None, nogil
+        # the compiled specializations as [module name, signature key] and the formated signatures, see hope.aot
+        self.modules, self.signatures, self.called = [], [], {}
+        # the lock protects the modtoken, the thread is only set while a background compilation is running and
+        # the signatures failed to compile in the background run the python function, see _get_args_key
+        self._lock, self._thread, self._failed = threading.RLock(), None, set()
+        # the quick builds waiting for their optimized module and the ones failed to upgrade, see hope.config.tiered
+        self._pending, self._upgrader, self._quick = [], None, []
+        # the modules and classes the callback has been bound to as [module name, qualified name], see hope.jit
+        self.bindings = []
+
+        def create_signature(args):
+            # do not wait for a running background compilation, the signatures are passed again on the next call
+            if config.background and (self._thread is not None or (self._failed and _get_args_key(args) in self._failed)):
+                return self.fkt(*args)
             return self(*args)
         self.create_signature = create_signature
 
-        def _hope_callback(*args):
-            return self(*args) if self.cache is None else self.cache(*args)
-        self.callback = _hope_callback
-        setattr(cache, str(id(self.callback)), fkt)
+        self.callback = Callback(self)
+        self._register(self.callback)
 
 
+    def _register(self, fkt_native):
+        """
+        Registers a function returned for the python function, so the function can be looked up by the
+        transformer and by :py:func:`hope.aot`.
+
+        :param fkt_native: the python callback, the dispatcher or the instance method wrapping the dispatcher
+        """
+        setattr(cache, str(id(fkt_native)), self.fkt)
+        _wrappers[id(fkt_native)] = self
+
     def __call__(self, *args):
+        if not config.background:
+            with self._lock:
+                return self._build(args)(*args)
+
+        # never block the caller, if the lock is taken a compilation is already running
+        if self._thread is None and not (self._failed and _get_args_key(args) in self._failed) and self._lock.acquire(False):
+            try:
+                self._thread = threading.Thread(target=self._build_background, args=(args,))
+                self._thread.daemon = True
+                self._thread.start()
+            finally:
+                self._lock.release()
+        return self.fkt(*args)
+
+    def _build_background(self, args):
+        """
+        Compiles the signature of the passed arguments. Called from the background thread started in
+        :py:meth:`__call__` if ``hope.config.background`` is set. If the compilation fails, the wrapper
+        keeps on running the python function for arguments of the same types, other signatures are still compiled.
+
+        :param args: the arguments of the call that triggered the compilation
+        """
+        with self._lock:
+            try:
+                self._build(args)
+            except Exception as ex:
+                self._failed.add(_get_args_key(args))
+                warnings.warn("Background compilation of {0} failed, using the python function for these argument types. Reason: {1}".format(self.fkt.__name__, ex))
+            finally:
+                self._thread = None
+
+    def _load(self, state):
+        """
+        Imports the modules of the specializations stored in the state and adds them to the dispatcher.
+
+        :param state: the state of the function as stored by :py:meth:`_store_state`
+
+        :raises ImportError: if a module does not exist anymore
+        """
+        modules = [_import_module(name) for name, _ in state["modules"]]
+        touch(*["{0}.so".format(name) for name, _ in state["modules"]])
+        for module, (name, key) in zip(modules, state["modules"]):
+            self._add(name, key, module, state["bound"])
+        self.signatures, self.called = list(state["signatures"]), dict(state["called"])
+
+    def _add(self, name, key, module, bound):
+        """
+        Adds the specialization of a compiled module to the dispatcher. The dispatcher is created with the first
+        specialization and is kept for all following ones, so no compiled function needs to be replaced.
+
+        :param name: the name of the module
+        :param key: the key of the signature of the specialization
+        :param module: the compiled module
+        :param bound: if the function is a method
+        """
+        runtime = _get_runtime()
+        if self.cache is None:
+            self.cache = runtime.new(self.create_signature, self.fkt.__name__)
+            _wrappers[id(self.cache.__self__)] = self
+            # python 2 has no instance method, so bound functions go through the python callback
+            if bound and hasattr(runtime, "method"):
+                self.method = runtime.method(self.cache)
+        runtime.add(self.cache, key, module.specialization)
+        self.modules.append([name, key])
+
+    def _build(self, args, tiered=None):
+        """
+        Transforms the function with the signature of the passed arguments, generates and compiles a module for
+        the new specialization and adds it to the dispatcher. The first time, the python callback is replaced by
+        the dispatcher.
+
+        :param args: the arguments to derive the new signature from
+        :param tiered: use a quick build until the optimized module is compiled, defaults to ``hope.config.tiered``
+
+        :return run: the dispatcher
+        """
+        count = len(self.modtoken.functions.get(self.modtoken.main, []))
         ASTTransformer(self.modtoken).module_visit(self.fkt, args)
+        self.modtoken.nogil = config.nogil if self.nogil is None else self.nogil
 
         if config.optimize:
 
@@ -89,58 +187,122 @@ class Wrapper:
         if config.verbose:
             self._print_module_info()
 
-        try:
-            tempfolder = tempfile.mkdtemp(prefix='hope')
-    
+        fkts = self.modtoken.functions[self.modtoken.main][count:]
+        if len(fkts) == 0:
+            raise Exception("The arguments do not match the compiled signature of {0}".format(self.fkt.__name__))
+
+        from hope._generator import generate, _signature_key
+        from hope.aot import format_signature
+        previous, bound = self.cache, fkts[0].isbound
+        tiered = config.tiered if tiered is None else tiered
+
+        # every specialization is compiled into its own module, so a new signature only compiles the new one
+        for fkt in fkts:
             # TODO: if function is class method, make classname_method name as name
-            localfilename = "{0}_{1}".format(self.filename, len(self.modtoken.functions[self.modtoken.main]) - 1)
-    
-            from hope._generator import generate
-            code = generate(self.modtoken, localfilename)
-    
-            with open(os.path.join(tempfolder, "{0}.cpp".format(localfilename)), "w") as fp:
-                fp.write(code)
-    
-            so_filename = _compile(tempfolder, localfilename, self.fkt.__name__)
-    
-            self._store_state(tempfolder, localfilename)
-    
-            #move xxx.so and pickled state if it doesn't already exists or if it was a recompilation due to inconsistent state
-            if self._recompile or not os.path.isfile(os.path.join(config.prefix, "{0}.so".format(localfilename))):
-                shutil.move(os.path.join(tempfolder, so_filename), os.path.join(config.prefix, "{0}.so".format(localfilename)))
-                shutil.move(os.path.join(tempfolder, "{0}.pck".format(self.filename)), os.path.join(config.prefix, "{0}.pck".format(self.filename)))
-    
-    
-            if sys.version_info[0] == 2:
-                module = __import__(localfilename, globals(), locals(), [], -1)
-            else:
-                import importlib
-                importlib.invalidate_caches()
-                module = importlib.import_module(localfilename)
-            module.set_create_signature(self.create_signature)
-    
-            for name in list(sys.modules.keys()):
-                if hasattr(sys.modules[name], self.fkt.__name__) and getattr(sys.modules[name], self.fkt.__name__) is self.callback:
-                    setattr(sys.modules[name], self.fkt.__name__, module.run)
-            setattr(cache, str(id(module.run)), self.fkt)
-            self.cache = module.run
-    
-            return module.run(*args)
-        
+            localfilename = "{0}_{1}".format(self.filename, len(self.modules))
+            code = generate(self.modtoken, localfilename, _get_runtime().__name__, fkt)
+            modulename, modulecode = _get_module_code(code, localfilename, self.fkt.__name__, self.modtoken.openmp)
+
+            # use a quick build until the optimized module is compiled by the upgrader thread
+            quick = tiered and find("{0}.so".format(modulename)) is None
+            if quick:
+                self._pending.append((len(self.modules), modulename, modulecode, self.modtoken.openmp))
+                modulename, modulecode = _get_module_code(code, localfilename, self.fkt.__name__, self.modtoken.openmp, True)
+
+            module = _build_module(modulecode, modulename, self.fkt.__name__, self.modtoken.openmp, quick)
+            self._add(modulename, _signature_key(fkt.signature), module, bound)
+            self.signatures.append(format_signature(fkt.signature))
+
+        # the state refers to optimized modules only, so other processes never load a quick build
+        if len(self._pending) == 0:
+            self._publish_state()
+        elif self._upgrader is None:
+            self._upgrader = threading.Thread(target=self._upgrade)
+            self._upgrader.daemon = True
+            self._upgrader.start()
+
+        if config.manifest is not None:
+            from hope.aot import record
+            record(self.fkt, [fkt.signature for fkt in fkts], self.nogil)
+
+        # evict the least recently used modules, loaded modules keep on working without their file
+        if config.cachebudget is not None:
+            account([name for name, _ in self.modules[-len(fkts):]])
+
+        # bound functions are replaced by the instance method wrapping run, so no python trampoline is needed
+        fkt_native = self.cache if self.method is None else self.method
+
+        # replace the python callback by the dispatcher where hope.jit has bound it
+        if previous is None:
+            for modulename, qualname in self.bindings:
+                for scope, name in _get_scopes(modulename, qualname, self.fkt.__name__):
+                    if getattr(scope, "__dict__", {}).get(name) is self.callback:
+                        setattr(scope, name, fkt_native)
+            self._register(fkt_native)
+
+        return self.cache
+
+    def _upgrade(self):
+        """
+        Compiles the optimized modules of the quick builds in :py:attr:`_pending` and replaces the quick builds
+        in the dispatcher. Runs in the upgrader thread started by :py:meth:`_build` if ``hope.config.tiered`` is
+        set. The state is published once all quick builds are replaced. If an optimized module fails to compile,
+        the quick build is kept and the state is not published anymore.
+        """
+        runtime = _get_runtime()
+        while True:
+            with self._lock:
+                if len(self._pending) == 0:
+                    self._publish_state()
+                    self._upgrader = None
+                    return
+                idx, modulename, code, openmp = self._pending[0]
+
+            # do not hold the lock while compiling, so new signatures can be compiled in the meantime
+            try:
+                module = _build_module(code, modulename, self.fkt.__name__, openmp)
+            except Exception as ex:
+                module = None
+                warnings.warn("Optimized compilation of {0} failed, keeping the quick build. Reason: {1}".format(self.fkt.__name__, ex))
+
+            with self._lock:
+                if module is not None:
+                    runtime.replace(self.cache, _import_module(self.modules[idx][0]).specialization, module.specialization)
+                    self.modules[idx][0] = modulename
+                else:
+                    self._quick.append(idx)
+                del self._pending[0]
+
+    def _publish_state(self):
+        """
+        Stores the state of the function in ``hope.config.prefix`` or the index ``hope.config.index``,
+        replacing the previous state. The state refers to optimized modules only, so if an optimized module
+        failed to compile, the state is not stored.
+        """
+        if len(self._quick) > 0:
+            return
+
+        if config.index is not None:
+            append_state(self.filename, self._get_state())
+            return
+
+        tempfolder = tempfile.mkdtemp(prefix='hope', dir=config.prefix)
+        try:
+            self._store_state(tempfolder)
+            publish(os.path.join(tempfolder, "{0}.pck".format(self.filename)), "{0}.pck".format(self.filename))
         finally:
-            if config.keeptemp:
-                for ext in ["out", "cpp", "o"]:
-                    if os.path.isfile(os.path.join(tempfolder, "{0}.{1}".format(localfilename, ext))):
-                        shutil.move(os.path.join(tempfolder, "{0}.{1}".format(localfilename, ext)), os.path.join(config.prefix, "{0}.{1}".format(localfilename, ext)))
-
             shutil.rmtree(tempfolder)
-            
 
-    def _store_state(self, tempfolder, localfilename):
-        state = {"filename": localfilename, 
+    def _store_state(self, tempfolder):
+        with open(os.path.join(tempfolder, "{0}.pck".format(self.filename)), "wb") as fp:
+            pickle.dump(self._get_state(), fp)
+
+    def _get_state(self):
+        state = {"modules": self.modules,
                  "main": self.modtoken.main, 
-                 "called": {}, 
-                 "bound": any([main.isbound for main in self.modtoken.functions[self.modtoken.main]]) 
+                 "called": self.called, 
+                 "bound": self.method is not None or any([main.isbound for main in self.modtoken.functions[self.modtoken.main]]),
+                 "signatures": self.signatures
                  }
         
         for name in list(self.modtoken.functions.keys()):
@@ -152,7 +314,7 @@ class Wrapper:
                 # TODO: remove this!
                 elif isinstance(self.fkt.__globals__[name], Wrapper):
                     fkt_hash = get_fkt_hash(self.fkt.__globals__[name].fkt)
-                elif inspect.isbuiltin(self.fkt.__globals__[name]) and hasattr(cache, str(id(self.fkt.__globals__[name]))):
+                elif (inspect.isbuiltin(self.fkt.__globals__[name]) or isinstance(self.fkt.__globals__[name], Callback)) and hasattr(cache, str(id(self.fkt.__globals__[name]))):
                     fkt_hash = get_fkt_hash(getattr(cache, str(id(self.fkt.__globals__[name]))))
                 elif inspect.isfunction(self.fkt.__globals__[name]):
                     fkt_hash = get_fkt_hash(self.fkt.__globals__[name])
@@ -165,8 +327,7 @@ class Wrapper:
         for name in get_config_attrs():
             state[name] = getattr(config, name)
 
-        with open(os.path.join(tempfolder, "{0}.pck".format(self.filename)), "wb") as fp:
-            pickle.dump(state, fp)
+        return state
 
     def _print_module_info(self):
 #         from hope import _dump
@@ -186,83 +347,138 @@ class Wrapper:
                 print("{0}({1})".format(node.name, ", ".join(signature)))
             
 
-def _compile(target, localfilename, fkt_name):
+# the wrappers of the functions returned by hope.jit by the id of the function, see Wrapper._register
+_wrappers = weakref.WeakValueDictionary()
+
+def _get_wrapper(fkt):
+    """
+    Returns the wrapper of a function returned by :py:func:`hope.jit`.
+
+    :param fkt: the object to look up
+
+    :return wrapper: the :py:class:`Wrapper` or None if the object is not a jitted function
+    """
+    wrapper = _wrappers.get(id(fkt))
+    if wrapper is None or not any([fkt is native for native in (wrapper.callback, wrapper.cache, wrapper.method)]):
+        return None
+    return wrapper
+
+def _get_args_key(args):
+    """
+    Returns a key of the types of the arguments, which distinguishes the signatures the function is compiled for:
+    the dtype and the number of dimensions of arrays and buffers and the type of all other arguments.
+
+    :param args: the arguments of a call
+
+    :return key: a hashable key of the types of the arguments
+    """
+    key = []
+    for arg in args:
+        if isinstance(arg, (np.ndarray, np.generic)) or _is_buffer(arg):
+            arr = np.asarray(arg)
+            key.append((arr.dtype.str, arr.ndim))
+        else:
+            key.append(type(arg))
+    return tuple(key)
+
+def _reduce_dispatcher(dispatcher):
+    """
+    Pickles the dispatcher a dispatching function is bound to by reference to the python function, like python
+    functions are pickled. Pickle restores the dispatching function by looking up its name on the restored
+    object, see :py:func:`hope.jit._load_dispatcher`.
+
+    :param dispatcher: the dispatcher of a jitted function
+
+    :return reduced: the function and the arguments to load the jitted function with
+    """
+    wrapper = _wrappers.get(id(dispatcher))
+    if wrapper is None or wrapper.cache is None or wrapper.cache.__self__ is not dispatcher:
+        raise pickle.PicklingError("Can't pickle {0}: not the dispatcher of a jitted function".format(dispatcher))
+    from hope.jit import _load_dispatcher
+    return _load_dispatcher, (wrapper.fkt.__module__, getattr(wrapper.fkt, "__qualname__", wrapper.fkt.__name__), wrapper.nogil)
+
+def _reduce_callback(callback):
+    """
+    Pickles the python callback of a jitted function by reference to the python function, see
+    :py:func:`hope._cache._resolve`.
+
+    :param callback: the python callback of a jitted function
+
+    :return reduced: the function and the arguments to load the jitted function with
+    """
+    return cache._resolve, (callback.reference, )
+
+copyreg.pickle(Callback, _reduce_callback)
+
+def _get_scopes(modulename, qualname, name):
+    """
+    Resolves the scopes a function might be bound to from the name of its module and its qualified name.
+
+    :param modulename: the name of the module the function has been defined in
+    :param qualname: the qualified name of the function, None if unknown
+    :param name: the name of the function
+
+    :return scopes: list of tuples of the module or class and the name of the attribute
+    """
+    scope = sys.modules.get(modulename)
+    if scope is None:
+        return []
+    if qualname is None:
+        # python 2 has no qualified names, so the function may be bound to the module or one of its classes
+        return [(scope, name)] + [(value, name) for value in list(vars(scope).values()) if inspect.isclass(value)]
+    path = qualname.split(".")
+    # functions defined in a function are not bound to a module or class
+    for part in path[:-1]:
+        scope = getattr(scope, part, None)
+    return [] if scope is None else [(scope, path[-1])]
+
+def _compile(target, localfilename, fkt_name, openmp=False, quick=False):
     """
-    Compiles a C++ function into a shared object library
+    Compiles a C++ function into a shared object library by calling the compiler directly
     
     :param target: target folder where the .cpp file is located and where the output should be stored
     :param localfilename: name of file to be compiled without '.cpp' suffix
     :param fkt_name: name of the function to be compiled
+    :param openmp: compile and link with OpenMP
+    :param quick: compile without optimizations, see ``hope.config.tiered``
     
     :raises Exception: An exception is raised if the file could be to compiled
     
     :return so_filename: The name of the .so file
     """
-    outfile, stdout, stderr, argv = None, None, None, sys.argv
-    try:
-        sys.stdout.flush(), sys.stderr.flush()
-        outfile = open(os.path.join(target, "{0}.out".format(localfilename)), 'w')
+    compiler, include_dirs, suffix = _get_build_env()
 
-        if sys.version_info[0] == 2 and isinstance(sys.stdout, file) and isinstance(sys.stdout, file):
-            stdout, stderr = os.dup(sys.stdout.fileno()), os.dup(sys.stderr.fileno())
-            os.dup2(outfile.fileno(), sys.stdout.fileno())
-            os.dup2(outfile.fileno(), sys.stderr.fileno())
-        else:
-            stdout, stderr = sys.stdout, sys.stderr
-            sys.stdout, sys.stderr = outfile, outfile
+    # on Travis CI & Py33 name contains additional suffix to .so
+    so_filename = "{0}{1}".format(localfilename, suffix)
+
+    if config.server is not None:
+        from hope.server import submit
+        try:
+            with open(os.path.join(target, "{0}.cpp".format(localfilename))) as fp:
+                shutil.copy(submit(fp.read(), localfilename, openmp, quick), os.path.join(target, so_filename))
+            return so_filename
+        except (IOError, OSError, ValueError) as ex:
+            warnings.warn("The compile server {0} can not be reached, compiling {1} locally. Reason: {2}".format(config.server, fkt_name, ex))
+
+    # the precompiled header of the preamble is included from the prefix or a read-only prefix
+    command = compiler \
+        + ["-I{0}".format(include_dir) for include_dir in include_dirs + [os.path.abspath(prefix) for prefix in [config.prefix] + list(config.readonlyprefixes)]] \
+        + _get_flags(openmp, quick) \
+        + [os.path.join(target, "{0}.cpp".format(localfilename)), "-o", os.path.join(target, so_filename)]
+
+    with open(os.path.join(target, "{0}.out".format(localfilename)), "w") as outfile:
+        outfile.write("{0}\n".format(" ".join(command)))
+        outfile.flush()
         try:
-            sources = os.path.join(target, "{0}.cpp".format(localfilename))
-            sys.argv = ["", "build_ext",
-                        "-b", target,  #--build-lib (-b)     directory for compiled extension modules
-                        "-t", "/" #--build-temp - a rel path will result in a dir structure of -b at the cur position 
-                        ]
-
-            # setuptools have a problem with the unicode_literals in python 2 ...
-            if sys.version_info[0] == 2:
-                from types import StringType
-                localfilename = StringType(localfilename)
-                sources = StringType(sources)
-
-            # avoid warning on linux + gcc
-            cfg_vars = distutils.sysconfig.get_config_vars()
-            if "CFLAGS" in cfg_vars:
-                cfg_vars["CFLAGS"] = cfg_vars["CFLAGS"].replace("-Wstrict-prototypes", "")
-            if "OPT" in cfg_vars:
-                cfg_vars["OPT"] = cfg_vars["OPT"].replace("-Wstrict-prototypes", "")
-
-            setuptools.setup( \
-                  name = localfilename\
-                , ext_modules = [setuptools.Extension( \
-                      localfilename \
-                    , sources = [sources] \
-                    , extra_compile_args = config.cxxflags \
-                  )] \
-                , include_dirs = get_numpy_include_dirs() \
-            )
-        except SystemExit as e:
-            print(sys.stderr.write(str(e)))
-        sys.stdout.flush(), sys.stderr.flush()
-    finally:
-        if isinstance(stdout, int):
-            os.dup2(stdout, sys.stdout.fileno()), os.close(stdout)
-        elif not stdout is None:
-            sys.stdout = stdout
-        if isinstance(stderr, int):
-            os.dup2(stderr, sys.stderr.fileno()), os.close(stderr)
-        elif not stderr is None:
-            sys.stderr = stderr
-        if (sys.version_info[0] == 2 and isinstance(outfile, file))\
-                or (sys.version_info[0] == 3 and isinstance(outfile, io.TextIOWrapper) and not outfile.closed):
-            outfile.close()
-        sys.argv = argv
+            returncode = subprocess.call(command, stdout=outfile, stderr=subprocess.STDOUT)
+        except OSError as e:
+            outfile.write("error: {0}\n".format(e))
+            returncode = -1
 
     with open(os.path.join(target, "{0}.out".format(localfilename))) as outfile:
         out = outfile.read()
 
-    # on Travis CI & Py33 name contains additional suffix to .so
-    so_filename = build_ext(Distribution()).get_ext_filename(localfilename)
-
-    if not os.path.isfile(os.path.join(target, so_filename)) or out.find("error:") > -1:
+    if returncode != 0 or not os.path.isfile(os.path.join(target, so_filename)) or out.find("error:") > -1:
         print(out)
         raise Exception("Error compiling function {0} (compiled to {1})".format(fkt_name, target))
     
@@ -280,6 +496,278 @@ def _compile(target, localfilename, fkt_name):
         
     return so_filename
 
+def _build_module(code, modulename, fkt_name, openmp=False, quick=False):
+    """
+    Compiles the code into the module ``modulename`` in ``hope.config.prefix`` if it does not already exist and
+    imports it.
+
+    :param code: the generated c++ code
+    :param modulename: the name of the module
+    :param fkt_name: name of the function to be compiled
+    :param openmp: compile and link with OpenMP
+    :param quick: compile without optimizations
+
+    :return module: the imported module
+    """
+    return _build_library(code, modulename, fkt_name, openmp, quick, True)
+
+def _build_library(code, modulename, fkt_name, openmp=False, quick=False, load=False):
+    """
+    Compiles the code into the shared object ``modulename`` in ``hope.config.prefix`` if it does not already
+    exist. Concurrent processes wait for the one holding the lock and use its result
+
+    :param code: the generated c++ code
+    :param modulename: the name of the module
+    :param fkt_name: name of the function to be compiled
+    :param openmp: compile and link with OpenMP
+    :param quick: compile without optimizations
+    :param load: import the module while holding the lock, so :py:func:`hope.cache.prune` can not remove it
+        before it is loaded
+
+    :return path: the path of the shared object or, if ``load`` is set, the imported module
+    """
+    path = find("{0}.so".format(modulename))
+    if path is not None and path != os.path.join(config.prefix, "{0}.so".format(modulename)):
+        # modules in a read-only prefix are used as they are
+        return _import_module(modulename) if load else path
+
+    with lock(modulename):
+        if not os.path.isfile(os.path.join(config.prefix, "{0}.so".format(modulename))):
+            # create the temporary folder in the prefix, so the result can be published by an atomic rename
+            tempfolder = tempfile.mkdtemp(prefix='hope', dir=config.prefix)
+            try:
+                with open(os.path.join(tempfolder, "{0}.cpp".format(modulename)), "w") as fp:
+                    fp.write(code)
+
+                so_filename = _compile(tempfolder, modulename, fkt_name, openmp, quick)
+                publish(os.path.join(tempfolder, so_filename), "{0}.so".format(modulename))
+            finally:
+                if config.keeptemp:
+                    for ext in ["out", "cpp", "o"]:
+                        if os.path.isfile(os.path.join(tempfolder, "{0}.{1}".format(modulename, ext))):
+                            shutil.move(os.path.join(tempfolder, "{0}.{1}".format(modulename, ext)), os.path.join(config.prefix, "{0}.{1}".format(modulename, ext)))
+
+                shutil.rmtree(tempfolder)
+        else:
+            touch("{0}.so".format(modulename))
+        if load:
+            return _import_module(modulename)
+
+    return os.path.join(config.prefix, "{0}.so".format(modulename))
+
+def _add_import_paths():
+    """
+    Adds ``hope.config.prefix`` and the read-only folders ``hope.config.readonlyprefixes`` to ``sys.path`` in
+    the order they are searched, so the compiled modules can be imported.
+    """
+    for prefix in [config.prefix] + list(config.readonlyprefixes):
+        if not os.path.abspath(prefix) in sys.path:
+            sys.path.append(os.path.abspath(prefix))
+
+def _import_module(modulename):
+    if sys.version_info[0] == 2:
+        return __import__(modulename, globals(), locals(), [], -1)
+    else:
+        import importlib
+        importlib.invalidate_caches()
+        return importlib.import_module(modulename)
+
+_runtime = None
+
+def _get_runtime():
+    """
+    Returns the runtime module, which contains the helpers shared by all modules and dispatches the calls of
+    the jitted functions to the modules of their specializations. The module does not depend on the jitted
+    functions, so it is only compiled once per build environment. Its name contains the hash of its code, so
+    the modules importing it always find the version they were compiled against. ``hope.config.parallelthreshold``
+    is passed to the runtime on each call.
+
+    :return module: the runtime module
+    """
+    global _runtime
+    if _runtime is None or find("{0}.so".format(_runtime.__name__)) is None:
+        from hope._generator import generate_runtime
+        code = _include_preamble(generate_runtime("hope_runtime"))
+        modulename = "hope_runtime_{0}".format(get_code_hash(code))
+        _runtime = _build_module(code.replace("hope_runtime", modulename), modulename, "runtime")
+        copyreg.pickle(_runtime.dispatcher, _reduce_dispatcher)
+    _runtime.parallelthreshold(config.parallelthreshold)
+    return _runtime
+
+def _get_module_code(code, localfilename, fkt_name, openmp=False, quick=False):
+    """
+    Names the module of the generated code by the hash of its code and compiler flags, so an identical module
+    is only compiled once.
+
+    :param code: the generated c++ code
+    :param localfilename: the name of the module the code has been generated for
+    :param fkt_name: the name of the function
+    :param openmp: if the code is compiled with OpenMP
+    :param quick: if the code is compiled without optimizations
+
+    :return modulename, code: the name of the module and its code including the precompiled preamble
+    """
+    code = _include_preamble(code, openmp, quick)
+    modulename = "{0}_{1}".format(fkt_name, get_code_hash(code.replace(localfilename, ""), openmp, quick))
+    return modulename, code.replace(localfilename, modulename)
+
+_preambles = {}
+
+def _get_preamble(openmp=False, quick=False):
+    """
+    Returns the name of the header containing the preamble all generated modules start with. The header
+    is precompiled once per build environment and kept in ``hope.config.prefix``, so the python and numpy
+    headers are not parsed for each module. If the header can not be precompiled, None is returned.
+
+    :param openmp: if the modules are compiled with OpenMP, which needs its own precompiled header
+    :param quick: if the modules are compiled without optimizations, which needs its own precompiled header
+
+    :return name: the name of the header without the '.h' suffix or None
+    """
+    code, name = _get_preamble_header(openmp, quick)
+    if name in _preambles and _preambles[name] is None:
+        return None
+    path = find("{0}.h.gch".format(name))
+    if path is not None and path != os.path.join(config.prefix, "{0}.h.gch".format(name)):
+        # the precompiled header of a read-only prefix is used as it is
+        _preambles[name] = name
+        return name
+
+    with lock(name):
+        if not os.path.isfile(os.path.join(config.prefix, "{0}.h.gch".format(name))):
+            tempfolder = tempfile.mkdtemp(prefix='hope', dir=config.prefix)
+            try:
+                with open(os.path.join(tempfolder, "{0}.h".format(name)), "w") as fp:
+                    fp.write(code)
+
+                # the header is compiled with the same flags as the modules, but is not linked
+                compiler, include_dirs, suffix = _get_build_env()
+                command = [arg for arg in compiler if arg != "-shared" and not arg.startswith("-Wl,") and not arg.startswith("-L")] \
+                    + ["-I{0}".format(include_dir) for include_dir in include_dirs] \
+                    + _get_flags(openmp, quick) \
+                    + ["-x", "c++-header", os.path.join(tempfolder, "{0}.h".format(name)), "-o", os.path.join(tempfolder, "{0}.h.gch".format(name))]
+                try:
+                    with open(os.devnull, "w") as devnull:
+                        returncode = subprocess.call(command, stdout=devnull, stderr=subprocess.STDOUT)
+                except OSError:
+                    returncode = -1
+                if returncode != 0 or not os.path.isfile(os.path.join(tempfolder, "{0}.h.gch".format(name))):
+                    _preambles[name] = None
+                    return None
+
+                # publish the header first, so the precompiled header is never used without it
+                publish(os.path.join(tempfolder, "{0}.h".format(name)), "{0}.h".format(name))
+                publish(os.path.join(tempfolder, "{0}.h.gch".format(name)), "{0}.h.gch".format(name))
+            finally:
+                shutil.rmtree(tempfolder)
+        else:
+            touch("{0}.h".format(name), "{0}.h.gch".format(name))
+
+    _preambles[name] = name
+    return name
+
+def _get_preamble_header(openmp=False, quick=False):
+    """
+    Returns the code of the header containing the preamble and its name, which contains the hash of the code and
+    the compiler flags, see :py:func:`_get_preamble`.
+
+    :param openmp: if the modules are compiled with OpenMP
+    :param quick: if the modules are compiled without optimizations
+
+    :return code, name: the code of the header and its name without the '.h' suffix
+    """
+    from hope._generator import generate_preamble
+    code = "#ifndef HOPE_PREAMBLE\n#define HOPE_PREAMBLE\n{0}#endif\n".format(generate_preamble())
+    return code, "hope_preamble_{0}".format(get_code_hash(code, openmp, quick))
+
+def _get_environment_modules():
+    """
+    Returns the names of the precompiled headers and the runtime module of the current build environment, which
+    all compiled modules depend on. The names are derived from the code, nothing is compiled.
+
+    :return names: the names of the headers and of the runtime module with and without the precompiled header
+    """
+    from hope._generator import generate_runtime
+    headers = [_get_preamble_header(openmp, quick)[1] for openmp in [False, True] for quick in [False, True]]
+    code = generate_runtime("hope_runtime")
+    # the runtime includes the precompiled header unless the header could not be precompiled
+    return headers + ["hope_runtime_{0}".format(get_code_hash(runtime)) for runtime in [code, _include_header(code, headers[0])]]
+
+def _include_header(code, name):
+    """
+    Replaces the preamble at the start of the generated code by an include of the header ``name``.
+
+    :param code: the generated c++ code
+    :param name: the name of the header without the '.h' suffix
+
+    :return code: the code including the header, or the unchanged code if it does not start with the preamble
+    """
+    from hope._generator import generate_preamble
+    preamble = generate_preamble()
+    if not code.startswith(preamble):
+        return code
+    return "#include \"{0}.h\"\n{1}".format(name, code[len(preamble):])
+
+def _include_preamble(code, openmp=False, quick=False):
+    """
+    Replaces the preamble at the start of the generated code by an include of the precompiled header.
+
+    :param code: the generated c++ code
+    :param openmp: if the code is compiled with OpenMP
+    :param quick: if the code is compiled without optimizations
+
+    :return code: the code including the precompiled header, or the unchanged code if there is none
+    """
+    name = _get_preamble(openmp, quick)
+    return code if name is None else _include_header(code, name)
+
+_build_env = None
+
+def _get_build_env():
+    """
+    Resolves the compiler command, the include directories and the extension suffix python extensions are 
+    built with. The values are only resolved on the first call and reused for all following compilations
+    
+    :return build_env: tuple of the compiler command, the include directories and the extension suffix
+    """
+    global _build_env
+    if _build_env is None:
+        import distutils.sysconfig
+        from distutils.ccompiler import new_compiler
+        from distutils.sysconfig import customize_compiler
+        from numpy.distutils.misc_util import get_numpy_include_dirs
+
+        compiler = new_compiler()
+        customize_compiler(compiler)
+
+        # compile and link in one step with the c++ driver, avoid warning on linux + gcc
+        command = compiler.compiler_cxx[:1] + compiler.compiler_so[1:] + compiler.linker_so[1:]
+        command = [arg for arg in command if arg != "-Wstrict-prototypes"]
+
+        include_dirs = []
+        for include_dir in [distutils.sysconfig.get_python_inc(), distutils.sysconfig.get_python_inc(plat_specific=True)] + get_numpy_include_dirs():
+            if include_dir not in include_dirs:
+                include_dirs.append(include_dir)
+
+        suffix = distutils.sysconfig.get_config_var("EXT_SUFFIX") or distutils.sysconfig.get_config_var("SO")
+
+        _build_env = (command, include_dirs, suffix)
+    return _build_env
+
+def _get_flags(openmp=False, quick=False):
+    """
+    Returns the flags the modules are compiled with in addition to the flags of the python build.
+
+    :param openmp: compile and link with OpenMP
+    :param quick: compile without optimizations and debug information, the flags override the flags of
+        the python build
+
+    :return flags: list of compiler flags
+    """
+    from hope.options import get_default_cxxflags
+    cxxflags = get_default_cxxflags() if config.cxxflags is None else config.cxxflags
+    return cxxflags + (["-fopenmp"] if openmp else []) + (["-O0", "-g0"] if quick else [])
+
 def get_config_attrs():
     """
     Returns the attributes of the hope config, filtering private attributes and imports from __future__
@@ -289,12 +777,97 @@ def get_config_attrs():
     return (name for name in dir(config) if (not name.startswith("__") and name not in ("print_function", "division", "absolute_import", "unicode_literals")))
     
     
+def get_code_hash(code, openmp=False, quick=False):
+    """
+    Returns the hash of the generated code and the flags it is compiled with
+
+    :param code: the generated c++ code
+    :param openmp: if the code is compiled with OpenMP
+    :param quick: if the code is compiled without optimizations
+
+    :return hash: the sha224 hash code
+    """
+    compiler, include_dirs, suffix = _get_build_env()
+    flags = compiler + include_dirs + _get_flags(openmp, quick) + [suffix]
+    return hashlib.sha224("\n".join([code] + flags).encode('utf-8')).hexdigest()
+
+_fkt_hashes = {}
+
 def get_fkt_hash(fkt):
     """
-    Returns hash of the `uft-8` encoded source of the given function
+    Returns hash of the `uft-8` encoded source of the given function. The hashes are cached per source file,
+    named by the path, the modification time and the size of the file, in memory and in ``hope.config.prefix``,
+    so the source of a function is only parsed again if its file has changed.
     
     :param fkt: the function to compute the hash from
     
     :return hash: the sha224 hash code 
     """
-    return hashlib.sha224(inspect.getsource(fkt).encode('utf-8')).hexdigest()
+    code = getattr(fkt, "__code__", None)
+    try:
+        stat = os.stat(code.co_filename)
+    except (AttributeError, OSError):
+        # functions without a source file, e.g. defined in an interactive session
+        return hashlib.sha224(inspect.getsource(fkt).encode('utf-8')).hexdigest()
+
+    path = os.path.abspath(code.co_filename)
+    index = _fkt_hashes.get(path)
+    if index is None or index["file"] != [stat.st_mtime, stat.st_size]:
+        index = _read_hash_index(path, [stat.st_mtime, stat.st_size])
+        _fkt_hashes[path] = index
+
+    name = "{0}:{1}".format(code.co_name, code.co_firstlineno)
+    if name not in index["hashes"]:
+        index["hashes"][name] = hashlib.sha224(inspect.getsource(fkt).encode('utf-8')).hexdigest()
+        # the new hashes of a file are written once when the process exits
+        if not _unsaved_indices:
+            atexit.register(_write_hash_indices)
+        _unsaved_indices[path] = (config.prefix, index)
+    return index["hashes"][name]
+
+_unsaved_indices = {}
+
+def _write_hash_indices():
+    for path, (prefix, index) in list(_unsaved_indices.items()):
+        _write_hash_index(prefix, path, index)
+    _unsaved_indices.clear()
+
+def _get_hash_index_name(path):
+    return "sources_{0}.json".format(hashlib.sha224(path.encode('utf-8')).hexdigest())
+
+def _read_hash_index(path, filekey):
+    """
+    Reads the hashes of the functions of a source file stored by :py:func:`_write_hash_index`.
+
+    :param path: the absolute path of the source file
+    :param filekey: the modification time and the size of the source file
+
+    :return index: dict with the ``path``, the ``file`` key and the ``hashes`` of the functions by name and line,
+        without hashes if the file has changed
+    """
+    try:
+        with open(os.path.join(config.prefix, _get_hash_index_name(path))) as fp:
+            index = json.load(fp)
+        if index["path"] == path and index["file"] == filekey:
+            return index
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+    return {"path": path, "file": filekey, "hashes": {}}
+
+def _write_hash_index(prefix, path, index):
+    """
+    Stores the hashes of the functions of a source file in ``prefix``.
+
+    :param prefix: the ``hope.config.prefix`` the hashes have been computed with
+    :param path: the absolute path of the source file
+    :param index: the hashes as returned by :py:func:`_read_hash_index`
+    """
+    if not os.path.isdir(prefix):
+        return
+    try:
+        fd, temppath = tempfile.mkstemp(prefix='hope', dir=prefix)
+        with os.fdopen(fd, "w") as fp:
+            json.dump(index, fp)
+        getattr(os, "replace", os.rename)(temppath, os.path.join(prefix, _get_hash_index_name(path)))
+    except (IOError, OSError):
+        pass
@@ -0,0 +1,253 @@
+# Copyright (c) 2014 ETH Zurich, Institute of Astronomy, Lukas Gamper <lukas.gamper@usystems.ch>
+
+"""
+Compiles jitted functions ahead of time, so the first call of ``hope.jit`` loads the compiled module from
+``hope.config.prefix`` instead of compiling it, e.g. to bake the modules into a container image::
+
+    python -m hope.aot mymodule --spec signatures.json
+    python -m hope.aot mymodule --recorded path/to/previous/.hope
+
+The spec file maps the names of the functions in the module to a list of signatures. Each signature lists
+the type of each argument: ``int`` and ``float`` for python scalars, the numpy name like ``float32``
+for numpy scalars and ``dtype^ndim`` like ``float64^2`` for arrays. Append ``s`` for strided arrays::
+
+    {"fkt": [["float64^1", "float64^1", "int"], ["float32^2", "float32^2", "int"]]}
+
+Signatures containing objects can not be compiled ahead of time. Jitted functions are compiled with the
+``nogil`` option passed to ``hope.jit``, python functions with the one recorded in the manifest of the
+previous run.
+
+Each compiled signature is recorded in the manifest ``hope.config.manifest``. A new process can compile all
+of them in parallel before they are called with :py:func:`warmup`.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+
+import os
+import json
+import pickle
+import importlib
+import warnings
+import collections
+import multiprocessing
+import numpy as np
+
+from hope import config
+from hope._ast import Object
+from hope._const import NPY_TYPE
+from hope.cache import load_state, read_index
+import hope._cache as cache
+
+
+def format_signature(signature):
+    """
+    Formats the arguments of a signature as type strings.
+
+    :param signature: list of :py:class:`hope._ast.Variable` and :py:class:`hope._ast.Object`
+
+    :return types: list of type strings, None if the signature contains an object
+    """
+    types = []
+    for arg in signature:
+        if isinstance(arg, Object):
+            return None
+        elif len(arg.shape) == 0 and arg.dtype in (int, float):
+            types.append(arg.dtype.__name__)
+        elif len(arg.shape) == 0:
+            types.append(NPY_TYPE[arg.dtype])
+        else:
+            types.append("{0}^{1}{2}".format(NPY_TYPE[arg.dtype], len(arg.shape), "s" if arg.strided else ""))
+    return types
+
+
+def parse_signature(types):
+    """
+    Creates arguments of the given types. Arrays have two elements per dimension.
+
+    :param types: list of type strings as returned by :py:func:`format_signature`
+
+    :return args: list of arguments
+    """
+    args = []
+    for name in types:
+        if name in ("int", "float"):
+            args.append({"int": 0, "float": 0.}[name])
+        elif not "^" in name:
+            args.append(np.dtype(str(name)).type(0))
+        else:
+            dtype, ndim = name.split("^")
+            if ndim.endswith("s"):
+                # the last axis is dropped from a bigger array, so the strides are a multiple of the item size
+                args.append(np.zeros((2,) * int(ndim[:-1]) + (2,), dtype=str(dtype))[..., 0])
+            else:
+                args.append(np.zeros((2,) * int(ndim), dtype=str(dtype)))
+    return args
+
+
+def recorded_signatures(fkt, prefix):
+    """
+    Reads the signatures of a function recorded in the states of a previous run.
+
+    :param fkt: the python function
+    :param prefix: the ``hope.config.prefix`` folder of the previous run
+
+    :return signatures: list of signatures as lists of type strings
+    """
+    signatures = []
+    if not os.path.isdir(prefix):
+        return signatures
+    states = []
+    for filename in sorted(os.listdir(prefix)):
+        if not filename.startswith("{0}_".format(fkt.__name__)) or not filename.endswith(".pck"):
+            continue
+        try:
+            with open(os.path.join(prefix, filename), "rb") as fp:
+                states.append(pickle.load(fp))
+        except Exception:
+            continue
+    if config.index is not None:
+        states += [state for _, state in sorted(read_index(os.path.join(prefix, config.index)).items())]
+    for state in states:
+        if isinstance(state, dict) and state.get("main") == fkt.__name__:
+            signatures += [types for types in state.get("signatures", []) if not types is None and not types in signatures]
+    return signatures
+
+
+def precompile(fkt, signatures, nogil=None):
+    """
+    Compiles the function for the given signatures and stores the modules in ``hope.config.prefix``. The
+    signatures already compiled for the function are kept, each new signature is compiled into its own module.
+
+    :param fkt: the python or jitted function
+    :param signatures: list of signatures as lists of type strings
+    :param nogil: needs to be the same as passed to ``hope.jit``
+    :type nogil: bool
+
+    :return signatures: the compiled signatures
+    """
+    from hope.jit import _get_hash, _check_state
+    from hope._wrapper import Wrapper, _add_import_paths
+
+    fkt = getattr(cache, str(id(fkt)), fkt)
+    if not os.path.exists(config.prefix):
+        os.makedirs(config.prefix)
+    _add_import_paths()
+
+    wrapper = Wrapper(fkt, _get_hash(fkt, nogil), nogil)
+    state = load_state(wrapper.filename)
+    signatures = [types for types in (state or {}).get("signatures", []) if not types is None and not types in signatures] + list(signatures)
+    try:
+        if not state is None:
+            _check_state(fkt, state)
+            wrapper._load(state)
+    except (LookupError, ImportError):
+        # the stored signatures are compiled again
+        wrapper = Wrapper(fkt, _get_hash(fkt, nogil), nogil)
+
+    for types in signatures:
+        if not types in wrapper.signatures:
+            # modules compiled ahead of time are always optimized
+            wrapper._build(parse_signature(types), False)
+    return signatures
+
+
+# the entries of the manifests recorded by this process as path: (inode, set of json lines)
+_manifests = {}
+
+def record(fkt, signatures, nogil=None):
+    """
+    Appends the signatures of the function which are not yet in the manifest ``hope.config.manifest``. The
+    manifest is read once per process and again if it has been replaced or removed.
+
+    :param fkt: the python function
+    :param signatures: list of signatures as lists of :py:class:`hope._ast.Variable`
+    :param nogil: the ``nogil`` argument passed to ``hope.jit``
+    """
+    path = os.path.join(config.prefix, config.manifest)
+    inode = os.stat(path).st_ino if os.path.isfile(path) else None
+    if not path in _manifests or _manifests[path][0] != inode:
+        _manifests[path] = (inode, set([json.dumps(entry, sort_keys=True) for entry in read_manifest(path)]))
+    recorded, lines = _manifests[path][1], ""
+    for signature in signatures:
+        entry = {"module": fkt.__module__, "name": fkt.__name__, "nogil": nogil, "signature": format_signature(signature)}
+        line = json.dumps(entry, sort_keys=True)
+        if not entry["signature"] is None and not line in recorded:
+            recorded.add(line)
+            lines += line + "\n"
+    # a single append, so concurrent processes do not interleave lines
+    if len(lines):
+        with open(path, "a") as fp:
+            fp.write(lines)
+        _manifests[path] = (os.stat(path).st_ino, recorded)
+
+
+def read_manifest(path):
+    """
+    Reads the entries of a manifest written by :py:func:`record`. Incomplete lines are skipped.
+
+    :param path: path of the manifest
+
+    :return entries: list of dicts with the keys ``module``, ``name``, ``nogil`` and ``signature``
+    """
+    entries, lines = [], set()
+    if not os.path.isfile(path):
+        return entries
+    with open(path) as fp:
+        for line in fp:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if not json.dumps(entry, sort_keys=True) in lines:
+                lines.add(json.dumps(entry, sort_keys=True))
+                entries.append(entry)
+    return entries
+
+
+def warmup(manifest=None, processes=None):
+    """
+    Compiles all signatures recorded in a manifest in parallel worker processes, e.g. at the start of a
+    service, so the functions are compiled before they are called.
+
+    :param manifest: (optional) path of the manifest, defaults to ``hope.config.manifest``
+    :type manifest: str
+    :param processes: (optional) number of worker processes, defaults to the number of cpus
+    :type processes: int
+
+    :return signatures: the number of compiled signatures
+    """
+    path = os.path.join(config.prefix, config.manifest if manifest is None else manifest)
+    functions = collections.OrderedDict()
+    for entry in read_manifest(path):
+        functions.setdefault((entry["module"], entry["name"], entry["nogil"]), []).append(entry["signature"])
+    if len(functions) == 0:
+        return 0
+
+    from hope._wrapper import get_config_attrs
+    state = dict([(name, getattr(config, name)) for name in get_config_attrs()])
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_warmup, [(module, name, nogil, signatures, state) for (module, name, nogil), signatures in functions.items()])
+    finally:
+        pool.close()
+        pool.join()
+
+    compiled = 0
+    for ((module, name, _), signatures), error in zip(functions.items(), results):
+        if error is None:
+            compiled += len(signatures)
+        else:
+            warnings.warn("Warming up {0}.{1} failed: {2}".format(module, name, error))
+    return compiled
+
+
+def _warmup(task):
+    module, name, nogil, signatures, state = task
+    try:
+        for key, value in state.items():
+            setattr(config, key, value)
+        value = getattr(importlib.import_module(module), name)
+        precompile(getattr(cache, str(id(value)), value), signatures, nogil)
+    except Exception as ex:
+        return "{0}".format(ex)
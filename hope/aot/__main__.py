@@ -0,0 +1,67 @@
+# Copyright (c) 2014 ETH Zurich, Institute of Astronomy, Lukas Gamper <lukas.gamper@usystems.ch>
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+
+import os
+import sys
+import json
+import inspect
+import argparse
+import importlib
+import warnings
+import collections
+
+from hope import config
+from hope.aot import precompile, read_manifest, recorded_signatures
+from hope._wrapper import _get_wrapper
+import hope._cache as cache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m hope.aot", description="Compile the jitted functions of a module ahead of time")
+    parser.add_argument("module", help="name of the module to import")
+    parser.add_argument("--spec", help="json file mapping function names to lists of signatures")
+    parser.add_argument("--recorded", help="prefix folder of a previous run to read the signatures from")
+    parser.add_argument("--prefix", default=config.prefix, help="folder to store the modules in (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    config.prefix = args.prefix
+    sys.path.insert(0, os.getcwd())
+    module = importlib.import_module(args.module)
+
+    specs = {}
+    if not args.spec is None:
+        with open(args.spec) as fp:
+            specs = json.load(fp)
+
+    for name, value in sorted(vars(module).items()):
+        # jitted functions and python functions which are in the spec or have been jitted in the recorded run
+        fkt = getattr(cache, str(id(value)), value if inspect.isfunction(value) else None)
+        if fkt is None or getattr(fkt, "__module__", None) != module.__name__:
+            continue
+        # jitted functions are compiled with their nogil option, python functions with the one in the manifest
+        wrapper = _get_wrapper(value)
+        nogil = None if wrapper is None else wrapper.nogil
+        signatures = collections.OrderedDict([(nogil, list(specs.get(name, [])))])
+        if not args.recorded is None:
+            signatures[nogil] += [types for types in recorded_signatures(fkt, args.recorded) if not types in signatures[nogil]]
+            if wrapper is None and not config.manifest is None:
+                for entry in read_manifest(os.path.join(args.recorded, config.manifest)):
+                    if entry["module"] == module.__name__ and entry["name"] == fkt.__name__ and entry["nogil"] != nogil:
+                        signatures[nogil] = [types for types in signatures[nogil] if types != entry["signature"]]
+                        signatures.setdefault(entry["nogil"], []).append(entry["signature"])
+        for nogil, pending in signatures.items():
+            if len(pending) == 0:
+                continue
+            try:
+                compiled = precompile(fkt, pending, nogil)
+            except Exception as ex:
+                warnings.warn("Compiling {0} failed: {1}".format(name, ex))
+                continue
+            for types in compiled:
+                print("{0}({1})".format(name, ", ".join(types)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+# Copyright (c) 2014 ETH Zurich, Institute of Astronomy, Lukas Gamper <lukas.gamper@usystems.ch>
+
+"""
+Manages the compiled modules and their states stored in ``hope.config.prefix``. The modules are named
+by the hash of their code and compiler flags. Each time a module is loaded, its modification time is
+updated, so if the cache exceeds ``hope.config.cachebudget`` the least recently used modules are removed.
+The size of the cache is estimated while compiling, so the cache is only scanned if it exceeds the budget.
+The state of each function is stored in its own file, or, if ``hope.config.index`` is set, the states of all
+functions are appended to a single index, which is compacted when the cache is pruned.
+
+The cache can be inspected and pruned from the command line::
+
+    python -m hope.cache info
+    python -m hope.cache prune [--budget BYTES]
+    python -m hope.cache clear
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+
+import os
+import time
+import base64
+import pickle
+import tempfile
+import contextlib
+import collections
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from hope import config
+
+
+CacheInfo = collections.namedtuple("CacheInfo", ["modules", "size", "budget"])
+
+# lock file and intermediate files kept next to the modules if ``hope.config.keeptemp`` is set
+_MODULE_EXTENSIONS = [".lock", ".cpp", ".out", ".o"]
+
+
+def cache_info():
+    """
+    Returns the number of compiled modules, their size incl. the states in bytes and the budget of the cache.
+
+    :return info: a ``CacheInfo(modules, size, budget)`` named tuple
+    """
+    entries = _get_entries(True)
+    modules = [name for name, (_, _, paths) in entries.items() if not name is None and any([path.endswith(".so") for path in paths])]
+    return CacheInfo(len(modules), sum([size for _, size, _ in entries.values()]), config.cachebudget)
+
+
+def cache_clear():
+    """
+    Removes all compiled modules, their states and the manifest ``hope.config.manifest`` from
+    ``hope.config.prefix``. Objects stored with :py:func:`hope.serialize` are kept. Already loaded functions
+    keep on working.
+    """
+    global _estimate
+    for _, _, paths in _get_entries(True).values():
+        _remove(paths)
+    if config.index is not None:
+        _remove([_get_index_path()])
+    if config.manifest is not None:
+        _remove([os.path.join(config.prefix, config.manifest)])
+    _estimate = None
+
+
+def prune(budget=None, keep=()):
+    """
+    Removes the least recently used modules until the cache fits into the budget. States of modules which
+    do not exist anymore are always removed. The index of the states, the detected compiler flags, the
+    hashes of the source files and the runtime module and precompiled headers of the current build environment
+    are never removed. Each module is removed while holding its lock, so it is not removed while another process
+    compiles or loads it.
+
+    :param budget: (optional) size of the cache in bytes, defaults to ``hope.config.cachebudget``. If both
+        are ``None``, only the states of removed modules are removed
+    :type budget: int
+    :param keep: (optional) names of modules not to remove, e.g. modules loaded by the running process
+
+    :return size: the number of bytes removed
+    """
+    if budget is None:
+        budget = config.cachebudget
+    _compact_index()
+    entries = _get_entries()
+    removed = 0
+    if None in entries:
+        _, size, paths = entries.pop(None)
+        removed += size
+        _remove(paths)
+    if budget is None:
+        return removed
+    from hope._wrapper import _get_environment_modules
+    keep = list(keep) + _get_environment_modules()
+    total = sum([size for _, size, _ in entries.values()])
+    for name, (_, size, paths) in sorted(entries.items(), key=lambda item: item[1][0]):
+        if total <= budget:
+            break
+        if name in keep:
+            continue
+        total -= size
+        removed += size
+        # processes waiting for the lock check if the module still exists once they hold it
+        with lock(name):
+            _remove(paths + [os.path.join(config.prefix, "{0}.lock".format(name))])
+    return removed
+
+
+# the estimated size of the cache as [prefix, size in bytes], see account
+_estimate = None
+
+def account(modules, keep=()):
+    """
+    Adds the size of newly compiled modules to the estimated size of the cache and prunes the cache if the
+    estimate exceeds ``hope.config.cachebudget``. The estimate is the size of the files in ``hope.config.prefix``
+    on the first call and after each prune, so the modules compiled by other processes are counted then.
+
+    :param modules: names of the new modules in ``hope.config.prefix``, which are not removed
+    :param keep: (optional) names of other modules not to remove
+
+    :return size: the number of bytes removed
+    """
+    global _estimate
+    if config.cachebudget is None:
+        return 0
+    if _estimate is None or _estimate[0] != os.path.abspath(config.prefix):
+        _estimate = [os.path.abspath(config.prefix), _get_size()]
+    else:
+        for name in modules:
+            try:
+                _estimate[1] += os.path.getsize(os.path.join(config.prefix, "{0}.so".format(name)))
+            except OSError:
+                pass
+    if _estimate[1] <= config.cachebudget:
+        return 0
+    removed = prune(keep=list(modules) + list(keep))
+    _estimate = [os.path.abspath(config.prefix), _get_size()]
+    return removed
+
+
+def touch(*filenames):
+    """
+    Marks the given files in ``hope.config.prefix`` as used by updating their modification time.
+
+    :param filenames: names of the files relative to ``hope.config.prefix``
+    """
+    for filename in filenames:
+        try:
+            os.utime(os.path.join(config.prefix, filename), None)
+        except OSError:
+            pass
+
+
+@contextlib.contextmanager
+def lock(name):
+    """
+    Holds an exclusive lock on the module ``name`` in ``hope.config.prefix``, so only one process or thread
+    compiles it at a time. Blocks until the lock is acquired.
+
+    :param name: name of the module
+    """
+    with open(os.path.join(config.prefix, "{0}.lock".format(name)), "a+") as fp:
+        if fcntl is not None:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        else:
+            import msvcrt
+            while True:
+                try:
+                    msvcrt.locking(fp.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except (IOError, OSError):
+                    time.sleep(0.1)
+        # closing the file releases the lock
+        yield
+
+
+def publish(path, filename):
+    """
+    Moves a file into ``hope.config.prefix`` by an atomic rename, so other processes never see a partially
+    written file. The file needs to be on the same file system as the prefix.
+
+    :param path: path of the file to move
+    :param filename: name of the file in ``hope.config.prefix``
+    """
+    getattr(os, "replace", os.rename)(path, os.path.join(config.prefix, filename))
+
+
+def find(filename):
+    """
+    Returns the path of a file in ``hope.config.prefix`` or, if it is not there, in the first of the read-only
+    folders ``hope.config.readonlyprefixes`` containing it.
+
+    :param filename: name of the file
+
+    :return path: the path of the file or None if no folder contains it
+    """
+    for prefix in [config.prefix] + list(config.readonlyprefixes):
+        if os.path.isfile(os.path.join(prefix, filename)):
+            return os.path.join(prefix, filename)
+    return None
+
+
+def load_state(name):
+    """
+    Reads the state of a function stored by :py:meth:`hope._wrapper.Wrapper._publish_state`. If
+    ``hope.config.index`` is set, the state is read from the index, else from its own file. The folders
+    ``hope.config.readonlyprefixes`` are searched after ``hope.config.prefix``.
+
+    :param name: the name of the state
+
+    :return state: the state, None if there is none
+    """
+    if config.index is not None:
+        for prefix in [config.prefix] + list(config.readonlyprefixes):
+            states = _read_index(os.path.join(prefix, config.index), name)
+            if name in states:
+                return states[name]
+        return None
+
+    path = find("{0}.pck".format(name))
+    if path is None:
+        return None
+    with open(path, "rb") as fp:
+        return pickle.load(fp)
+
+
+def append_state(name, state):
+    """
+    Appends the state of a function to the index ``hope.config.index``. The last state appended for a name
+    replaces the previous ones.
+
+    :param name: the name of the state
+    :param state: the state
+    """
+    path = _get_index_path()
+    record = base64.b64encode(pickle.dumps([name, state], 2)) + b"\n"
+    with lock(os.path.basename(path)):
+        with open(path, "ab") as fp:
+            fp.write(record)
+    if path in _indices:
+        _indices[path][2][name] = state
+
+
+def read_index(path):
+    """
+    Reads all states of an index written by :py:func:`append_state`. Incomplete records are skipped.
+
+    :param path: path of the index
+
+    :return states: dict mapping the name to the state
+    """
+    try:
+        with open(path, "rb") as fp:
+            return _parse_index(fp.read())[0]
+    except (IOError, OSError):
+        return {}
+
+
+# the states of the indices read by this process as path: (inode, offset, states)
+_indices = {}
+
+def _read_index(path, name):
+    """
+    Returns the states of the index, which is read completely on the first call. Later calls only read the
+    records appended since, if the state ``name`` is missing.
+    """
+    inode, offset, states = _indices.get(path, (None, 0, {}))
+    if path in _indices and name in states:
+        return states
+    try:
+        with open(path, "rb") as fp:
+            stat = os.fstat(fp.fileno())
+            # the index has been compacted, so read it again
+            if stat.st_ino != inode or stat.st_size < offset:
+                offset, states = 0, {}
+            fp.seek(offset)
+            records, size = _parse_index(fp.read())
+    except (IOError, OSError):
+        return {}
+    states.update(records)
+    _indices[path] = (stat.st_ino, offset + size, states)
+    return states
+
+
+def _parse_index(data):
+    # a record is only complete with its line break
+    size = data.rfind(b"\n") + 1
+    states = {}
+    for line in data[:size].splitlines():
+        try:
+            name, state = pickle.loads(base64.b64decode(line))
+        except Exception:
+            continue
+        states[name] = state
+    return states, size
+
+
+def _compact_index():
+    """
+    Rewrites the index ``hope.config.index`` with the last state of each function, without the states
+    refering to a module which does not exist anymore.
+    """
+    if config.index is None or not os.path.isfile(_get_index_path()):
+        return
+    path = _get_index_path()
+    with lock(os.path.basename(path)):
+        records = b""
+        for name, state in sorted(read_index(path).items()):
+            if isinstance(state, dict) and all([find("{0}.so".format(module)) is not None for module, _ in state.get("modules", [])]):
+                records += base64.b64encode(pickle.dumps([name, state], 2)) + b"\n"
+        fd, temppath = tempfile.mkstemp(prefix="hope", dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(records)
+        getattr(os, "replace", os.rename)(temppath, path)
+
+
+def _get_index_path():
+    return os.path.join(config.prefix, config.index)
+
+
+def _get_size():
+    """
+    Returns the size of the files in ``hope.config.prefix`` in bytes without reading them.
+    """
+    size = 0
+    if not os.path.isdir(config.prefix):
+        return size
+    for filename in os.listdir(config.prefix):
+        try:
+            size += os.path.getsize(os.path.join(config.prefix, filename))
+        except OSError:
+            pass
+    return size
+
+
+def _get_entries(metadata=False):
+    """
+    Groups the files in ``hope.config.prefix`` by module. The states are added to the last module they refer to,
+    states refering to a module which does not exist anymore are invalid. The precompiled headers are grouped
+    like modules.
+
+    :param metadata: add the detected compiler flags, the hashes of the source files and the index of the
+        states, each under its own name
+
+    :return entries: dict mapping the module name to a tuple of the last access time, the size in bytes and
+        the paths of the files. The states without a module are stored under the key ``None``
+    """
+    entries = {}
+    if not os.path.isdir(config.prefix):
+        return entries
+
+    def add(name, path):
+        mtime, size, paths = entries.get(name, (0, 0, []))
+        entries[name] = (max(mtime, os.path.getmtime(path)), size + os.path.getsize(path), paths + [path])
+
+    filenames = os.listdir(config.prefix)
+    modules = [filename[:-3] for filename in filenames if filename.endswith(".so")] + [filename[:-2] for filename in filenames if filename.endswith(".h")]
+    for filename in filenames:
+        path = os.path.join(config.prefix, filename)
+        name, ext = os.path.splitext(filename)
+        if not os.path.isfile(path):
+            continue
+        elif ext in [".so", ".h"] or (ext in _MODULE_EXTENSIONS and name in modules):
+            add(name, path)
+        elif (ext == ".json" and name.startswith(("compiler_", "sources_"))) or filename == config.index:
+            if metadata:
+                add(filename, path)
+        elif filename.endswith(".h.gch"):
+            add(filename[:-6], path)
+        elif ext == ".pck":
+            try:
+                with open(path, "rb") as fp:
+                    state = pickle.load(fp)
+            except Exception:
+                continue
+            # objects stored by hope.serialize are no states
+            if isinstance(state, dict) and "modules" in state and "main" in state:
+                names = [name for name, _ in state["modules"]]
+                # states of this prefix may refer to modules in a read-only prefix
+                add(names[-1] if len(names) and all([name in modules or find("{0}.so".format(name)) is not None for name in names]) else None, path)
+    return entries
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
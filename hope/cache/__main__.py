@@ -0,0 +1,31 @@
+# Copyright (c) 2014 ETH Zurich, Institute of Astronomy, Lukas Gamper <lukas.gamper@usystems.ch>
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+
+import sys
+import argparse
+
+from hope import config
+from hope.cache import cache_info, cache_clear, prune
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m hope.cache", description="Manage the compiled modules of hope")
+    parser.add_argument("command", choices=["info", "prune", "clear"])
+    parser.add_argument("--prefix", default=config.prefix, help="folder of the cache (default: %(default)s)")
+    parser.add_argument("--budget", type=int, default=None, help="size of the cache in bytes to prune to (default: hope.config.cachebudget)")
+    args = parser.parse_args(argv)
+
+    config.prefix = args.prefix
+    if args.command == "info":
+        info = cache_info()
+        print("{0}: {1} modules, {2} bytes, budget {3} bytes".format(config.prefix, info.modules, info.size, info.budget))
+    elif args.command == "prune":
+        print("{0}: removed {1} bytes".format(config.prefix, prune(args.budget)))
+    else:
+        cache_clear()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
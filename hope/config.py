@@ -3,12 +3,11 @@
 from __future__ import print_function, division, absolute_import, unicode_literals
 
 
-from hope.options import get_cxxflags
-
 # Additional compiler flags, formated as array of strings
-cxxflags = get_cxxflags()
+cxxflags = None
 """ 
-List of c++ compiler flags. Normally hope does determing the right flags itself.
+List of c++ compiler flags. If ``None``, hope determines the right flags for the compiler on the first
+compilation and stores them in ``prefix``.
 """
 
 #TODO implement
@@ -43,5 +42,73 @@ Disable hope. If hope.config.hopeless is True, hope.jit return the original func
 Use this function for debug purpos
 """
 
+background = False
+"""
+Compile new signatures in a background thread. Until the compiled function is ready, the
+original python function is called. Signatures which failed to compile keep on calling the python function.
+"""
+
+tiered = False
+"""
+Compile new signatures without optimizations first, which is faster. The optimized module is compiled
+in a background thread and replaces the quick build once it is ready.
+"""
+
+nogil = False
+"""
+Release the GIL while the compiled function is running. Allocating arrays reacquires the GIL.
+Can be overwritten per function with ``hope.jit(nogil=True)``.
+"""
+
+parallel = False
+"""
+Run the loops over arrays and the ``numpy.sum`` reductions in parallel using OpenMP. The module is compiled
+with ``-fopenmp``. Has no effect if ``rangecheck`` is set.
+"""
+
+parallelthreshold = 100000
+"""
+Minimal number of elements a loop needs to have to be run in parallel. Does not change the compiled modules,
+the value is applied to all functions each time a function is compiled or loaded.
+"""
+
+cachebudget = 1 << 30
+"""
+Size of the compiled modules in ``prefix`` in bytes. If a new module exceeds the budget, the least recently
+used modules are removed. If ``None``, the modules are never removed.
+"""
+
+manifest = "manifest.jsonl"
+"""
+Name of the file in ``prefix`` each compiled signature is recorded in, an absolute path places the file
+elsewhere. The recorded signatures can be compiled at startup with ``hope.warmup``. If ``None``, the
+signatures are not recorded.
+"""
+
+readonlyprefixes = []
+"""
+List of folders with modules and states compiled in advance, e.g. with ``python -m hope.aot``, which are
+searched in order after ``prefix``. The folders are never written to, new modules are compiled into ``prefix``.
+"""
+
+index = None
+"""
+Name of the file in ``prefix`` the states of all jitted functions are stored in, an absolute path places the
+file elsewhere. The file is read once on the first use, which is faster than reading a file per function on
+network file systems. If ``None``, each state is stored in its own file.
+"""
+
+server = None
+"""
+Path of the unix socket of a compile server started with ``python -m hope.server``. If set, the modules are
+compiled by the server, so processes using the same server share the compiled modules. If the server fails,
+the modules are compiled locally.
+"""
+
+streamchunk = 1 << 20
+"""
+Number of elements along the first axis ``hope.stream`` passes to the function per call.
+"""
+
 # make readable cpp file, but typecasting is not exactly the same as in numpy - this flag is private
 _readablecxx = False
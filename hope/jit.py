@@ -4,17 +4,18 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 
 
 import os
-import sys
 import hashlib
 import inspect
 import warnings
+import importlib
 
-from hope._wrapper import Wrapper
+from hope._wrapper import Callback, Wrapper
 import hope._cache as cache
 from hope import config
-from hope import serialization
+from hope.cache import load_state, touch
 from hope._wrapper import get_config_attrs
 from hope._wrapper import get_fkt_hash
+from hope._wrapper import _add_import_paths
 
 # TODO: add test for hope.pow
 # TODO: add test and doc for additional numpy functions
@@ -41,12 +42,14 @@ from hope._wrapper import get_fkt_hash
 # 		http://docs.sympy.org/latest/modules/core.html#module-sympy.core.sympify
 
 
-def jit(fkt):
+def jit(fkt=None, nogil=None):
     """
     Compiles a function to native code and return the optimized function. The new function has the performance of a compiled function written in C.
 
     :param fkt: function to compile to c
     :type fkt: function
+    :param nogil: release the GIL while the compiled function runs, defaults to ``hope.config.nogil``
+    :type nogil: bool
     :returns: function -- optimized function
 
     This function can either be used as decorator
@@ -64,8 +67,23 @@ def jit(fkt):
         def sum(x, y):
             return x + y
         sum_opt = jit(sum)
+
+    To release the GIL during the execution of the compiled function, pass ``nogil``
+
+    .. code-block:: python
+
+        @jit(nogil=True)
+        def sum(x, y):
+            return x + y
+
+    Like python functions, jitted functions are pickled by reference to the name of the python function in
+    its module, e.g. to pass them to a ``multiprocessing.Pool``. The other process loads the compiled function
+    from ``hope.config.prefix`` instead of compiling it again.
     """
 
+    if fkt is None:
+        return lambda fkt: jit(fkt, nogil)
+
     if config.hopeless:
         return fkt
 
@@ -73,54 +91,113 @@ def jit(fkt):
     if argspec.varargs is not None or argspec.keywords is not None:
         raise ValueError("Jitted functions should not have *args or **kwargs")
 
-    hash = hashlib.sha224(inspect.getsource(fkt).encode('utf-8')).hexdigest()
+    hash = _get_hash(fkt, nogil)
     filename = "{0}_{1}".format(fkt.__name__, hash)
 
-    if not os.path.exists(config.prefix):
-        os.makedirs(config.prefix)
-
-    if not config.prefix in sys.path:
-        sys.path.append(os.path.abspath(config.prefix))
+    # the functions can be loaded from the read-only prefixes even if the prefix can not be created
+    try:
+        if not os.path.exists(config.prefix):
+            os.makedirs(config.prefix)
+    except OSError:
+        pass
+    _add_import_paths()
 
-    wrapper = Wrapper(fkt, hash)
+    wrapper = Wrapper(fkt, hash, nogil)
+    # the decorator binds the returned function to the name of the python function
+    wrapper.bindings.append([fkt.__module__, getattr(fkt, "__qualname__", None)])
 
     try:
-        state = serialization.unserialize(filename)
+        state = load_state(filename)
         if not state is None:
             _check_state(fkt, state)
         else:
             raise ImportError("No state found.")
 
-        if sys.version_info[0] == 2:
-            module = __import__(state["filename"], globals(), locals(), [], -1)
-        else:
-            import importlib
-            module = importlib.import_module(state["filename"])
-
-        if "bound" in state and state["bound"]:
-            def _hope_callback(*args):
-                return module.run(*args)
-            setattr(cache, str(id(_hope_callback)), fkt)
-            return _hope_callback
+        wrapper._load(state)
+        touch("{0}.pck".format(filename))
+
+        if state["bound"]:
+            # python 2 has no instance method, so go through the python callback
+            if wrapper.method is None:
+                return wrapper.callback
+            wrapper._register(wrapper.method)
+            return wrapper.method
         else:
-            module.set_create_signature(wrapper.create_signature)
-            setattr(cache, str(id(module.run)), fkt)
-            return module.run
+            wrapper._register(wrapper.cache)
+            return wrapper.cache
 
     except LookupError as le:
         if config.verbose:
             warnings.warn("Recompiling... Reason: {0}".format(le))
-        wrapper._recompile = True
         return wrapper.callback
-    except ImportError as ie:
+    except ImportError:
         return wrapper.callback
 
+def _load(modulename, qualname, nogil=None):
+    """
+    Returns the jitted function a pickled jitted function refers to. If the module binds the python function,
+    e.g. if the function was jitted with ``hope.jit(fkt)`` instead of the decorator, the function is jitted,
+    which loads the compiled function from ``hope.config.prefix``.
+
+    :param modulename: the name of the module of the python function
+    :param qualname: the qualified name of the python function in its module
+    :param nogil: the ``nogil`` argument passed to :py:func:`jit`
+
+    :return fkt: the jitted function
+    """
+    fkt = importlib.import_module(modulename)
+    for name in qualname.split("."):
+        fkt = getattr(fkt, name)
+    if inspect.isfunction(fkt):
+        return jit(fkt, nogil)
+    return fkt
+
+class _Bound(object):
+    """
+    The object a restored dispatching function is looked up on, see :py:func:`_load_dispatcher`.
+    """
+    def __init__(self, name, fkt):
+        setattr(self, name, fkt)
+
+def _load_dispatcher(modulename, qualname, nogil=None):
+    """
+    Restores the dispatcher of a pickled dispatching function. Pickle looks up the dispatching function by its
+    name on the restored dispatcher, so the returned object has the jitted function as attribute named like the
+    python function, see :py:func:`hope._wrapper._reduce_dispatcher`.
+
+    :param modulename: the name of the module of the python function
+    :param qualname: the qualified name of the python function in its module
+    :param nogil: the ``nogil`` argument passed to :py:func:`jit`
+
+    :return bound: the object having the jitted function as attribute, see :py:func:`_load`
+    """
+    return _Bound(qualname.split(".")[-1], _load(modulename, qualname, nogil))
+
+def _get_hash(fkt, nogil=None):
+    """
+    Returns the hash of the source of the function and the options passed to :py:func:`jit`, which names
+    the state of the function in ``hope.config.prefix``
+
+    :param fkt: the python function
+    :param nogil: the ``nogil`` argument passed to :py:func:`jit`
+
+    :return hash: the sha224 hash code
+    """
+    if nogil is None:
+        return get_fkt_hash(fkt)
+    return hashlib.sha224("nogil={0}\n{1}".format(nogil, get_fkt_hash(fkt)).encode('utf-8')).hexdigest()
+
+# options which change where and when the modules are compiled or how they are run, but not the modules
+_IGNORED_ATTRS = ("prefix", "readonlyprefixes", "cachebudget", "manifest", "index", "server", "background", "tiered", "parallelthreshold", "streamchunk")
+
 def _check_state(fkt, state):
     for name in get_config_attrs():
+        if name in _IGNORED_ATTRS:
+            continue
         if name not in state or state[name] != getattr(config, name):
             raise LookupError("State is inconsistent with config. Inconsistent state key: [{0}].".format(name))
         
-    if "main" not in state or "called" not in state or state["main"] != fkt.__name__:
+    if "modules" not in state or "main" not in state or "called" not in state or state["main"] != fkt.__name__:
         raise LookupError("State is inconsistent")
     
     for name, value in list((state["called"] if "called" in state else {}).items()):
@@ -130,13 +207,13 @@ def _check_state(fkt, state):
 
         glob_fkt = fkt.__globals__[name]
         if isinstance(glob_fkt, Wrapper):
-            if "filename" in state and get_fkt_hash(glob_fkt.fkt) != value:
+            if "modules" in state and get_fkt_hash(glob_fkt.fkt) != value:
                 raise LookupError("State is inconsistent. Hash(sha224) has changed")
-        elif inspect.isbuiltin(glob_fkt) and hasattr(cache, str(id(glob_fkt))):
-            if "filename" in state and get_fkt_hash(getattr(cache, str(id(glob_fkt)))) != value:
+        elif (inspect.isbuiltin(glob_fkt) or isinstance(glob_fkt, Callback)) and hasattr(cache, str(id(glob_fkt))):
+            if "modules" in state and get_fkt_hash(getattr(cache, str(id(glob_fkt)))) != value:
                 raise LookupError("State is inconsistent. Hash(sha224) has changed")
         elif inspect.isfunction(glob_fkt):
-            if "filename" in state and get_fkt_hash(glob_fkt) != value:
+            if "modules" in state and get_fkt_hash(glob_fkt) != value:
                 raise LookupError("State is inconsistent. Hash(sha224) of called function '%s' has changed"%name)
-        elif "filename" in state:
+        elif "modules" in state:
             raise LookupError("State is inconsistent.")
@@ -3,6 +3,11 @@
 from __future__ import print_function, division, absolute_import, unicode_literals
 
 
+import os
+import json
+import hashlib
+import tempfile
+
 from hope.exceptions import UnsupportedCompilerException
 
 CXX_FLAGS = {
@@ -31,7 +36,8 @@ def enableUnsaveMath():
         using these flags, ``nan`` and ``inf`` are not propageted properly.
         Only use these flags if you know what you are doing!
     """
-    config.cxxflags += ["-fassociative-math", "-ffast-math"]
+    from hope import config
+    config.cxxflags = (get_default_cxxflags() if config.cxxflags is None else config.cxxflags) + ["-fassociative-math", "-ffast-math"]
 
 
 # Disable faster but unsecure Math
@@ -39,8 +45,68 @@ def disableUnsaveMath():
     """
     Disable the fast-math and associative-math flags in the c++ compiler.
     """
-    del config.cxxflags[config.cxxflags.index("-ffast-math")]
-    del config.cxxflags[config.cxxflags.index("-fassociative-math")]
+    from hope import config
+    if config.cxxflags is not None:
+        config.cxxflags = [flag for flag in config.cxxflags if flag not in ("-ffast-math", "-fassociative-math")]
+
+
+_default_cxxflags = {}
+
+def get_default_cxxflags():
+    """
+    Returns the flags of :py:func:`get_cxxflags` for the compiler python extensions are built with. The flags
+    are only determined once per compiler and stored in ``hope.config.prefix``, named by the path and the
+    modification time of the compiler, so later processes do not need to run the compiler.
+
+    :return flags: list of compiler flags
+    """
+    from hope import config
+    from hope.cache import publish
+
+    key = _get_compiler_key()
+    if key in _default_cxxflags:
+        return list(_default_cxxflags[key])
+
+    path = os.path.join(config.prefix, "compiler_{0}.json".format(key))
+    try:
+        with open(path) as fp:
+            flags = json.load(fp)
+    except (IOError, OSError, ValueError):
+        flags = get_cxxflags()
+        if os.path.isdir(config.prefix):
+            fd, temppath = tempfile.mkstemp(prefix="hope", dir=config.prefix)
+            with os.fdopen(fd, "w") as fp:
+                json.dump(flags, fp)
+            publish(temppath, os.path.basename(path))
+
+    _default_cxxflags[key] = list(flags)
+    return list(flags)
+
+def _get_compiler_key():
+    """
+    Returns a hash of the c compiler python extensions are built with, its path and modification time, without
+    running the compiler.
+
+    :return key: the sha224 hash code
+    """
+    import sysconfig
+    import platform
+    from hope import config
+
+    compiler = os.environ.get("CC") or sysconfig.get_config_var("CC") or "cc"
+    executable = compiler.split()[0]
+    path = executable
+    if not os.path.dirname(executable):
+        for folder in os.environ.get("PATH", "").split(os.pathsep):
+            if os.path.isfile(os.path.join(folder, executable)):
+                path = os.path.join(folder, executable)
+                break
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    key = [compiler, os.path.realpath(path), mtime, platform.system(), getattr(config, "version", None)]
+    return hashlib.sha224(json.dumps(key).encode("utf-8")).hexdigest()
 
 
 # HOPE requires the compiler to compile with c++11 features enabled
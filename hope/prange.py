@@ -0,0 +1,19 @@
+# Copyright (c) 2014 ETH Zurich, Institute of Astronomy, Lukas Gamper <lukas.gamper@usystems.ch>
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+
+import sys
+
+
+def prange(*args):
+    """
+    Iterates over a range like ``range``. In a jitted function, the iterations of a for loop over
+    ``prange`` are distributed over several threads using OpenMP. Scalars declared outside the loop may
+    only be updated by ``+=``, ``*=``, ``x = min(x, ...)`` or ``x = max(x, ...)``, which are reduced
+    over all threads.
+
+    :param args: ``upper`` or ``lower, upper``
+    :type args: int
+    """
+    return xrange(*args) if sys.version_info[0] == 2 else range(*args)
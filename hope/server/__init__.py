@@ -0,0 +1,148 @@
+# Copyright (c) 2014 ETH Zurich, Institute of Astronomy, Lukas Gamper <lukas.gamper@usystems.ch>
+
+"""
+Compiles the generated modules of several processes on the same host in one server, e.g. on a shared
+analysis node where many users compile the same functions::
+
+    python -m hope.server --socket /tmp/hope.sock --prefix /scratch/hope
+
+The processes pass the path of the socket in ``hope.config.server``. The server keeps the build environment
+and the precompiled headers of the preamble, compiles each distinct module only once and returns the path
+of the shared object in its prefix, which the processes copy into their own ``hope.config.prefix``.
+Processes sending the same module while it is compiled wait for the result. If the server can not be
+reached, the processes compile the modules themselves.
+
+The server compiles any code sent to it, so the socket must only be accessible to trusted users. By
+default only the user running the server can connect, use ``--mode 660`` to share it with a group. The
+prefix of the server needs to be readable by the users of the server.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+
+import os
+import re
+import json
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from hope import config
+
+
+def submit(code, name, openmp=False, quick=False):
+    """
+    Sends the generated code to the compile server ``hope.config.server`` and waits for the compiled module.
+
+    :param code: the generated c++ code
+    :param name: the name of the module
+    :param openmp: compile and link with OpenMP
+    :param quick: compile without optimizations
+
+    :raises IOError: if the server can not be reached or uses a different build environment
+    :raises Exception: if the server fails to compile the code
+
+    :return path: the path of the shared object in the prefix of the server
+    """
+    from hope._wrapper import get_code_hash
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(config.server)
+        request = {"env": get_code_hash(""), "name": name, "code": code, "openmp": openmp, "quick": quick}
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as fp:
+            reply = json.loads(fp.readline().decode("utf-8"))
+    finally:
+        sock.close()
+
+    if "rejected" in reply:
+        raise IOError(reply["rejected"])
+    elif "error" in reply:
+        raise Exception(reply["error"])
+    return reply["path"]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Handles one request of :py:func:`submit`: a json line with the code, answered by a json line with
+    the path of the shared object, the compiler error or the reason the request has been rejected.
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+            reply = {"path": self.server.compile(request["env"], request["name"], request["code"], bool(request["openmp"]), bool(request["quick"]))}
+        except (KeyError, ValueError) as ex:
+            reply = {"rejected": "Invalid request: {0}".format(ex)}
+        except Exception as ex:
+            reply = {"error": str(ex)}
+        self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Compiles the modules sent by :py:func:`submit` into ``hope.config.prefix``.
+
+    :param path: path of the unix socket
+    :param workers: number of modules compiled at the same time
+    :param mode: permissions of the socket
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, workers=None, mode=0o600):
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                # a socket left by a server which has been killed
+                os.remove(path)
+            else:
+                raise Exception("A compile server is already running on {0}".format(path))
+            finally:
+                probe.close()
+
+        if not os.path.exists(config.prefix):
+            os.makedirs(config.prefix)
+
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        os.chmod(path, mode)
+        self.workers = threading.Semaphore(workers or os.sysconf(str("SC_NPROCESSORS_ONLN")))
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+    def compile(self, env, name, code, openmp=False, quick=False):
+        """
+        Compiles the code into ``hope.config.prefix`` unless the same code has already been compiled.
+
+        :param env: the hash of the build environment of the client, see :py:func:`hope._wrapper.get_code_hash`
+        :param name: the name of the module
+        :param code: the generated c++ code
+        :param openmp: compile and link with OpenMP
+        :param quick: compile without optimizations
+
+        :raises ValueError: if the client uses a different build environment or the name is invalid
+        :raises Exception: if the code does not compile
+
+        :return path: the path of the shared object
+        """
+        from hope._wrapper import get_code_hash, _build_library, _get_preamble
+
+        if env != get_code_hash(""):
+            raise ValueError("the compile server uses a different compiler, python or numpy")
+        if re.match(r"^\w+$", name) is None:
+            raise ValueError("invalid module name {0}".format(name))
+
+        # the stored module is named by the hash of the code, so a client can not replace the module of another
+        with self.workers:
+            _get_preamble(openmp, quick)
+            return os.path.abspath(_build_library(code, "{0}_{1}".format(name, get_code_hash(code, openmp, quick)), name, openmp, quick))
@@ -0,0 +1,35 @@
+# Copyright (c) 2014 ETH Zurich, Institute of Astronomy, Lukas Gamper <lukas.gamper@usystems.ch>
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+
+import sys
+import argparse
+
+from hope import config
+from hope.server import CompileServer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m hope.server", description="Compile the modules of several processes using hope")
+    parser.add_argument("--socket", default="hope.sock", help="path of the unix socket (default: %(default)s)")
+    parser.add_argument("--prefix", default=config.prefix, help="folder to store the modules in (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="number of modules compiled at the same time (default: number of cpus)")
+    parser.add_argument("--mode", default="600", help="permissions of the socket in octal (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    config.prefix = args.prefix
+    config.server = None
+    server = CompileServer(args.socket, args.workers, int(args.mode, 8))
+    print("{0}: compiling into {1}".format(args.socket, config.prefix))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# Copyright (c) 2014 ETH Zurich, Institute of Astronomy, Lukas Gamper <lukas.gamper@usystems.ch>
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+
+import mmap
+import threading
+import numpy as np
+
+from hope import config
+
+
+def stream(fkt, *args, **kwargs):
+    """
+    Calls the jitted element-wise function ``fkt`` on aligned chunks of the passed arrays, e.g. to process
+    memory-mapped arrays which are larger than the memory. All arrays are split along their first axis,
+    which needs to have the same length, non-array arguments are passed to every call unchanged.
+
+    Read-only arrays like memmaps opened with ``mode="r"`` are read into two buffers, while ``fkt`` runs
+    on one buffer, the next chunk is read into the other buffer by a background thread. Writeable arrays
+    are passed as views, so ``fkt`` writes to them in place. The pages of the next chunk of writeable,
+    C-contiguous memmaps are loaded by the background thread, other writeable arrays are not read ahead.
+    Since the last chunk is a view of the same buffers, all calls use the same compiled signature. To overlap
+    reading and computing, ``fkt`` needs to be jitted with ``nogil=True``.
+
+    :param fkt: the jitted function
+    :param args: the arguments to pass to ``fkt``
+    :param chunk: (optional) number of elements along the first axis per call, defaults to
+        ``hope.config.streamchunk``
+    :type chunk: int
+
+    :raises ValueError: if the chunk is not positive
+    """
+    chunk = kwargs.pop("chunk", None)
+    if len(kwargs):
+        raise TypeError("stream() got an unexpected keyword argument '{0}'".format(list(kwargs.keys())[0]))
+    if chunk is None:
+        chunk = config.streamchunk
+    if chunk <= 0:
+        raise ValueError("The chunk passed to stream needs to be positive: {0}".format(chunk))
+
+    arrays = [arg for arg in args if isinstance(arg, np.ndarray)]
+    if len(arrays) == 0:
+        raise Exception("At least one array needs to be passed to stream")
+    size = len(arrays[0])
+    for arr in arrays:
+        if arr.ndim == 0 or len(arr) != size:
+            raise Exception("All arrays passed to stream need to have the same length along the first axis")
+
+    readonly = [idx for idx, arg in enumerate(args) if isinstance(arg, np.ndarray) and not arg.flags.writeable]
+    prefetched = [idx for idx, arg in enumerate(args) if isinstance(arg, np.memmap) and arg.flags.writeable and arg.flags.c_contiguous]
+    buffers = [dict([(idx, np.empty((min(chunk, size),) + args[idx].shape[1:], args[idx].dtype)) for idx in readonly]) for _ in range(2)]
+    errors = []
+
+    def read(buffer, start, stop):
+        try:
+            for idx in readonly:
+                np.copyto(buffer[idx][:stop - start], args[idx][start:stop])
+            # reading one byte per page loads the pages of the writeable memmaps, the reduction releases the GIL
+            for idx in prefetched:
+                np.add.reduce(args[idx][start:stop].reshape(-1).view(np.uint8)[::mmap.PAGESIZE])
+        except Exception as ex:
+            errors.append(ex)
+
+    reader = None
+    try:
+        for start in range(0, size, chunk):
+            stop, buffer = min(start + chunk, size), buffers[start // chunk % 2]
+            if reader is None:
+                read(buffer, start, stop)
+            else:
+                reader.join()
+            if len(errors):
+                raise errors[0]
+            if stop < size:
+                reader = threading.Thread(target=read, args=(buffers[stop // chunk % 2], stop, min(stop + chunk, size)))
+                reader.daemon = True
+                reader.start()
+            fkt(*[buffer[idx][:stop - start] if idx in buffer else arg[start:stop] if isinstance(arg, np.ndarray) else arg for idx, arg in enumerate(args)])
+    finally:
+        # the buffers must not be written after returning
+        if reader is not None:
+            reader.join()
@@ -0,0 +1,154 @@
+# Copyright (C) 2014 ETH Zurich, Institute for Astronomy
+
+"""
+Test ahead of time compilation for `hope` module.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import os
+import json
+import inspect
+import hope
+import pytest
+import numpy as np
+
+from hope import aot, _wrapper
+from hope.aot.__main__ import main
+from test.utilities import check, setup_module, setup_method, teardown_module
+
+@pytest.fixture
+def prefix(request, tmpdir):
+    prefix, compile = hope.config.prefix, _wrapper._compile
+    hope.config.prefix = str(tmpdir.join("prefix"))
+    def fin():
+        hope.config.prefix, _wrapper._compile = prefix, compile
+    request.addfinalizer(fin)
+    return hope.config.prefix
+
+compile = _wrapper._compile
+
+def fail_compile(*args):
+    raise Exception("Compiled at runtime")
+
+def fkt_aot(a, b, n):
+    b[:] = a * n
+
+@hope.jit
+def fkt_aot_jit(a):
+    return a + 1
+
+@hope.jit(nogil=True)
+def fkt_aot_nogil(a):
+    return a + 2
+
+def test_signature_roundtrip():
+    args = [1, 1., np.bool_(True), np.float32(1), np.zeros(3), np.zeros((3, 4), dtype=np.int8), np.zeros((3, 4)).T]
+    types = ["int", "float", "bool_", "float32", "float64^1", "int8^2", "float64^2s"]
+    from hope._transformer import ASTTransformer
+    from hope._ast import Module
+    modtoken = Module(fkt_aot.__name__)
+    def fkt(a, b, c, d, e, f, g): return a
+    ASTTransformer(modtoken).module_visit(fkt, args)
+    assert aot.format_signature(modtoken.functions["fkt"][0].signature) == types
+    assert [type(arg) for arg in aot.parse_signature(types)][:4] == [int, float, np.bool_, np.float32]
+    assert [(arg.dtype, arg.ndim, arg.flags.c_contiguous) for arg in aot.parse_signature(types)[4:]] \
+        == [(np.float64, 1, True), (np.int8, 2, True), (np.float64, 2, False)]
+
+def test_precompile(prefix):
+    aot.precompile(fkt_aot, [["float64^1", "float64^1", "int"]])
+    aot.precompile(fkt_aot, [["float32^1", "float32^1", "float"]])
+    _wrapper._compile = fail_compile
+    hfkt = hope.jit(fkt_aot)
+    assert inspect.isbuiltin(hfkt)
+    for dtype, n in [(np.float64, 2), (np.float32, 2.)]:
+        a, b = np.arange(10, dtype=dtype), np.empty(10, dtype=dtype)
+        hfkt(a, b, n)
+        assert check(b, a * n)
+
+def test_readonly(prefix):
+    aot.precompile(fkt_aot, [["float64^1", "float64^1", "int"]])
+    system, before = prefix, sorted(os.listdir(prefix))
+    hope.config.prefix, hope.config.readonlyprefixes = os.path.join(os.path.dirname(prefix), "user"), [system]
+    try:
+        _wrapper._compile = fail_compile
+        hfkt = hope.jit(fkt_aot)
+        assert inspect.isbuiltin(hfkt)
+        a, b = np.arange(10.), np.empty(10)
+        hfkt(a, b, 2)
+        assert check(b, a * 2)
+        # new signatures are compiled into the writable prefix
+        _wrapper._compile = compile
+        a, b = np.arange(10, dtype=np.float32), np.empty(10, dtype=np.float32)
+        hfkt(a, b, 2.)
+        assert check(b, a * 2.)
+        assert sorted(os.listdir(system)) == before
+        assert len([name for name in os.listdir(hope.config.prefix) if name.startswith("fkt_aot_") and name.endswith(".so")]) == 1
+        _wrapper._compile = fail_compile
+        hfkt = hope.jit(fkt_aot)
+        hfkt(a, b, 3.)
+        assert check(b, a * 3.)
+    finally:
+        hope.config.readonlyprefixes = []
+
+def test_recorded(prefix):
+    hope.jit(fkt_aot)(np.arange(10.), np.empty(10), 2)
+    assert aot.recorded_signatures(fkt_aot, prefix) == [["float64^1", "float64^1", "int"]]
+    hope.config.prefix = os.path.join(os.path.dirname(prefix), "aot")
+    main(["test.test_aot", "--recorded", prefix, "--prefix", hope.config.prefix])
+    _wrapper._compile = fail_compile
+    b = np.empty(10)
+    hope.jit(fkt_aot)(np.arange(10.), b, 2)
+    assert check(b, np.arange(10.) * 2)
+
+def test_recorded_nogil(prefix):
+    hope.jit(fkt_aot, nogil=True)(np.arange(10.), np.empty(10), 2)
+    hope.config.prefix = os.path.join(os.path.dirname(prefix), "aot")
+    main(["test.test_aot", "--recorded", prefix, "--prefix", hope.config.prefix])
+    _wrapper._compile = fail_compile
+    hfkt = hope.jit(fkt_aot, nogil=True)
+    assert inspect.isbuiltin(hfkt)
+    b = np.empty(10)
+    hfkt(np.arange(10.), b, 3)
+    assert check(b, np.arange(10.) * 3)
+
+def test_main_spec(prefix, tmpdir):
+    spec = str(tmpdir.join("spec.json"))
+    with open(spec, "w") as fp:
+        json.dump({"fkt_aot_jit": [["int"], ["float64^2"]], "fkt_aot_nogil": [["int"]]}, fp)
+    main(["test.test_aot", "--spec", spec, "--prefix", prefix])
+    _wrapper._compile = fail_compile
+    hfkt = hope.jit(getattr(hope._cache, str(id(fkt_aot_jit))))
+    assert hfkt(1) == 2
+    assert check(hfkt(np.ones((2, 3))), np.ones((2, 3)) + 1)
+    # each function is compiled with the nogil option it is jitted with
+    hfkt = hope.jit(getattr(hope._cache, str(id(fkt_aot_nogil))), nogil=True)
+    assert inspect.isbuiltin(hfkt)
+    assert hfkt(1) == 3
+
+def fkt_warmup(a, n):
+    return a * n
+
+def test_record(prefix):
+    hfkt = hope.jit(fkt_warmup)
+    hfkt(np.ones(3), 2)
+    hfkt(2., 3)
+    hfkt(np.ones(3), 2.)
+    entries = aot.read_manifest(os.path.join(prefix, hope.config.manifest))
+    assert [entry["signature"] for entry in entries] == [["float64^1", "int"], ["float", "int"], ["float64^1", "float"]]
+    assert all([entry["module"] == __name__ and entry["name"] == "fkt_warmup" and entry["nogil"] is None for entry in entries])
+    hope.cache_clear()
+    assert not os.path.exists(os.path.join(prefix, hope.config.manifest))
+    hope.jit(fkt_warmup)(2., 3)
+    assert [entry["signature"] for entry in aot.read_manifest(os.path.join(prefix, hope.config.manifest))] == [["float", "int"]]
+
+def test_warmup(prefix):
+    hope.jit(fkt_warmup)(np.ones(3), 2)
+    hope.jit(fkt_warmup)(2., 3)
+    manifest = os.path.join(prefix, hope.config.manifest)
+    hope.config.prefix = os.path.join(os.path.dirname(prefix), "warm")
+    assert hope.warmup(manifest, 2) == 2
+    _wrapper._compile = fail_compile
+    hfkt = hope.jit(fkt_warmup)
+    assert inspect.isbuiltin(hfkt)
+    assert check(hfkt(np.ones(3), 2), np.ones(3) * 2)
+    assert hfkt(2., 3) == 6.
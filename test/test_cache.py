@@ -0,0 +1,194 @@
+# Copyright (C) 2014 ETH Zurich, Institute for Astronomy
+
+"""
+Test the cache of compiled modules for `hope` module.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import os
+import hope
+import pytest
+import multiprocessing
+import numpy as np
+from mock import patch
+
+from hope import cache, serialization
+from hope.cache.__main__ import main
+from test.utilities import setup_module, setup_method, teardown_module
+
+@pytest.fixture
+def prefix(request, tmpdir):
+    prefix, cachebudget, manifest = hope.config.prefix, hope.config.cachebudget, hope.config.manifest
+    hope.config.prefix, hope.config.manifest = str(tmpdir), None
+    def fin():
+        hope.config.prefix, hope.config.cachebudget, hope.config.manifest = prefix, cachebudget, manifest
+    request.addfinalizer(fin)
+    return str(tmpdir)
+
+def fkt_cache_a(a):
+    return a + 1
+
+def fkt_cache_b(a):
+    return a + 1
+
+def test_cache_info(prefix):
+    assert hope.cache_info() == (0, 0, hope.config.cachebudget)
+    hfkt = hope.jit(fkt_cache_a)
+    assert hfkt(1) == 2
+    assert hfkt(np.float64(1)) == 2
+    info = hope.cache_info()
+    # one module per signature and the runtime shared by all functions
+    assert info.modules == 3
+    assert info.size == sum([os.path.getsize(os.path.join(prefix, name)) for name in os.listdir(prefix)])
+
+def test_cache_content_hash(prefix):
+    def fkt(a):
+        return a + 1
+    assert hope.jit(fkt)(1) == 2
+    def fkt(a):
+        return  a + 1 # same code
+    assert hope.jit(fkt)(1) == 2
+    assert len([name for name in os.listdir(prefix) if name.endswith(".pck")]) == 2
+    assert hope.cache_info().modules == 2
+
+def test_cache_clear(prefix):
+    serialization.serialize({"test": 1}, "obj")
+    hope.jit(fkt_cache_a)(1)
+    hope.cache_clear()
+    assert hope.cache_info().modules == 0
+    assert os.listdir(prefix) == ["obj.pck"]
+    assert hope.jit(fkt_cache_a)(1) == 2
+
+def test_cache_prune(prefix):
+    hope.jit(fkt_cache_a)(1)
+    hope.jit(fkt_cache_b)(1)
+    older = [name for name in os.listdir(prefix) if name.startswith("fkt_cache_a")]
+    for name in older:
+        os.utime(os.path.join(prefix, name), (0, 0))
+    size = hope.cache_info().size
+    assert cache.prune(size) == 0
+    assert cache.prune(size - 1) > 0
+    assert all([not name.startswith("fkt_cache_a") for name in os.listdir(prefix)])
+    assert hope.cache_info().modules == 2
+    main(["prune", "--prefix", prefix, "--budget", "0"])
+    # the runtime and the precompiled headers every module depends on, the detected compiler flags and the
+    # hashes of the sources are kept
+    assert hope.cache_info().modules == 1
+    assert all([name.endswith(".json") or name.startswith(("hope_runtime_", "hope_preamble_")) for name in os.listdir(prefix)])
+    assert hope.jit(fkt_cache_b)(1) == 2
+
+def test_cache_prune_lock(prefix):
+    hope.jit(fkt_cache_a)(1)
+    with patch("hope.cache.lock", wraps=cache.lock) as lock_mock:
+        assert cache.prune(0) > 0
+    locked = [args[0] for args, _ in lock_mock.call_args_list]
+    assert len(locked) == 1 and locked[0].startswith("fkt_cache_a")
+    assert not any([name.startswith("fkt_cache_a") for name in os.listdir(prefix)])
+
+def test_cache_budget(prefix):
+    hope.config.cachebudget = 0
+    hfkt = hope.jit(fkt_cache_a)
+    assert hfkt(1) == 2
+    assert hfkt(1.) == 2.
+    assert hope.cache_info().modules == 2
+
+def test_cache_account(prefix):
+    hfkt = hope.jit(fkt_cache_a)
+    assert hfkt(1) == 2
+    # the cache is only scanned if its estimated size exceeds the budget
+    with patch("hope.cache._get_entries") as entries_mock:
+        entries_mock.side_effect = Exception("Cache scanned")
+        assert hfkt(1.) == 2.
+    hope.config.cachebudget = hope.cache_info().size
+    assert hfkt(np.float32(1)) == 2.
+    assert hope.cache_info().size <= hope.config.cachebudget
+
+def test_cache_preamble(prefix):
+    hope.config.keeptemp = True
+    try:
+        assert hope.jit(fkt_cache_a)(1) == 2
+    finally:
+        hope.config.keeptemp = False
+    headers = [name[:-4] for name in os.listdir(prefix) if name.endswith(".h.gch")]
+    assert len(headers) == 1
+    sources = [name for name in os.listdir(prefix) if name.startswith("fkt_cache_a") and name.endswith(".cpp")]
+    with open(os.path.join(prefix, sources[0])) as fp:
+        assert fp.read().startswith('#include "{0}"'.format(headers[0]))
+    hope.cache_clear()
+    assert os.listdir(prefix) == []
+
+def test_cache_incremental(prefix):
+    from hope import _wrapper
+    compiled, compile = [], _wrapper._compile
+    def count(*args):
+        compiled.append(args)
+        return compile(*args)
+    _wrapper._compile = count
+    try:
+        hfkt = hope.jit(fkt_cache_a)
+        assert hfkt(1) == 2
+        # each new signature only compiles its own module
+        before = len(compiled)
+        assert hfkt(1.) == 2.
+        assert hfkt(np.float32(1)) == 2.
+        assert len(compiled) == before + 2
+        # all signatures are loaded from the cache
+        assert hope.jit(fkt_cache_a)(np.float32(1)) == 2.
+        assert len(compiled) == before + 2
+    finally:
+        _wrapper._compile = compile
+
+def test_cache_index(prefix):
+    hope.config.index = "states.index"
+    try:
+        hfkt = hope.jit(fkt_cache_a)
+        assert hfkt(1) == 2
+        assert hfkt(1.) == 2.
+        assert [name for name in os.listdir(prefix) if name.endswith(".pck")] == []
+        names = list(cache.read_index(os.path.join(prefix, "states.index")).keys())
+        assert len(names) == 1
+        # the states are read from the index in a new process
+        cache._indices.clear()
+        assert cache.load_state(names[0])["signatures"] == [["int"], ["float"]]
+        # appending to the index keeps the last state of each function
+        hope.jit(fkt_cache_b)(1)
+        with open(os.path.join(prefix, "states.index"), "ab") as fp:
+            fp.write(b"incomplete")
+        assert len(cache.read_index(os.path.join(prefix, "states.index"))) == 2
+        for name in os.listdir(prefix):
+            if name.startswith("fkt_cache_b") and name.endswith(".so"):
+                os.remove(os.path.join(prefix, name))
+        cache.prune(None)
+        assert len(cache.read_index(os.path.join(prefix, "states.index"))) == 1
+        # the index is never evicted
+        cache.prune(0)
+        assert os.path.exists(os.path.join(prefix, "states.index"))
+        hope.cache_clear()
+        assert not os.path.exists(os.path.join(prefix, "states.index"))
+    finally:
+        hope.config.index = None
+
+def fkt_cache_concurrent(a):
+    return a * 2 + 1
+
+def compile_concurrent(_):
+    from hope import _wrapper
+    compiled, compile = [], _wrapper._compile
+    def count(*args):
+        compiled.append(args)
+        return compile(*args)
+    _wrapper._compile = count
+    return hope.jit(fkt_cache_concurrent)(3), len(compiled)
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_cache_concurrent(prefix):
+    pool = multiprocessing.get_context("fork").Pool(4) if hasattr(multiprocessing, "get_context") else multiprocessing.Pool(4)
+    try:
+        results = pool.map(compile_concurrent, range(4))
+    finally:
+        pool.close()
+        pool.join()
+    assert [result for result, _ in results] == [7] * 4
+    assert sum([compiled for _, compiled in results]) == 2
+    assert hope.cache_info().modules == 2
+    assert [name for name in os.listdir(prefix) if not os.path.splitext(name)[1] in [".so", ".pck", ".lock", ".h", ".gch", ".json"]] == []
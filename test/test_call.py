@@ -6,8 +6,10 @@ Test calls for `hope` module.
 from __future__ import print_function, division, absolute_import, unicode_literals
 
 import hope
+import array
 import itertools
 import pytest
+import numpy as np
 
 from test.utilities import random, check, make_test, JENKINS, min_dtypes, dtypes, shapes, setup_module, setup_method, teardown_module
 
@@ -109,6 +111,42 @@ def test_fkt_call_scalar_jit_multi_2(dtype):
     c = hfkt(a)
     assert check(c, a + 1)
 
+def fkt_call_multi_signature(a):
+    return a + 1
+def test_call_multi_signature():
+    hfkt = hope.jit(fkt_call_multi_signature)
+    args = [random(dtype, shape)[0] for dtype, shape in itertools.product(min_dtypes, shapes)] + [1, 1.]
+    for _ in range(2):
+        for a in args:
+            assert check(hfkt(a), a + 1)
+
+def fkt_call_array_subclass(a, b):
+    b[:] = a + 1
+def test_call_array_subclass(tmpdir):
+    hfkt = hope.jit(fkt_call_array_subclass)
+    a = np.memmap(str(tmpdir.join("a.dat")), dtype=np.float64, mode="w+", shape=(10,))
+    a[:] = np.arange(10)
+    b = np.memmap(str(tmpdir.join("b.dat")), dtype=np.float64, mode="w+", shape=(10,))
+    for _ in range(2):
+        hfkt(a, b)
+        assert check(np.asarray(b), np.arange(10) + 1.)
+
+def test_call_buffer():
+    hfkt = hope.jit(fkt_call_array_subclass)
+    a, b = array.array("d", range(10)), array.array("d", [0] * 10)
+    for _ in range(2):
+        hfkt(a, memoryview(b))
+        assert check(np.asarray(b), np.arange(10) + 1.)
+
+def test_call_readonly_buffer():
+    hfkt = hope.jit(fkt_call_array_subclass)
+    a, b, data = np.arange(10, dtype=np.uint8), np.zeros(10, dtype=np.uint8), bytes(bytearray(10))
+    for _ in range(2):
+        hfkt(a, memoryview(data))
+        assert data == bytes(bytearray(10))
+        hfkt(memoryview(bytes(bytearray(range(10)))), b)
+        assert check(b, a + 1)
+
 def fkt_recursion_callback(n):
     if n < 2:
         return n
@@ -10,11 +10,20 @@ import itertools
 import pytest
 import copy
 
-from test.utilities import random, check, make_test, dtypes, shapes
+from test.utilities import random, check, make_test, dtypes, min_dtypes, shapes
 
 import hope
 from hope.exceptions import UnsupportedFeatureException
 
+def test_func_hope_exp():
+    def fkt(x, y):
+        y[:] = hope.exp(x)
+    hfkt = hope.jit(fkt)
+    x = np.linspace(-5, 5, 100)
+    yo, yh = np.zeros_like(x), np.zeros_like(x)
+    fkt(x, yo), hfkt(x, yh)
+    assert np.allclose(yo, yh, rtol=1e-3)
+
 # TODO: fix for np.float32
 @pytest.mark.parametrize("dtype", [np.float64, float])
 def test_func_interp(dtype):
@@ -245,6 +254,16 @@ def test_func_sum_in_if(dtype, shape):
     co, ch = fkt(ao), hfkt(ah)
     assert check(co, ch)
 
+@pytest.mark.parametrize("dtype", min_dtypes)
+def test_func_min_max(dtype):
+    def fkt(a, b):
+        return min(a, b) + max(a, b)
+    hfkt = hope.jit(fkt)
+    (ao, ah), (bo, bh) = random(dtype, []), random(dtype, [])
+    ao, ah, bo, bh = ao / 2, ah / 2, bo / 2, bh / 2
+    co, ch = fkt(ao, bo), hfkt(ah, bh)
+    assert check(co, ch)
+
 def test_create_empty_array():
     def fkt(shape):
         return np.empty(shape)
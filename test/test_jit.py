@@ -6,9 +6,16 @@ Created on Sep 26, 2014
 author: jakeret
 '''
 from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import pickle
+import inspect
+import hashlib
 import pytest
+import multiprocessing
+from mock import patch
 from hope import _wrapper
 import hope
+import hope._cache as cache
 from hope.jit import _check_state, jit
 
 def dummy():
@@ -17,6 +24,28 @@ def dummy():
 def dummy_called():
     pass
 
+@jit
+def jit_rebound(a):
+    return a + 1
+
+class JitRebound(object):
+    @jit
+    def method(self, a):
+        return a + 1
+
+@jit
+def jit_pickled(a):
+    return a + 2
+
+def pickled(a):
+    return a + 3
+
+def pickled_callback(a):
+    return a + 5
+
+def runtime_options(a):
+    return a + 4
+
 @pytest.mark.infrastructure
 class TestJit(object):
     
@@ -26,7 +55,7 @@ class TestJit(object):
         for name in _wrapper.get_config_attrs():
             state[name] = getattr(hope.config, name)
             
-        state["filename"] = "filename"
+        state["modules"] = [["filename", 0]]
         return state
     
     def test_inconsistent_config(self):
@@ -104,3 +133,87 @@ class TestJit(object):
         @jit
         def func_with_vanilla_args(a, b):
             pass
+
+    def test_fkt_hash_cache(self, tmpdir):
+        prefix, hope.config.prefix = hope.config.prefix, str(tmpdir)
+        try:
+            _wrapper._fkt_hashes.clear()
+            source_hash = hashlib.sha224(inspect.getsource(dummy_called).encode('utf-8')).hexdigest()
+            assert _wrapper.get_fkt_hash(dummy_called) == source_hash
+            _wrapper._write_hash_indices()
+            assert len([name for name in os.listdir(str(tmpdir)) if name.startswith("sources_")]) == 1
+            _wrapper._fkt_hashes.clear()
+            with patch("inspect.getsource") as getsource_mock:
+                getsource_mock.side_effect = Exception("Source parsed again")
+                assert _wrapper.get_fkt_hash(dummy_called) == source_hash
+                with pytest.raises(Exception):
+                    _wrapper.get_fkt_hash(dummy)
+        finally:
+            hope.config.prefix = prefix
+            _wrapper._fkt_hashes.clear()
+
+    def test_rebind(self):
+        assert jit_rebound(1) == 2
+        assert inspect.isbuiltin(globals()["jit_rebound"])
+        assert JitRebound().method(1) == 2
+        assert not inspect.isfunction(vars(JitRebound)["method"])
+
+    def test_pickle(self):
+        assert jit_pickled(1) == 3
+        fkt = globals()["jit_pickled"]
+        assert pickle.loads(pickle.dumps(fkt)) is fkt
+        assert jit(pickled)(1) == 4
+        hfkt = jit(pickled)
+        assert inspect.isbuiltin(hfkt)
+        with patch("hope._wrapper._compile") as compile_mock:
+            compile_mock.side_effect = Exception("Function compiled again")
+            assert pickle.loads(pickle.dumps(hfkt))(1) == 4
+            pool = multiprocessing.Pool(1)
+            try:
+                assert pool.map(fkt, [1, 2]) == [3, 4]
+                assert pool.map(hfkt, [1, 2]) == [4, 5]
+            finally:
+                pool.close()
+                pool.join()
+
+    def test_pickle_callback(self, tmpdir):
+        prefix, readonlyprefixes = hope.config.prefix, hope.config.readonlyprefixes
+        hope.config.prefix, hope.config.readonlyprefixes = str(tmpdir), [prefix]
+        try:
+            hfkt = jit(pickled_callback)
+            assert isinstance(hfkt, _wrapper.Callback)
+            # the callback is reduced to hope._cache._resolve, which works with the protocols of all python versions
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                assert pickle.loads(pickle.dumps(hfkt, protocol)) is hfkt
+            assert hfkt(1) == 6
+            assert pickle.loads(pickle.dumps(hfkt)) is hfkt
+            with patch("hope._wrapper._compile") as compile_mock:
+                compile_mock.side_effect = Exception("Function compiled again")
+                # another process looks up the python function and loads the compiled function
+                pickled_hfkt = pickle.dumps(hfkt, 2)
+                with patch.dict(cache._callbacks, clear=True):
+                    restored = pickle.loads(pickled_hfkt)
+                assert inspect.isbuiltin(restored)
+                assert restored(1) == 6
+                pool = multiprocessing.Pool(1)
+                try:
+                    assert pool.map(hfkt, [1, 2]) == [6, 7]
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            hope.config.prefix, hope.config.readonlyprefixes = prefix, readonlyprefixes
+
+    def test_runtime_options(self):
+        assert jit(runtime_options)(1) == 5
+        options = hope.config.background, hope.config.tiered, hope.config.parallelthreshold, hope.config.streamchunk
+        hope.config.background, hope.config.tiered, hope.config.parallelthreshold, hope.config.streamchunk = True, True, 0, 10
+        try:
+            # the options do not change the modules, so the state is loaded
+            with patch("hope._wrapper._compile") as compile_mock:
+                compile_mock.side_effect = Exception("Function compiled again")
+                hfkt = jit(runtime_options)
+                assert inspect.isbuiltin(hfkt)
+                assert hfkt(1) == 5
+        finally:
+            hope.config.background, hope.config.tiered, hope.config.parallelthreshold, hope.config.streamchunk = options
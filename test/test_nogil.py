@@ -0,0 +1,61 @@
+# Copyright (C) 2014 ETH Zurich, Institute for Astronomy
+
+"""
+Test functions running without the GIL for `hope` module.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import hope
+import itertools
+import threading
+import pytest
+import numpy as np
+
+from test.utilities import random, check, min_dtypes, shapes, setup_module, setup_method, teardown_module
+
+@pytest.mark.parametrize("dtype,shape", itertools.product(min_dtypes, shapes[1:]))
+def test_nogil_decorator(dtype, shape):
+    @hope.jit(nogil=True)
+    def fkt(a, b, c):
+        c[:] = a + b
+    (ao, ah), (bo, bh), (co, ch) = random(dtype, shape), random(dtype, shape), random(dtype, shape)
+    ao, ah, bo, bh = (ao / 2).astype(dtype), (ah / 2).astype(dtype), (bo / 2).astype(dtype), (bh / 2).astype(dtype)
+    co[:] = ao + bo
+    fkt(ah, bh, ch)
+    assert check(co, ch)
+    fkt(ah, bh, ch)
+    assert check(co, ch)
+
+def test_nogil_config():
+    def fkt(a):
+        return a + 1
+    hope.config.nogil = True
+    try:
+        hfkt = hope.jit(fkt)
+        assert hfkt(1) == 2
+        assert hfkt(1.) == 2.
+    finally:
+        hope.config.nogil = False
+
+def test_nogil_allocate():
+    def fkt(n):
+        return np.empty(n)
+    hfkt = hope.jit(fkt, nogil=True)
+    assert fkt(5).size == hfkt(5).size
+    assert fkt(5).size == hfkt(5).size
+
+def test_nogil_threads():
+    @hope.jit(nogil=True)
+    def fkt(a, b, n):
+        for i in range(n):
+            b[i] = a[i] * a[i]
+    a = np.arange(1000, dtype=np.float64)
+    fkt(a, np.empty_like(a), a.size)
+    results = [np.empty_like(a) for _ in range(8)]
+    threads = [threading.Thread(target=fkt, args=(a, result, a.size)) for result in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for result in results:
+        assert check(result, a * a)
@@ -6,6 +6,8 @@ Test functions for `hope` module.
 from __future__ import print_function, division, absolute_import, unicode_literals
 
 import hope
+import sys
+import inspect
 import numpy as np
 
 from test.utilities import check,setup_module,setup_method,teardown_module
@@ -71,6 +73,13 @@ def test_cls_4():
     inst = Cls()
     assert check(inst.fkt_4(), inst.obj.i)
 
+def test_cls_native_method():
+    inst = Cls()
+    assert check(inst.fkt_4(), inst.obj.i)
+    if sys.version_info[0] > 2:
+        assert not inspect.isfunction(vars(Cls)["fkt_4"])
+    assert check(inst.fkt_4(), inst.obj.i)
+
 def test_member_reference_array():
     class Test(object):
         def __init__(self, n=10):
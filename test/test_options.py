@@ -8,12 +8,16 @@ author: jakeret
 
 from __future__ import print_function, division, absolute_import, unicode_literals
 
+import os
+import sys
+import subprocess
 from operator import eq
 from mock import patch
 from mock import MagicMock
 
 from hope.options import get_cxxflags
 from hope import options
+from hope import config
 import pytest
 from hope.exceptions import UnsupportedCompilerException
 
@@ -137,6 +141,30 @@ class TestOptions(object):
                     
                     assert map(eq, flags, options.CXX_FLAGS[compiler])
 
+    def test_get_default_cxxflags(self, tmpdir):
+        prefix, config.prefix = config.prefix, str(tmpdir)
+        cc = tmpdir.join("cc")
+        cc.write("")
+        try:
+            with patch.dict(os.environ, {"CC": str(cc)}):
+                with patch("hope.options.get_cxxflags") as get_mock:
+                    get_mock.return_value = ["-flag"]
+                    assert options.get_default_cxxflags() == ["-flag"]
+                    options._default_cxxflags.clear()
+                    get_mock.side_effect = Exception("Compiler detected again")
+                    assert options.get_default_cxxflags() == ["-flag"]
+                    options._default_cxxflags.clear()
+                    os.utime(str(cc), (0, 0))
+                    get_mock.side_effect, get_mock.return_value = None, ["-other"]
+                    assert options.get_default_cxxflags() == ["-other"]
+        finally:
+            config.prefix = prefix
+            options._default_cxxflags.clear()
+
+    def test_import_lazy(self):
+        code = "import sys, hope; from hope import options; sys.exit(hope.config.cxxflags is not None or len(options._default_cxxflags) > 0)"
+        assert subprocess.call([sys.executable, "-c", code]) == 0
+
 if __name__ == '__main__':
     test = TestOptions()
     test.test_get_cxxflags_Darwin()
@@ -0,0 +1,121 @@
+# Copyright (C) 2014 ETH Zurich, Institute for Astronomy
+
+"""
+Test parallel loops for `hope` module.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import re
+import hope
+import itertools
+import pytest
+import numpy as np
+
+from hope import _wrapper
+from hope._transformer import ASTTransformer
+from hope._generator import generate
+from test.utilities import random, check, min_dtypes, setup_module, setup_method, teardown_module
+
+@pytest.fixture
+def parallel(request):
+    parallel, parallelthreshold = hope.config.parallel, hope.config.parallelthreshold
+    hope.config.parallel, hope.config.parallelthreshold = True, 0
+    def fin():
+        hope.config.parallel, hope.config.parallelthreshold = parallel, parallelthreshold
+    request.addfinalizer(fin)
+
+@pytest.mark.parametrize("dtype,shape", itertools.product(min_dtypes, [[1000], [30, 13]]))
+def test_parallel_block(parallel, dtype, shape):
+    def fkt(a, b, c):
+        c[:] = a + b
+    hfkt = hope.jit(fkt)
+    (ao, ah), (bo, bh), (co, ch) = random(dtype, shape), random(dtype, shape), random(dtype, shape)
+    ao, ah, bo, bh = (ao / 2).astype(dtype), (ah / 2).astype(dtype), (bo / 2).astype(dtype), (bh / 2).astype(dtype)
+    fkt(ao, bo, co), hfkt(ah, bh, ch)
+    assert check(co, ch)
+    fkt(ao, bo, co), hfkt(ah, bh, ch)
+    assert check(co, ch)
+
+@pytest.mark.parametrize("shape", [[1000], [30, 13]])
+def test_parallel_sum(parallel, shape):
+    def fkt(a):
+        return np.sum(a)
+    hfkt = hope.jit(fkt)
+    a = np.random.random(shape)
+    assert np.allclose(fkt(a), hfkt(a))
+    assert np.allclose(fkt(a), hfkt(a))
+
+@pytest.mark.parametrize("dtype", min_dtypes)
+def test_prange(dtype):
+    def fkt(a, b, n, m):
+        for i in hope.prange(n):
+            for j in range(m):
+                b[i, j] = a[i, j] + 1
+    hfkt = hope.jit(fkt)
+    (ao, ah), (bo, bh) = random(dtype, [30, 13]), random(dtype, [30, 13])
+    ao, ah = (ao / 2).astype(dtype), (ah / 2).astype(dtype)
+    fkt(ao, bo, 30, 13), hfkt(ah, bh, 30, 13)
+    assert check(bo, bh)
+
+def test_prange_reduction():
+    def fkt(a, n):
+        s = 0.
+        p = 1.
+        lower = a[0]
+        upper = a[0]
+        for i in hope.prange(n):
+            s += a[i]
+            p *= 1 + a[i] / 1000
+            lower = min(lower, a[i])
+            upper = max(a[i], upper)
+        return s + p + lower + upper
+    hfkt = hope.jit(fkt)
+    a = np.random.random(1000)
+    assert np.allclose(fkt(a, 1000), hfkt(a, 1000))
+
+def test_prange_invalid():
+    def fkt(a, n):
+        s = 0.
+        for i in hope.prange(n):
+            s = a[i]
+        return s
+    hfkt = hope.jit(fkt)
+    with pytest.raises(hope.exceptions.UnsupportedFeatureException):
+        hfkt(np.random.random(10), 10)
+
+def test_prange_allocate():
+    def fkt(a, b, n):
+        for i in hope.prange(n):
+            c = a[i, :] + 1
+            b[i, 0] = c[0]
+    hfkt = hope.jit(fkt)
+    with pytest.raises(hope.exceptions.UnsupportedFeatureException):
+        hfkt(np.random.random((10, 5)), np.empty((10, 5)), 10)
+
+def fkt_prange_private(a, b, n):
+    for i in hope.prange(n):
+        t = a[i] * 2
+        b[i] = t + 1
+
+def generate_prange_private():
+    wrapper = _wrapper.Wrapper(fkt_prange_private, "parallel")
+    ASTTransformer(wrapper.modtoken).module_visit(fkt_prange_private, (np.empty(10), np.empty(10), 10))
+    return wrapper.modtoken, generate(wrapper.modtoken, "fkt_prange_private_parallel", "hope_runtime")
+
+def test_prange_openmp():
+    modtoken, code = generate_prange_private()
+    assert "#pragma omp parallel for\n" in code
+    assert modtoken.openmp
+    assert "-fopenmp" in _wrapper._get_flags(modtoken.openmp)
+    assert not "-fopenmp" in _wrapper._get_flags()
+
+def test_prange_private():
+    _, code = generate_prange_private()
+    # the scalar is declared in the body of the loop, so each thread has its own
+    loop = code[code.index("#pragma omp parallel for"):]
+    assert re.match(r"#pragma omp parallel for\n\s*for \(.*\) \{\s*npy_double ct = ", loop)
+    assert not re.search(r"npy_double ct\b", code[:code.index("#pragma omp parallel for")])
+    hfkt = hope.jit(fkt_prange_private)
+    a, b = np.random.random(100000), np.empty(100000)
+    hfkt(a, b, 100000)
+    assert check(b, a * 2 + 1)
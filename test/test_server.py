@@ -0,0 +1,61 @@
+# Copyright (C) 2014 ETH Zurich, Institute for Astronomy
+
+"""
+Test the compile server for `hope` module.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import os
+import sys
+import hope
+import pytest
+import warnings
+import subprocess
+import numpy as np
+
+from hope import server
+from test.utilities import setup_module, setup_method, teardown_module
+
+@pytest.fixture
+def prefix(request, tmpdir):
+    prefix, manifest, socket = hope.config.prefix, hope.config.manifest, hope.config.server
+    hope.config.prefix, hope.config.manifest = str(tmpdir.join("prefix")), None
+    hope.config.server = str(tmpdir.join("hope.sock"))
+    def fin():
+        hope.config.prefix, hope.config.manifest, hope.config.server = prefix, manifest, socket
+    request.addfinalizer(fin)
+    return hope.config.prefix
+
+@pytest.fixture
+def serverprefix(request, prefix, tmpdir):
+    process = subprocess.Popen([sys.executable, "-m", "hope.server", "--socket", hope.config.server, "--prefix", str(tmpdir.join("server"))], stdout=subprocess.PIPE)
+    def fin():
+        process.terminate()
+        process.wait()
+    request.addfinalizer(fin)
+    process.stdout.readline()
+    return str(tmpdir.join("server"))
+
+def fkt_server(a, b):
+    b[:] = a + 1
+
+def test_server(serverprefix):
+    a, b = np.arange(10, dtype=np.float64), np.zeros(10)
+    hope.jit(fkt_server)(a, b)
+    assert np.all(b == a + 1)
+    assert len([name for name in os.listdir(serverprefix) if name.startswith("fkt_server_") and name.endswith(".so")]) == 1
+    assert len([name for name in os.listdir(hope.config.prefix) if name.startswith("fkt_server_") and name.endswith(".so")]) == 1
+
+def test_server_rejected(serverprefix):
+    with pytest.raises(IOError):
+        server.submit("", "../fkt_server")
+    with pytest.raises(Exception):
+        server.submit("invalid c++", "fkt_server")
+
+def test_server_unreachable(prefix):
+    a, b = np.arange(10, dtype=np.float64), np.zeros(10)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        hope.jit(fkt_server)(a, b)
+    assert np.all(b == a + 1)
+    assert any(["compiling fkt_server locally" in str(warning.message) for warning in w])
@@ -111,4 +111,31 @@ def test_merged_slice_2(dtype):
     fkt(ao, co), hfkt(ah, ch)
     assert check(co, ch)
     fkt(ao, co), hfkt(ah, ch)
-    assert check(co, ch)
\ No newline at end of file
+    assert check(co, ch)
+
+@pytest.mark.parametrize("dtype", dtypes)
+def test_strided(dtype):
+    def fkt(a, b, c):
+        c[:] = a + b
+        c[1] = a[2] + b[0]
+    hfkt = hope.jit(fkt)
+    (ao, ah), (bo, bh), (co, ch) = random(dtype, [10, 6]), random(dtype, [6, 10]), random(dtype, [20, 10])
+    ao, ah, bo, bh = (ao / 2.).astype(dtype), (ah / 2.).astype(dtype), (bo / 2.).astype(dtype), (bh / 2.).astype(dtype)
+    fkt(ao[:, 1], bo.T[:, 2], co[::2, 3]), hfkt(ah[:, 1], bh.T[:, 2], ch[::2, 3])
+    assert check(co, ch)
+    fkt(ao[:, 1], bo.T[:, 2], co[::2, 3]), hfkt(ah[:, 1], bh.T[:, 2], ch[::2, 3])
+    assert check(co, ch)
+
+@pytest.mark.parametrize("dtype", dtypes)
+def test_strided_2d(dtype):
+    def fkt(a, c):
+        c[1:, :] = a[1:, :]
+        c[0, 2] = a[1, 0]
+    hfkt = hope.jit(fkt)
+    (ao, ah), (co, ch), (do, dh) = random(dtype, [6, 5]), random(dtype, [5, 6]), random(dtype, [6, 5])
+    fkt(ao.T, co), hfkt(ah.T, ch)
+    assert check(co, ch)
+    fkt(ao.T, co), hfkt(ah.T, ch)
+    assert check(co, ch)
+    fkt(do, co.T), hfkt(dh, ch.T)
+    assert check(co, ch)
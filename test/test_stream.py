@@ -0,0 +1,51 @@
+# Copyright (C) 2014 ETH Zurich, Institute for Astronomy
+
+"""
+Test chunked streaming for `hope` module.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import hope
+import pytest
+import numpy as np
+
+from test.utilities import check, setup_module, setup_method, teardown_module
+
+def fkt_stream(a, b, c, f):
+    c[:] = a * f + b
+
+@pytest.mark.parametrize("chunk", [1, 7, 100, 1000])
+def test_stream(tmpdir, chunk):
+    hfkt = hope.jit(fkt_stream, nogil=True)
+    a = np.memmap(str(tmpdir.join("a.dat")), dtype=np.float64, mode="w+", shape=(100,))
+    a[:] = np.arange(100)
+    a.flush()
+    a = np.memmap(str(tmpdir.join("a.dat")), dtype=np.float64, mode="r", shape=(100,))
+    b = np.random.random(100)
+    c = np.memmap(str(tmpdir.join("c.dat")), dtype=np.float64, mode="w+", shape=(100,))
+    hope.stream(hfkt, a, b, c, 2., chunk=chunk)
+    assert check(np.asarray(c), np.arange(100) * 2. + b)
+
+def test_stream_writeable(tmpdir):
+    hfkt = hope.jit(fkt_stream, nogil=True)
+    a = np.memmap(str(tmpdir.join("a.dat")), dtype=np.float64, mode="w+", shape=(100, 2))
+    a[:] = np.arange(200).reshape(100, 2)
+    b = np.random.random((100, 2))
+    hope.stream(hfkt, a, b, a, 2., chunk=30)
+    assert check(np.asarray(a), np.arange(200).reshape(100, 2) * 2. + b)
+
+def test_stream_2d():
+    hfkt = hope.jit(fkt_stream)
+    a, b, c = np.random.random((20, 3)), np.random.random((20, 3)), np.empty((20, 3))
+    a.flags.writeable = False
+    hope.stream(hfkt, a, b, c, 3., chunk=6)
+    assert check(c, a * 3. + b)
+
+def test_stream_invalid():
+    with pytest.raises(Exception):
+        hope.stream(fkt_stream, np.empty(10), np.empty(10), np.empty(9), 1.)
+    with pytest.raises(TypeError):
+        hope.stream(fkt_stream, np.empty(10), np.empty(10), np.empty(10), 1., chunks=2)
+    for chunk in [0, -1]:
+        with pytest.raises(ValueError):
+            hope.stream(fkt_stream, np.empty(10), np.empty(10), np.empty(10), 1., chunk=chunk)
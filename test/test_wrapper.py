@@ -7,14 +7,24 @@ author: jakeret
 '''
 from __future__ import print_function, division, absolute_import, unicode_literals
 from hope import _wrapper
+from hope import config
 import os
+import sys
+import pickle
 import pytest
+import warnings
 from py._path.local import LocalPath
 from hope._ast import FunctionDef
 
 def dummy_fkt():
     return 0
 
+def background_fkt(a):
+    return a + 1
+
+def tiered_fkt(a):
+    return a + 1
+
 @pytest.mark.infrastructure
 class TestWrapper(object):
     
@@ -54,7 +64,101 @@ class TestWrapper(object):
         
         wrapper = _wrapper.Wrapper(dummy_fkt, "0")
         wrapper.modtoken.functions[localfilename] = [FunctionDef(localfilename, [])]
-        wrapper._store_state(tmp_path, localfilename)
+        wrapper._store_state(tmp_path)
         
         assert os.path.exists(os.path.join(tmp_path, "{0}.pck".format(wrapper.filename)))
+
+    def test_background(self):
+        config.background = True
+        try:
+            wrapper = _wrapper.Wrapper(background_fkt, "0")
+            assert wrapper.callback(1) == 2
+            thread = wrapper._thread
+            if thread is not None:
+                thread.join()
+            assert wrapper.cache is not None
+            assert wrapper.callback(1) == 2
+        finally:
+            config.background = False
         
+
+    def test_background_failed(self, tmpdir):
+        prefix, config.prefix, config.background = config.prefix, str(tmpdir), True
+        sys.path.append(str(tmpdir))
+        build = _wrapper.Wrapper._build
+        def int_build(self, args, tiered=None):
+            if isinstance(args[0], int):
+                raise Exception("Compilation failed")
+            return build(self, args, tiered)
+        _wrapper.Wrapper._build = int_build
+        try:
+            wrapper = _wrapper.Wrapper(background_fkt, "1")
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter("always")
+                assert wrapper.callback(1) == 2
+                thread = wrapper._thread
+                if thread is not None:
+                    thread.join()
+            assert any(["Background compilation of background_fkt failed" in str(warning.message) for warning in w])
+            assert wrapper.cache is None
+            # other signatures are still compiled in the background
+            assert wrapper.callback(1.) == 2.
+            thread = wrapper._thread
+            if thread is not None:
+                thread.join()
+            assert wrapper.cache is not None
+            # the failed signature runs the python function without compiling it again
+            assert wrapper.callback(1) == 2
+            assert wrapper._thread is None
+            assert len(wrapper._failed) == 1
+        finally:
+            _wrapper.Wrapper._build = build
+            config.prefix, config.background = prefix, False
+            sys.path.remove(str(tmpdir))
+
+    def test_tiered(self, tmpdir):
+        prefix, config.prefix, config.tiered = config.prefix, str(tmpdir), True
+        sys.path.append(str(tmpdir))
+        try:
+            wrapper = _wrapper.Wrapper(tiered_fkt, "0")
+            assert wrapper.callback(1) == 2
+            quick = wrapper.modules[0][0]
+            thread = wrapper._upgrader
+            if thread is not None:
+                thread.join()
+            assert len(wrapper._pending) == 0
+            assert wrapper.modules[0][0] != quick
+            assert os.path.exists(os.path.join(str(tmpdir), "{0}.so".format(quick)))
+            assert wrapper.callback(1) == 2
+            with open(os.path.join(str(tmpdir), "{0}.pck".format(wrapper.filename)), "rb") as fp:
+                assert pickle.load(fp)["modules"] == wrapper.modules
+        finally:
+            config.prefix, config.tiered = prefix, False
+            sys.path.remove(str(tmpdir))
+
+    def test_tiered_failed(self, tmpdir):
+        prefix, config.prefix, config.tiered = config.prefix, str(tmpdir), True
+        sys.path.append(str(tmpdir))
+        compile = _wrapper._compile
+        def quick_compile(target, localfilename, fkt_name, openmp=False, quick=False):
+            if fkt_name == tiered_fkt.__name__ and not quick:
+                raise Exception("Optimized compilation failed")
+            return compile(target, localfilename, fkt_name, openmp, quick)
+        _wrapper._compile = quick_compile
+        try:
+            wrapper = _wrapper.Wrapper(tiered_fkt, "1")
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter("always")
+                assert wrapper.callback(1) == 2
+                quick = wrapper.modules[0][0]
+                thread = wrapper._upgrader
+                if thread is not None:
+                    thread.join()
+            assert any(["keeping the quick build" in str(warning.message) for warning in w])
+            assert wrapper.modules[0][0] == quick
+            assert wrapper.callback(1) == 2
+            assert not os.path.exists(os.path.join(str(tmpdir), "{0}.pck".format(wrapper.filename)))
+        finally:
+            _wrapper._compile = compile
+            config.prefix, config.tiered = prefix, False
+            sys.path.remove(str(tmpdir))